@@ -1,15 +1,23 @@
+import asyncio
+import logging
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from pathlib import Path
 from pydantic import BaseModel
 from typing import Dict, Any
 from ..handlers import handle_webhook
-from ..services import file_service
+from ..services import file_service, preview_service
 from ..services.quick_memoir_service import quick_memoir_service
-from ..services.openai_service import openai_service
-from ..services.line_service import send_push_message
+from ..services.photo_memoir_service import photo_memoir_service
+from ..services.memoir_service import memoir_service
+from ..services.llm_gateway import llm_gateway
+from ..services.line_service import send_push_message, text_message_router
+from ..services.event_dispatcher import event_dispatcher
+from ..services.task_executor import task_executor
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 # リクエストモデル
@@ -25,106 +33,126 @@ async def webhook(request: Request):
     """LINE Webhook エンドポイント"""
     return await handle_webhook(request)
 
-@router.get("/media/{media_type}/{file_id}")
-async def get_media_file(media_type: str, file_id: str):
-    """メディアファイル（画像・動画・音声）の配信"""
+@router.get('/api/webhook/stats')
+async def get_webhook_stats():
+    """Webhookキューとワーカーの状態（キューの深さ・イベントの待ち時間など）"""
+    return event_dispatcher.get_stats()
+
+@router.get('/api/tasks/stats')
+async def get_task_stats():
+    """バックグラウンド処理（ストーリー生成・PDF生成）の状態（実行中・待機中の件数、待ち時間など）"""
+    return task_executor.get_stats()
+
+@router.get('/api/llm/stats')
+async def get_llm_stats():
+    """LLMゲートウェイの同時実行数・リトライ・タイムアウトの状況"""
+    return llm_gateway.get_stats()
+
+@router.get('/api/router/stats')
+async def get_router_stats():
+    """テキストメッセージのルートごとの処理件数と処理時間"""
+    return text_message_router.get_stats()
+
+@router.get('/api/sessions/stats')
+async def get_session_stats():
+    """対話セッションの保存先の状態（件数・期限切れ・上限による削除など）"""
+    return {
+        "memoir": memoir_service.sessions.get_stats(),
+        "photo": photo_memoir_service.sessions.get_stats(),
+        "quick": quick_memoir_service.sessions.get_stats()
+    }
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match ヘッダーがETagに一致するか（弱い比較）"""
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(value.replace("W/", "", 1) == etag for value in candidates)
+
+def _stored_file_response(request: Request, file_id: str) -> Response:
+    """保存済みファイルを返す（メタデータは索引から取得し、ディレクトリは走査しない）
+    
+    file_id のファイルは保存後に変わらないため、内容のSHA-256（ない場合はfile_id）を強いETagにし、
+    長期間の immutable キャッシュを許可する。If-None-Match が一致すれば304を返す。
+    Range リクエスト（部分取得）は FileResponse が処理する。
+    """
+    file_info = file_service.get_file_by_id(file_id)
+    if not file_info:
+        logger.debug(f"ファイル情報が見つかりません: {file_id}")
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    etag = f'"{file_info.get("sha256") or file_info["file_id"]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.FILE_CACHE_MAX_AGE}, immutable"
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    file_path = file_service.resolve_path(file_info)
+    if file_path is None:
+        logger.warning(f"ファイルが存在しません: {file_info['file_path']}")
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    return FileResponse(
+        path=str(file_path),
+        media_type=file_info.get('content_type') or 'application/octet-stream',
+        headers=headers
+    )
+
+@router.api_route("/media/preview/{file_id}", methods=["GET", "HEAD"])
+async def get_preview_image(request: Request, file_id: str):
+    """プレビュー画像（画像のサムネイル・PDFの1ページ目）の配信（初回アクセス時に生成）"""
     try:
-        print(f"🔍 メディアファイル配信リクエスト: {media_type}/{file_id}")
-        
-        # ファイルを検索
         file_info = file_service.get_file_by_id(file_id)
-        if not file_info:
-            print(f"❌ ファイル情報が見つかりません: {file_id}")
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        print(f"📋 ファイル情報: {file_info}")
+        if not file_info or not preview_service.supports(file_info):
+            raise HTTPException(status_code=404, detail="Preview not found")
         
-        # ファイルパスを解決
-        file_path_str = file_info['file_path']
-        file_path = Path(file_path_str)
-        
-        # 相対パスの場合は現在のディレクトリからの絶対パスに変換
-        if not file_path.is_absolute():
-            current_dir = Path.cwd()
-            file_path = current_dir / file_path
-            print(f"📁 絶対パスに変換: {file_path}")
+        etag = f'"{preview_service.cache_key(file_info)}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={settings.FILE_CACHE_MAX_AGE}, immutable"
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
         
-        if not file_path.exists():
-            print(f"❌ ファイルが存在しません: {file_path}")
+        source_path = file_service.resolve_path(file_info)
+        if source_path is None:
             raise HTTPException(status_code=404, detail="File not found")
         
-        print(f"✅ ファイル存在確認: {file_path}")
-        
-        # Content-Typeを設定
-        content_type = file_info.get('content_type', 'application/octet-stream')
-        
-        print(f"📤 メディアファイル配信開始: {file_path}")
-        
-        # シンプルにファイルを返す
-        return FileResponse(
-            path=str(file_path),
-            media_type=content_type
-        )
+        preview_path = await asyncio.to_thread(preview_service.get_preview, file_info, source_path)
+        if preview_path is None:
+            raise HTTPException(status_code=404, detail="Preview not found")
         
+        return FileResponse(path=str(preview_path), media_type="image/jpeg", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"プレビュー画像配信エラー: {file_id}, {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.api_route("/media/{media_type}/{file_id}", methods=["GET", "HEAD"])
+async def get_media_file(request: Request, media_type: str, file_id: str):
+    """メディアファイル（画像・動画・音声）の配信"""
+    try:
+        return _stored_file_response(request, file_id)
     except HTTPException:
         # HTTPExceptionはそのまま再送出
         raise
     except Exception as e:
-        print(f'❌ Error serving media file: {e}')
-        print(f'❌ Exception type: {type(e)}')
-        import traceback
-        print(f'❌ Traceback: {traceback.format_exc()}')
+        logger.exception(f"メディアファイル配信エラー: {media_type}/{file_id}, {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.get("/files/{file_id}")
-async def get_file(file_id: str):
+@router.api_route("/files/{file_id}", methods=["GET", "HEAD"])
+async def get_file(request: Request, file_id: str):
     """ファイルの配信（PDF、ZIP、テキストなど）"""
     try:
-        print(f"🔍 ファイル配信リクエスト: {file_id}")
-        
-        # ファイルを検索
-        file_info = file_service.get_file_by_id(file_id)
-        if not file_info:
-            print(f"❌ ファイル情報が見つかりません: {file_id}")
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        print(f"📋 ファイル情報: {file_info}")
-        
-        # ファイルパスを解決
-        file_path_str = file_info['file_path']
-        file_path = Path(file_path_str)
-        
-        # 相対パスの場合は現在のディレクトリからの絶対パスに変換
-        if not file_path.is_absolute():
-            current_dir = Path.cwd()
-            file_path = current_dir / file_path
-            print(f"📁 絶対パスに変換: {file_path}")
-        
-        if not file_path.exists():
-            print(f"❌ ファイルが存在しません: {file_path}")
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        print(f"✅ ファイル存在確認: {file_path}")
-        
-        # Content-Typeを設定
-        content_type = file_info.get('content_type', 'application/octet-stream')
-        
-        print(f"📤 ファイル配信開始: {file_path}")
-        
-        # シンプルにファイルを返す
-        return FileResponse(
-            path=str(file_path),
-            media_type=content_type
-        )
-        
+        return _stored_file_response(request, file_id)
     except HTTPException:
         # HTTPExceptionはそのまま再送出
         raise
     except Exception as e:
-        print(f'❌ Error serving file: {e}')
-        print(f'❌ Exception type: {type(e)}')
-        import traceback
-        print(f'❌ Traceback: {traceback.format_exc()}')
+        logger.exception(f"ファイル配信エラー: {file_id}, {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/api/files")
@@ -149,6 +177,8 @@ async def get_file_info(file_id: str):
             raise HTTPException(status_code=404, detail="File not found")
         
         return file_info
+    except HTTPException:
+        raise
     except Exception as e:
         print(f'Error getting file info: {e}')
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -195,12 +225,14 @@ async def save_memoir_data(session_id: str, request: MemoirSaveRequest):
         if not success:
             raise HTTPException(status_code=400, detail="Failed to update data")
         
-        # PDF再生成
+        # PDF再生成（更新後のセッションで生成する）
+        session = quick_memoir_service.get_session(session_id)
         pdf_result = await quick_memoir_service.generate_quick_pdf(session)
         
-        # PDFファイルを保存
-        file_metadata = file_service.save_file(
-            pdf_result["pdf_buffer"],
+        # PDFファイルを保存（ハッシュ計算とファイル移動はスレッドで行う）
+        file_metadata = await asyncio.to_thread(
+            file_service.register_file,
+            pdf_result["path"],
             pdf_result["filename"],
             "application/pdf"
         )
@@ -211,7 +243,7 @@ async def save_memoir_data(session_id: str, request: MemoirSaveRequest):
         
         # LINEにFlex Message（更新完了）を送信
         from app.services.line_service import send_memoir_updated_message
-        send_memoir_updated_message(session.user_id, pdf_url, edit_url)
+        await send_memoir_updated_message(session.user_id, pdf_url, edit_url)
         
         return {
             "success": True,
@@ -233,9 +265,10 @@ async def save_memoir_data(session_id: str, request: MemoirSaveRequest):
 async def generate_memoir_text(request: TextGenerationRequest):
     """LLM文章生成API"""
     try:
-        from ..services.openai_service import generate_memoir_text
+        from ..services.openai_service import agenerate_memoir_text
         
-        generated_text = generate_memoir_text(request.type, request.data)
+        # LLMゲートウェイのイベントループで生成し、このイベントループはブロックしない
+        generated_text = await agenerate_memoir_text(request.type, request.data)
         
         return {
             "success": True,
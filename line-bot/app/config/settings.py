@@ -15,27 +15,122 @@ class Settings:
     CHANNEL_ACCESS_TOKEN: str = os.environ.get('CHANNEL_ACCESS_TOKEN', 'your_channel_access_token')
     CHANNEL_SECRET: str = os.environ.get('CHANNEL_SECRET', 'your_channel_secret')
     
+    # LINE Messaging API クライアント設定（全送信で共有する接続プール）
+    LINE_API_TIMEOUT: float = float(os.environ.get('LINE_API_TIMEOUT', '30'))  # 1リクエストあたり（秒）
+    LINE_API_MAX_CONNECTIONS: int = int(os.environ.get('LINE_API_MAX_CONNECTIONS', '20'))
+    
+    # Webhookイベントを処理するワーカー数と、ワーカーごとのキューの上限
+    WEBHOOK_WORKERS: int = int(os.environ.get('WEBHOOK_WORKERS', '4'))
+    WEBHOOK_QUEUE_SIZE: int = int(os.environ.get('WEBHOOK_QUEUE_SIZE', '100'))
+    
+    # バックグラウンド処理（ストーリー生成・PDF生成）設定
+    BACKGROUND_WORKERS: int = int(os.environ.get('BACKGROUND_WORKERS', '4'))  # 同時に実行する処理数
+    BACKGROUND_QUEUE_SIZE: int = int(os.environ.get('BACKGROUND_QUEUE_SIZE', '100'))  # 待機できる処理数（超えると混雑メッセージを返す）
+    
+    # 対話セッションの保存先（"memory": プロセス内 / "sqlite": SESSION_DB_PATH / "redis": SESSION_REDIS_URL）
+    SESSION_BACKEND: str = os.environ.get('SESSION_BACKEND', 'memory')
+    SESSION_TTL: int = int(os.environ.get('SESSION_TTL', str(7 * 24 * 60 * 60)))  # 最後の操作からの有効期間（秒）
+    SESSION_MAX_ENTRIES: int = int(os.environ.get('SESSION_MAX_ENTRIES', '10000'))  # サービスごとの最大セッション数
+    SESSION_DB_PATH: Path = Path(os.environ.get('SESSION_DB_PATH', 'sessions.db'))
+    SESSION_REDIS_URL: str = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+    
+    # 写真自分史のストーリー先行生成（ストーリーの同時生成数は LLM_PER_USER_CONCURRENCY で制限）
+    PHOTO_DRAFT_PDF_ENABLED: bool = os.environ.get('PHOTO_DRAFT_PDF_ENABLED', 'true').lower() == 'true'  # 全ストーリーが揃ったら下書きPDFを作る
+    PHOTO_DRAFT_DIR: Path = Path(os.environ.get('PHOTO_DRAFT_DIR', 'temp/photo-drafts'))  # 下書きPDFの置き場（uploads の外）
+    
     # OpenAI 設定
     OPENAI_API_KEY: str = os.environ.get('OPENAI_API_KEY', 'your_openai_api_key')
     
+    # LLMゲートウェイ（"openai": OpenAI API / "mock": オフライン用の定型応答）
+    LLM_BACKEND: str = os.environ.get('LLM_BACKEND', 'openai')
+    LLM_TIMEOUT: float = float(os.environ.get('LLM_TIMEOUT', '60'))  # 1回の生成の期限（空き待ち・リトライを含む、秒）
+    LLM_MAX_CONCURRENCY: int = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))  # 全体の同時リクエスト数
+    LLM_PER_USER_CONCURRENCY: int = int(os.environ.get('LLM_PER_USER_CONCURRENCY', '2'))  # ユーザーごとの同時リクエスト数
+    LLM_MAX_CONNECTIONS: int = int(os.environ.get('LLM_MAX_CONNECTIONS', '20'))
+    LLM_MAX_RETRIES: int = int(os.environ.get('LLM_MAX_RETRIES', '3'))  # 429・5xx・接続エラー時
+    LLM_RETRY_BASE_DELAY: float = float(os.environ.get('LLM_RETRY_BASE_DELAY', '0.5'))  # 初回のリトライ待ち（秒、以降は倍々）
+    LLM_RETRY_MAX_DELAY: float = float(os.environ.get('LLM_RETRY_MAX_DELAY', '8'))
+    
     # アプリケーション設定
     BASE_URL: str = os.environ.get('BASE_URL', 'https://your-domain.com')
     
     # auto-designer API設定
     AUTO_DESIGNER_URL: str = os.environ.get('AUTO_DESIGNER_URL', 'http://localhost:3000')
     
+    # vivliostyleサービスの非同期ジョブAPI（/jobs）設定
+    VIVLIOSTYLE_API_URL: str = os.environ.get('VIVLIOSTYLE_API_URL', 'http://localhost:8001')
+    VIVLIOSTYLE_API_TIMEOUT: float = float(os.environ.get('VIVLIOSTYLE_API_TIMEOUT', '30'))  # 1リクエストあたり（秒）
+    VIVLIOSTYLE_JOB_POLL_INTERVAL: float = float(os.environ.get('VIVLIOSTYLE_JOB_POLL_INTERVAL', '1'))
+    VIVLIOSTYLE_JOB_WAIT_TIMEOUT: float = float(os.environ.get('VIVLIOSTYLE_JOB_WAIT_TIMEOUT', '300'))
+    
     # ファイル保存設定
     UPLOADS_DIR: Path = Path("uploads")
     SAMPLES_DIR: Path = Path("samples")
+    # ファイルメタデータの保存先（"sqlite": uploads/metadata.db / "json": uploads/metadata.json）
+    METADATA_BACKEND: str = os.environ.get('METADATA_BACKEND', 'sqlite')
+    # アップロードファイルの配置（"sharded": uploads/ab/cd/{uuid}.ext / "flat": uploads/{uuid}.ext）
+    UPLOAD_LAYOUT: str = os.environ.get('UPLOAD_LAYOUT', 'sharded')
+    # 起動時に旧配置（flat）のファイルをバックグラウンドで sharded に移行する
+    UPLOAD_MIGRATION_ENABLED: bool = os.environ.get('UPLOAD_MIGRATION_ENABLED', 'true').lower() == 'true'
+    UPLOAD_MIGRATION_BATCH_SIZE: int = int(os.environ.get('UPLOAD_MIGRATION_BATCH_SIZE', '200'))
+    UPLOAD_MIGRATION_PAUSE: float = float(os.environ.get('UPLOAD_MIGRATION_PAUSE', '0.5'))  # バッチ間の待ち時間（秒）
+    # 同じ内容のファイルは1つだけ保存し、複数の file_id から参照する（SHA-256で判定）
+    FILE_DEDUP_ENABLED: bool = os.environ.get('FILE_DEDUP_ENABLED', 'true').lower() == 'true'
+    # 存在しないfile_idを覚えておく秒数（別プロセスが登録したファイルは最大この時間だけ見つからない）
+    FILE_NEGATIVE_CACHE_TTL: float = float(os.environ.get('FILE_NEGATIVE_CACHE_TTL', '2'))
+    # /media・/files のブラウザキャッシュ期間（秒）。保存後に内容が変わらないため immutable で返す
+    FILE_CACHE_MAX_AGE: int = int(os.environ.get('FILE_CACHE_MAX_AGE', str(365 * 24 * 60 * 60)))
+    # PDF生成用の一時ディレクトリ（画像をハードリンクで配置できるよう uploads と同じファイルシステムに置く）
+    TEMP_DIR: Path = Path(os.environ.get('TEMP_DIR', 'temp'))
+    
+    # 画像を一時ディレクトリに配置する方法（先頭から順に試し、最後はコピー）
+    IMAGE_STAGING_METHODS: list = [
+        m.strip() for m in os.environ.get('IMAGE_STAGING_METHODS', 'hardlink,reflink,copy').split(',') if m.strip()
+    ]
+    
+    # リモート画像の取得設定
+    IMAGE_CACHE_DIR: Path = Path(os.environ.get('IMAGE_CACHE_DIR', 'cache/images'))
+    IMAGE_CACHE_RETENTION_SECONDS: int = int(os.environ.get('IMAGE_CACHE_RETENTION_SECONDS', str(7 * 24 * 60 * 60)))  # 7日
+    IMAGE_FETCH_TIMEOUT: float = float(os.environ.get('IMAGE_FETCH_TIMEOUT', '15'))  # 1枚あたり（秒）
+    IMAGE_FETCH_CONCURRENCY: int = int(os.environ.get('IMAGE_FETCH_CONCURRENCY', '6'))  # 1回のPDF生成での同時取得数
+    IMAGE_FETCH_MAX_CONNECTIONS: int = int(os.environ.get('IMAGE_FETCH_MAX_CONNECTIONS', '20'))
+    
+    # 画像の縮小・再エンコード設定（print: 300dpiのプログレッシブJPEG / screen: 150dpiのWebP）
+    IMAGE_PIPELINE_ENABLED: bool = os.environ.get('IMAGE_PIPELINE_ENABLED', 'true').lower() == 'true'
+    IMAGE_PROFILE: str = os.environ.get('IMAGE_PROFILE', 'print')
+    IMAGE_PROFILES: dict = {
+        'print': {'dpi': 300, 'quality': 90, 'format': 'JPEG'},
+        'screen': {'dpi': 150, 'quality': 80, 'format': 'WEBP'},
+    }
+    IMAGE_RESIZE_CACHE_DIR: Path = Path(os.environ.get('IMAGE_RESIZE_CACHE_DIR', 'cache/resized'))
+    
+    # LINEのプレビュー画像（サムネイル）設定
+    PREVIEW_CACHE_DIR: Path = Path(os.environ.get('PREVIEW_CACHE_DIR', 'cache/previews'))
+    PREVIEW_CACHE_MAX_BYTES: int = int(os.environ.get('PREVIEW_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+    PREVIEW_SIZE: int = int(os.environ.get('PREVIEW_SIZE', '240'))  # 長辺のピクセル数
+    PREVIEW_QUALITY: int = int(os.environ.get('PREVIEW_QUALITY', '80'))
+    PDF_PREVIEW_COMMAND: str = os.environ.get('PDF_PREVIEW_COMMAND', 'pdftoppm')  # PDFの1ページ目を画像にするコマンド（poppler）
+    
+    # テンプレートの画像枠（幅mm, 高さmm）
+    DEFAULT_IMAGE_SLOT: tuple = (210, 297)  # A4全面
+    TEMPLATE_IMAGE_SLOTS: dict = {
+        'memoir': {'cover': (210, 297), 'timeline': (180, 187)},
+        'photo-memoir': {'page': (190, 200)},
+    }
     
     # サーバー設定
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     
+    def get_image_slot(self, template_name: str, slot: str) -> tuple:
+        """テンプレートの画像枠（幅mm, 高さmm）を取得"""
+        return self.TEMPLATE_IMAGE_SLOTS.get(template_name, {}).get(slot, self.DEFAULT_IMAGE_SLOT)
+    
     def __init__(self):
         # ディレクトリ作成
         self.UPLOADS_DIR.mkdir(exist_ok=True)
         self.SAMPLES_DIR.mkdir(exist_ok=True)
+        self.TEMP_DIR.mkdir(exist_ok=True)
         
         # 環境変数の確認（セキュリティ上、最初の5文字のみ表示）
         print(f'CHANNEL_ACCESS_TOKEN: {self.CHANNEL_ACCESS_TOKEN[:5]}... (truncated for security)')
@@ -1,6 +1,6 @@
 from fastapi import Request, Response
 from linebot.v3.exceptions import InvalidSignatureError
-from ..services.line_service import handler
+from ..services.event_dispatcher import event_dispatcher, DispatcherBusy
 
 async def handle_webhook(request: Request):
     """LINE Webhook を処理"""
@@ -12,13 +12,16 @@ async def handle_webhook(request: Request):
     print(f'Body: {body.decode("utf-8")}')
     print(f'Signature: {signature}')
     
-    # Webhookハンドラーを使用して処理
+    # 署名を検証してイベントをキューに積み、処理を待たずに応答する（処理はワーカースレッドで行う）
     try:
         body_str = body.decode('utf-8')
-        handler.handle(body_str, signature)
+        event_dispatcher.submit(body_str, signature)
     except InvalidSignatureError as e:
         print(f'Invalid signature error: {e}')
         return Response(status_code=400, content='Invalid signature')
+    except DispatcherBusy as e:
+        print(f'Webhook queue is full: {e}')
+        return Response(status_code=503, content='Busy')
     except Exception as e:
         print(f'Error processing request: {e}')
         return Response(status_code=500, content=f'Error: {str(e)}')
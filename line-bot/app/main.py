@@ -1,11 +1,17 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 from pathlib import Path
 import uvicorn
 import logging
 
 from .config import settings
 from .api import router
+from .services.file_service import file_service
+from .services.line_client import line_client
+from .services.event_dispatcher import event_dispatcher
+from .services.task_executor import task_executor
+from .services.llm_gateway import llm_gateway
 
 # ログ設定
 logging.basicConfig(
@@ -13,8 +19,25 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時にLINE APIクライアント・LLMゲートウェイ・Webhookワーカー・バックグラウンド実行器の起動と旧配置のアップロードファイルの移行を開始し、終了時に停止"""
+    line_client.start()
+    llm_gateway.start()
+    task_executor.start()
+    event_dispatcher.start()
+    if settings.UPLOAD_MIGRATION_ENABLED:
+        file_service.start_layout_migration()
+    yield
+    file_service.stop_layout_migration()
+    # キューに残ったイベントと生成処理の結果を送れるよう、ワーカーを止めてからクライアントを閉じる
+    event_dispatcher.stop()
+    task_executor.stop()
+    llm_gateway.stop()
+    line_client.stop()
+
 # FastAPIアプリケーション
-app = FastAPI(title="LINE Bot API", version="1.0.0")
+app = FastAPI(title="LINE Bot API", version="1.0.0", lifespan=lifespan)
 
 # アップロードディレクトリの作成
 settings.UPLOADS_DIR.mkdir(exist_ok=True)
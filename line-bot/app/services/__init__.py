@@ -1,6 +1,7 @@
 """サービスモジュール"""
 
 from .file_service import file_service
+from .preview_service import preview_service
 from .openai_service import get_chatgpt_response
 from .memoir_service import memoir_service
 from .line_service import (
@@ -14,6 +15,7 @@ from .line_service import (
 
 __all__ = [
     "file_service",
+    "preview_service",
     "get_chatgpt_response",
     "memoir_service",
     "handler",
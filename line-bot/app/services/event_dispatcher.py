@@ -0,0 +1,216 @@
+"""
+Webhookイベントの非同期処理（署名検証後すぐに応答し、ワーカースレッドでイベントを処理する）
+"""
+
+import logging
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+from linebot.v3.webhook import WebhookHandler
+from linebot.v3.webhooks import MessageEvent
+
+from ..config import settings
+from .line_service import handler
+from .user_mailbox import UserMailbox, user_mailbox, event_source_id
+
+
+logger = logging.getLogger(__name__)
+
+
+class DispatcherBusy(Exception):
+    """キューに空きがなくイベントを受け付けられない"""
+
+
+class EventDispatcher:
+    """Webhookイベントをワーカースレッドに振り分けて処理する
+
+    イベントは送信元（ユーザー・グループ・ルーム）のIDでワーカーを決めて、そのワーカーのキューに積む。
+    同じユーザーのイベントは常に同じワーカーが受信順に取り出し、ユーザーごとのメールボックス（UserMailbox）を通して
+    バックグラウンド処理の結果反映とも直列に処理する。別のユーザーのイベントは並行して処理される。
+    各キューは WEBHOOK_QUEUE_SIZE 件までで、1回のWebhookのイベントが収まらない場合は1件も積まずに DispatcherBusy を送出する。
+    """
+
+    def __init__(self, handler: WebhookHandler, workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 mailbox: Optional[UserMailbox] = None):
+        self.handler = handler
+        self.mailbox = mailbox or user_mailbox
+        self.worker_count = max(1, workers or settings.WEBHOOK_WORKERS)
+        self.queue_size = queue_size or settings.WEBHOOK_QUEUE_SIZE
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=self.queue_size) for _ in range(self.worker_count)]
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._round_robin = 0
+        self.stats = {
+            "received": 0,
+            "processed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "unhandled": 0,
+            "max_queue_wait": 0.0,
+            "max_event_age": 0.0,
+            "total_queue_wait": 0.0,
+            "total_processing_time": 0.0
+        }
+        self._last_event_age = 0.0
+
+    def start(self) -> None:
+        """ワーカースレッドを起動"""
+        with self._lock:
+            if self._threads:
+                return
+            for index, event_queue in enumerate(self._queues):
+                thread = threading.Thread(
+                    target=self._worker, args=(event_queue,), name=f"webhook-worker-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Webhookワーカーを起動: {self.worker_count}スレッド, キュー上限 {self.queue_size}件/スレッド")
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """キューに残っているイベントを処理し終えてからワーカーを停止"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+        deadline = time.monotonic() + timeout
+        for event_queue in self._queues:
+            try:
+                event_queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                logger.warning("Webhookキューが空かないため、ワーカーの停止を待たずに終了します")
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        logger.info(f"Webhookワーカーを停止（未処理: {self.queue_depth()}件）")
+
+    def submit(self, body: str, signature: str) -> int:
+        """署名を検証してイベントをキューに積む（処理の完了は待たない）
+
+        Returns:
+            受け付けたイベント数
+
+        Raises:
+            InvalidSignatureError: 署名が不正
+            DispatcherBusy: キューに空きがない
+        """
+        payload = self.handler.parser.parse(body, signature, as_payload=True)
+        if not self._threads:
+            self.start()
+
+        now = time.monotonic()
+        with self._lock:
+            targets = [(self._queues[self._shard(event)], event) for event in payload.events]
+            # 1回のWebhookのイベントはすべて積むか、1件も積まない
+            needed: Dict[int, int] = {}
+            for event_queue, _ in targets:
+                needed[id(event_queue)] = needed.get(id(event_queue), 0) + 1
+            for event_queue, _ in targets:
+                if event_queue.qsize() + needed[id(event_queue)] > self.queue_size:
+                    with self._stats_lock:
+                        self.stats["rejected"] += len(targets)
+                    raise DispatcherBusy(f"Webhookキューが満杯です（{self.queue_depth()}件）")
+            for event_queue, event in targets:
+                event_queue.put_nowait((event, now))
+
+        with self._stats_lock:
+            self.stats["received"] += len(targets)
+        return len(targets)
+
+    def _shard(self, event: Any) -> int:
+        """送信元IDからワーカーを決める（IDがないイベントは順番に割り振る）"""
+        key = event_source_id(event)
+        if key is None:
+            self._round_robin = (self._round_robin + 1) % self.worker_count
+            return self._round_robin
+        return zlib.crc32(key.encode("utf-8")) % self.worker_count
+
+    def _find_handler(self, event: Any) -> Optional[Callable]:
+        """WebhookHandler に登録された関数を探す（WebhookHandler.handle と同じ規則）"""
+        handlers = self.handler._handlers
+        func = None
+        if isinstance(event, MessageEvent):
+            func = handlers.get(f"{event.__class__.__name__}_{event.message.__class__.__name__}")
+        if func is None:
+            func = handlers.get(event.__class__.__name__)
+        return func or self.handler._default
+
+    def _worker(self, event_queue: queue.Queue) -> None:
+        while True:
+            item = event_queue.get()
+            if item is None:
+                event_queue.task_done()
+                return
+            event, enqueued_at = item
+            try:
+                # 同じユーザーの処理が実行中なら、その後ろに積んで次のイベントに進む
+                self.mailbox.post(event_source_id(event), self._process, event, enqueued_at)
+            finally:
+                event_queue.task_done()
+
+    def _process(self, event: Any, enqueued_at: float) -> None:
+        """イベントを処理して統計を記録（メールボックスから呼ばれる）"""
+        started = time.monotonic()
+        queue_wait = started - enqueued_at
+        timestamp = getattr(event, "timestamp", None)
+        event_age = time.time() - timestamp / 1000 if timestamp else queue_wait
+
+        func = self._find_handler(event)
+        failed = False
+        try:
+            if func is None:
+                logger.info(f"ハンドラーが登録されていないイベント: {event.__class__.__name__}")
+            else:
+                func(event)
+        except Exception as e:
+            failed = True
+            logger.exception(f"Webhookイベントの処理エラー: {event.__class__.__name__}, {e}")
+
+        elapsed = time.monotonic() - started
+        with self._stats_lock:
+            if func is None:
+                self.stats["unhandled"] += 1
+            elif failed:
+                self.stats["failed"] += 1
+            else:
+                self.stats["processed"] += 1
+            self.stats["total_queue_wait"] += queue_wait
+            self.stats["total_processing_time"] += elapsed
+            self.stats["max_queue_wait"] = max(self.stats["max_queue_wait"], queue_wait)
+            self.stats["max_event_age"] = max(self.stats["max_event_age"], event_age)
+            self._last_event_age = event_age
+
+    def queue_depth(self) -> int:
+        """キューに積まれている未処理イベント数"""
+        return sum(event_queue.qsize() for event_queue in self._queues)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キューとワーカーの状態を取得（ワーカー数の調整用）"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+            last_event_age = self._last_event_age
+        done = stats["processed"] + stats["failed"] + stats["unhandled"]
+        return {
+            "workers": self.worker_count,
+            "running": bool(self._threads),
+            "queue_size": self.queue_size,
+            "queue_depth": self.queue_depth(),
+            "queue_depth_per_worker": [event_queue.qsize() for event_queue in self._queues],
+            "received": stats["received"],
+            "processed": stats["processed"],
+            "failed": stats["failed"],
+            "unhandled": stats["unhandled"],
+            "rejected": stats["rejected"],
+            "avg_queue_wait": stats["total_queue_wait"] / done if done else 0.0,
+            "max_queue_wait": stats["max_queue_wait"],
+            "avg_processing_time": stats["total_processing_time"] / done if done else 0.0,
+            "last_event_age": last_event_age,
+            "max_event_age": stats["max_event_age"],
+            "mailbox": self.mailbox.get_stats()
+        }
+
+
+# グローバルインスタンス（line_service のハンドラーに登録された関数でイベントを処理する）
+event_dispatcher = EventDispatcher(handler)
@@ -1,21 +1,64 @@
 import os
 import uuid
-import json
-from typing import Dict, List, Optional
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Union
 from pathlib import Path
 import mimetypes
 from datetime import datetime
 
+from ..config import settings
+from .metadata_store import MetadataStore, create_metadata_store
+
+logger = logging.getLogger(__name__)
+
+# 存在しないfile_idを覚えておく件数（同じ不正IDへの繰り返しアクセスでストアを引かない。期間は設定で指定）
+NEGATIVE_CACHE_SIZE = 10000
+
+# ストリーミング保存時の1回あたりの読み書きサイズ
+CHUNK_SIZE = 1024 * 1024
+
+# ファイルの配置（sharded: uploads/ab/cd/{uuid}.ext / flat: 旧形式の uploads/{uuid}.ext）
+LAYOUT_SHARDED = 'sharded'
+LAYOUT_FLAT = 'flat'
+
 class FileService:
     """ファイル管理とメタデータ処理を担当するサービス"""
     
-    def __init__(self, storage_path: str = "uploads"):
+    def __init__(self, storage_path: str = "uploads", metadata_backend: Optional[str] = None,
+                 layout: Optional[str] = None):
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(exist_ok=True)
         
-        # メタデータファイルのパス
-        self.metadata_file = self.storage_path / "metadata.json"
-        self.metadata = self._load_metadata()
+        # 新しく保存するファイルの配置
+        self.layout = layout or settings.UPLOAD_LAYOUT
+        if self.layout not in (LAYOUT_SHARDED, LAYOUT_FLAT):
+            logger.warning(f"不明なファイル配置のため sharded を使います: {self.layout}")
+            self.layout = LAYOUT_SHARDED
+        self._migration_thread: Optional[threading.Thread] = None
+        self._migration_stop = threading.Event()
+        
+        # メタデータの保存先（デフォルトはSQLite。初回起動時に metadata.json から移行する）
+        backend = metadata_backend or settings.METADATA_BACKEND
+        self.store: MetadataStore = create_metadata_store(backend, self.storage_path)
+        
+        # file_id -> メタデータ のメモリ上の索引（ルックアップはディレクトリを走査しない）
+        self._lock = threading.Lock()
+        self._index: Dict[str, Dict] = {}
+        self._missing: "OrderedDict[str, float]" = OrderedDict()
+        self.negative_cache_ttl = settings.FILE_NEGATIVE_CACHE_TTL
+        # 重複排除用: 実ファイル（blob）ごとの参照数と、SHA-256 -> 実ファイルの情報
+        self.dedup_enabled = settings.FILE_DEDUP_ENABLED
+        self._refcounts: Counter = Counter()
+        self._by_hash: Dict[str, Dict] = {}
+        for metadata in self.store.iter_all():
+            self._index_put(self._normalize(metadata))
+        logger.info(f"ファイル索引を読み込み: {len(self._index)}件（実ファイル {len(self._refcounts)}件）")
         
         # サポートするファイルタイプとLINE Messaging APIのマッピング
         self.supported_types = {
@@ -25,74 +68,172 @@ class FileService:
             'file': ['application/pdf', 'application/zip', 'text/plain']
         }
     
-    def _load_metadata(self) -> Dict:
-        """メタデータファイルを読み込み"""
-        if self.metadata_file.exists():
-            try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f'Error loading metadata: {e}')
-        return {}
-    
-    def _save_metadata(self):
-        """メタデータファイルを保存"""
-        try:
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f'Error saving metadata: {e}')
-    
     def save_file(self, file_data: bytes, filename: str, content_type: Optional[str] = None) -> Dict:
         """ファイルを保存してメタデータを返す"""
+        return self.save_stream([file_data], filename, content_type)
+    
+    def save_stream(self, source: Union[Iterable[bytes], BinaryIO], filename: str,
+                    content_type: Optional[str] = None) -> Dict:
+        """ファイルをチャンク単位で保存してメタデータを返す
+        
+        Args:
+            source: バイト列のイテレータ、または read() を持つファイルオブジェクト
+            filename: 元のファイル名（拡張子とContent-Typeの推測に使う）
+            content_type: Content-Type（省略時はファイル名から推測）
+        
+        一時ファイルに書きながらSHA-256を計算し、書き終えてから保存先へ rename する。
+        途中で失敗しても保存先に書きかけのファイルは残らない。
+        同じ内容のファイルが保存済みなら一時ファイルは捨て、既存のファイルを参照する。
+        """
+        fd, tmp_name = tempfile.mkstemp(dir=self.storage_path, suffix='.tmp')
         try:
-            print(f"🔧 save_file開始: {filename}, サイズ: {len(file_data)} bytes")
-            
-            # ファイル名にUUIDを追加して重複を防ぐ
-            file_id = str(uuid.uuid4())
-            extension = Path(filename).suffix
-            safe_filename = f"{file_id}{extension}"
-            
-            file_path = self.storage_path / safe_filename
-            
-            print(f"📁 保存パス: {file_path}")
-            
-            # ファイルを保存
-            with open(file_path, 'wb') as f:
-                f.write(file_data)
-            
-            print(f"✅ ファイル保存完了: {safe_filename}")
+            hasher = hashlib.sha256()
+            file_size = 0
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in self._iter_chunks(source):
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    file_size += len(chunk)
+            return self._register(Path(tmp_name), filename, content_type, file_size, hasher.hexdigest())
             
-            # Content-Typeを推測
-            if not content_type:
-                content_type, _ = mimetypes.guess_type(filename)
+        except Exception as e:
+            Path(tmp_name).unlink(missing_ok=True)
+            logger.error(f"ファイルの保存に失敗しました: {filename}, {e}")
+            raise
+    
+    def register_file(self, path: Union[str, Path], filename: Optional[str] = None,
+                      content_type: Optional[str] = None) -> Dict:
+        """書き出し済みのファイル（生成したPDFなど）を保存先へ移動して登録する
+        
+        内容はメモリに読み込まず、ハッシュもチャンク単位で計算する。
+        uploads と同じファイルシステム上のファイルなら rename だけで済む。
+        同じ内容のファイルが保存済みなら、渡されたファイルは削除して既存のファイルを参照する。
+        """
+        path = Path(path)
+        filename = filename or path.name
+        try:
+            hasher = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in self._iter_chunks(f):
+                    hasher.update(chunk)
+            return self._register(path, filename, content_type, path.stat().st_size, hasher.hexdigest())
             
-            # メタデータを作成
-            metadata = {
-                'file_id': file_id,
-                'original_filename': filename,
-                'stored_filename': safe_filename,
-                'file_path': str(file_path),
-                'content_type': content_type,
-                'file_size': len(file_data),
-                'upload_time': datetime.now().isoformat(),
-                'message_type': self.get_message_type(content_type)
-            }
+        except Exception as e:
+            logger.error(f"ファイルの登録に失敗しました: {path}, {e}")
+            raise
+    
+    @staticmethod
+    def _iter_chunks(source: Union[Iterable[bytes], BinaryIO]) -> Iterator[bytes]:
+        """イテレータまたはファイルオブジェクトからチャンクを取り出す"""
+        if hasattr(source, 'read'):
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                yield chunk
+        else:
+            for chunk in source:
+                if chunk:
+                    yield chunk
+    
+    def _register(self, source: Path, filename: str, content_type: Optional[str],
+                  file_size: int, sha256: str) -> Dict:
+        """書き終えたファイルを保存先へ移動（同じ内容があれば参照のみ）し、メタデータを永続化・索引に追加"""
+        # ファイル名にUUIDを追加して重複を防ぐ
+        file_id = str(uuid.uuid4())
+        
+        # Content-Typeを推測
+        if not content_type:
+            content_type, _ = mimetypes.guess_type(filename)
+        
+        # メタデータを作成
+        metadata = {
+            'file_id': file_id,
+            'original_filename': filename,
+            'stored_filename': f"{file_id}{Path(filename).suffix}",
+            'content_type': content_type,
+            'file_size': file_size,
+            'upload_time': datetime.now().isoformat(),
+            'message_type': self.get_message_type(content_type),
+            'layout': self.layout,
+            'sha256': sha256
+        }
+        
+        # 参照数の確認から索引への追加までをロック内で行い、同じ実ファイルの削除と競合しないようにする
+        with self._lock:
+            blob = self._by_hash.get(sha256) if self.dedup_enabled else None
+            if blob is not None and self.resolve_path(self._normalize({**blob, 'file_id': file_id})) is None:
+                blob = None
             
-            print(f"📝 メタデータ作成: {file_id}")
+            if blob is not None:
+                # 同じ内容の実ファイルを参照する
+                metadata.update(blob)
+                self._normalize(metadata)
+                source.unlink(missing_ok=True)
+            else:
+                self._normalize(metadata)
+                file_path = Path(metadata['file_path'])
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(source), str(file_path))
             
             # メタデータを永続化
-            self.metadata[file_id] = metadata
-            self._save_metadata()
-            
-            print(f"💾 メタデータ保存完了: {len(self.metadata)} 件")
-            print(f"📋 保存されたメタデータ: {metadata}")
-            
-            return metadata
+            self.store.put(metadata)
+            self._index_put(dict(metadata))
+            self._missing.pop(file_id, None)
+        
+        if blob is not None:
+            logger.info(f"ファイル保存（重複のため既存ファイルを参照）: {file_id} -> {metadata['blob_id']} ({filename}, {file_size} bytes)")
+        else:
+            logger.info(f"ファイル保存: {file_id} ({filename}, {file_size} bytes)")
+        logger.debug(f"保存したメタデータ: {metadata}")
+        return metadata
+    
+    @staticmethod
+    def _blob_id(metadata: Dict) -> str:
+        """実ファイルのID（重複排除で他のファイルを参照している場合は参照先のID）"""
+        return metadata.get('blob_id') or metadata['file_id']
+    
+    def _index_put(self, metadata: Dict) -> None:
+        """索引に追加・更新し、実ファイルの参照数を数える（ロック内で呼ぶ）"""
+        previous = self._index.get(metadata['file_id'])
+        if previous is not None:
+            self._refcounts[self._blob_id(previous)] -= 1
+        self._index[metadata['file_id']] = metadata
+        blob_id = self._blob_id(metadata)
+        self._refcounts[blob_id] += 1
+        if metadata.get('sha256'):
+            self._by_hash[metadata['sha256']] = {
+                'blob_id': blob_id,
+                'stored_filename': metadata['stored_filename'],
+                'layout': metadata.get('layout', LAYOUT_FLAT)
+            }
+    
+    def delete_file(self, file_id: str) -> bool:
+        """ファイルを削除する（存在しなければFalse）
+        
+        メタデータは常に削除し、実ファイルは参照しているファイルがなくなったときだけ削除する。
+        """
+        with self._lock:
+            metadata = self._index.pop(file_id, None)
+            if metadata is None:
+                metadata = self.store.get(file_id)
+                if metadata is None:
+                    return False
+                metadata = self._normalize(metadata)
+            else:
+                self._refcounts[self._blob_id(metadata)] -= 1
+            self.store.delete(file_id)
             
-        except Exception as e:
-            print(f'❌ Error saving file: {e}')
-            raise
+            blob_id = self._blob_id(metadata)
+            remaining = self._refcounts[blob_id]
+            if remaining <= 0:
+                self._refcounts.pop(blob_id, None)
+                sha256 = metadata.get('sha256')
+                if sha256 and self._by_hash.get(sha256, {}).get('blob_id') == blob_id:
+                    del self._by_hash[sha256]
+                file_path = self.resolve_path(metadata)
+                if file_path is not None:
+                    file_path.unlink(missing_ok=True)
+        
+        logger.info(f"ファイル削除: {file_id}（実ファイルの残り参照数: {max(remaining, 0)}）")
+        return True
     
     def get_message_type(self, content_type: str) -> str:
         """Content-TypeからLINE Messaging APIのメッセージタイプを判定"""
@@ -120,99 +261,228 @@ class FileService:
             return f"{base_url}/media/{message_type}/{file_id}"
         return f"{base_url}/files/{file_id}"
     
+    @staticmethod
+    def _relative_path(file_id: str, stored_filename: str, layout: str) -> Path:
+        """uploads からの相対パス（sharded は file_id の先頭4文字で2階層に分ける）"""
+        if layout == LAYOUT_SHARDED:
+            return Path(file_id[:2], file_id[2:4], stored_filename)
+        return Path(stored_filename)
+    
+    def _normalize(self, metadata: Dict) -> Dict:
+        """file_path を配置（layout）に従って uploads 配下のパスに揃える
+        
+        layout のない旧メタデータは flat として扱う。
+        """
+        metadata['file_path'] = str(self.storage_path / self._relative_path(
+            self._blob_id(metadata), metadata['stored_filename'], metadata.get('layout', LAYOUT_FLAT)
+        ))
+        return metadata
+    
+    def resolve_path(self, metadata: Dict) -> Optional[Path]:
+        """実ファイルのパスを返す（見つからなければNone）
+        
+        メタデータの配置で見つからない場合はもう一方の配置も確認する（移行中のファイル向け）。
+        """
+        file_path = Path(metadata['file_path'])
+        if file_path.exists():
+            return file_path
+        layout = metadata.get('layout', LAYOUT_FLAT)
+        other = LAYOUT_FLAT if layout == LAYOUT_SHARDED else LAYOUT_SHARDED
+        alternate = self.storage_path / self._relative_path(self._blob_id(metadata), metadata['stored_filename'], other)
+        if alternate.exists():
+            return alternate
+        return None
+    
     def get_file_by_id(self, file_id: str) -> Optional[Dict]:
-        """ファイルIDからファイル情報を取得"""
+        """ファイルIDからファイル情報を取得
+        
+        メモリ上の索引だけを参照する（ファイルの存在確認やディレクトリ走査はしない）。
+        索引にないIDはストアにもなかった場合だけ FILE_NEGATIVE_CACHE_TTL 秒覚えておき、ストアへの問い合わせを繰り返さない。
+        別プロセスが登録したファイルはストアから読み込むが、直前に「なし」と覚えたIDはその間見つからない。
+        メタデータのないファイルを登録するには repair() を実行する。
+        """
+        metadata = self._index.get(file_id)
+        if metadata is not None:
+            logger.debug(f"ファイル発見: {file_id}")
+            return dict(metadata)
+        
+        now = time.monotonic()
+        with self._lock:
+            missed_at = self._missing.get(file_id)
+            if missed_at is not None and now - missed_at < self.negative_cache_ttl:
+                logger.debug(f"ファイルなし（キャッシュ）: {file_id}")
+                return None
+        
+        # 別プロセスが追加した可能性があるためストアを確認
         try:
-            print(f"🔍 get_file_by_id開始: {file_id}")
-            print(f"📋 現在のメタデータ件数: {len(self.metadata)}")
-            print(f"📋 メタデータのキー: {list(self.metadata.keys())}")
-            
-            # メタデータから検索
-            if file_id in self.metadata:
-                print(f"✅ メタデータからファイル発見: {file_id}")
-                metadata = self.metadata[file_id]
-                file_path_str = metadata['file_path']
-                file_path = Path(file_path_str)
-                
-                # 相対パスの場合は絶対パスに変換
-                if not file_path.is_absolute():
-                    file_path = self.storage_path / file_path.name
-                    print(f"📁 絶対パスに変換: {file_path}")
-                
-                # ファイルの存在確認
-                if file_path.exists():
-                    print(f"✅ ファイル存在確認: {file_path}")
-                    # メタデータのファイルパスを絶対パスで更新
-                    metadata['file_path'] = str(file_path)
-                    return metadata
-                else:
-                    print(f"❌ ファイルが存在しません: {file_path}")
-            else:
-                print(f"❌ メタデータにファイルIDが見つかりません: {file_id}")
-            
-            # メタデータにない場合はファイルシステムから検索（フォールバック）
-            print(f"🔍 ファイルシステムから検索開始: {file_id}")
-            for file_path in self.storage_path.glob(f"{file_id}*"):
-                print(f"📁 発見したファイル: {file_path}")
-                if file_path.is_file():
-                    content_type, _ = mimetypes.guess_type(str(file_path))
-                    
-                    # ファイルサイズを取得
-                    file_size = file_path.stat().st_size
-                    
-                    # 元のファイル名を推測（拡張子から）
-                    extension = file_path.suffix
-                    original_filename = f"file{extension}"  # デフォルト名
-                    
-                    print(f"✅ フォールバックでファイル情報作成: {file_id}")
-                    return {
-                        'file_id': file_id,
-                        'original_filename': original_filename,
-                        'stored_filename': file_path.name,
-                        'file_path': str(file_path),
-                        'content_type': content_type,
-                        'file_size': file_size,
-                        'message_type': self.get_message_type(content_type)
-                    }
-            
-            # 見つからない場合はNoneを返す
-            print(f"❌ ファイルが見つかりません: {file_id}")
-            return None
-            
+            metadata = self.store.get(file_id)
         except Exception as e:
-            print(f'❌ Error getting file: {e}')
-            import traceback
-            print(f'❌ Traceback: {traceback.format_exc()}')
+            logger.error(f"メタデータの取得に失敗しました: {file_id}, {e}")
             return None
+        
+        with self._lock:
+            if metadata is not None:
+                metadata = self._normalize(metadata)
+                self._index_put(metadata)
+                self._missing.pop(file_id, None)
+                return dict(metadata)
+            
+            # ストアを引いている間に同じプロセスで登録された場合は、なしと覚えない
+            metadata = self._index.get(file_id)
+            if metadata is not None:
+                return dict(metadata)
+            if self.negative_cache_ttl <= 0:
+                return None
+            self._missing[file_id] = now
+            self._missing.move_to_end(file_id)
+            while len(self._missing) > NEGATIVE_CACHE_SIZE:
+                self._missing.popitem(last=False)
+        
+        logger.debug(f"ファイルが見つかりません: {file_id}")
+        return None
     
     def list_files(self) -> List[Dict]:
-        """保存されているファイル一覧を取得"""
-        files = []
-        try:
-            # メタデータから一覧を取得
-            for file_id, metadata in self.metadata.items():
-                file_path = Path(metadata['file_path'])
-                if file_path.exists():
-                    files.append(metadata)
+        """保存されているファイル一覧を取得（アップロード順）"""
+        with self._lock:
+            files = [dict(m) for m in self._index.values()]
+        files.sort(key=lambda m: m.get('upload_time') or '')
+        return files
+    
+    def repair(self) -> Dict[str, int]:
+        """uploads ディレクトリを走査して索引を修復する（明示的に実行するメンテナンス処理）
+        
+        - メタデータのないファイルを登録する
+        - 実体のないメタデータを報告する（削除はしない）
+        
+        Returns:
+            {"registered": 登録件数, "missing": 実体のないメタデータ件数}
+        """
+        candidates = [(p, LAYOUT_FLAT) for p in self.storage_path.iterdir()]
+        candidates += [(p, LAYOUT_SHARDED) for p in self.storage_path.glob('??/??/*')]
+        
+        registered = []
+        for file_path, layout in candidates:
+            if not file_path.is_file() or file_path.name.startswith("metadata.") or file_path.suffix == ".tmp":
+                continue
+            file_id = file_path.stem
+            if file_id in self._index or file_id in self._refcounts:
+                continue
+            content_type, _ = mimetypes.guess_type(str(file_path))
+            stat = file_path.stat()
+            registered.append({
+                'file_id': file_id,
+                'original_filename': f"file{file_path.suffix}",
+                'stored_filename': file_path.name,
+                'file_path': str(file_path),
+                'content_type': content_type,
+                'file_size': stat.st_size,
+                'upload_time': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                'message_type': self.get_message_type(content_type),
+                'layout': layout
+            })
+        
+        if registered:
+            self.store.put_many(registered)
+            with self._lock:
+                for metadata in registered:
+                    self._index_put(metadata)
+                    self._missing.pop(metadata['file_id'], None)
+        
+        with self._lock:
+            indexed = list(self._index.values())
+        missing = [m['file_id'] for m in indexed if self.resolve_path(m) is None]
+        for file_id in missing:
+            logger.warning(f"実体のないメタデータ: {file_id}")
+        
+        logger.info(f"索引の修復完了: 登録 {len(registered)}件, 実体なし {len(missing)}件")
+        return {"registered": len(registered), "missing": len(missing)}
+    
+    def migrate_layout(self, batch_size: Optional[int] = None, pause: Optional[float] = None) -> Dict[str, int]:
+        """flat 配置のファイルを sharded 配置へ移行する
+        
+        ファイルごとに 新しい場所へリンク（不可ならコピー）→ メタデータを更新 → 古いファイルを削除 の順で進めるため、
+        移行中もどちらかの場所でファイルを配信できる。バッチごとに pause 秒待ち、通常の処理を妨げないようにする。
+        
+        Returns:
+            {"migrated": 移行件数, "missing": 実体のない件数, "failed": 失敗件数}
+        """
+        batch_size = batch_size or settings.UPLOAD_MIGRATION_BATCH_SIZE
+        pause = settings.UPLOAD_MIGRATION_PAUSE if pause is None else pause
+        with self._lock:
+            pending = [dict(m) for m in self._index.values() if m.get('layout', LAYOUT_FLAT) == LAYOUT_FLAT]
+        
+        result = {"migrated": 0, "missing": 0, "failed": 0}
+        for start in range(0, len(pending), batch_size):
+            if self._migration_stop.is_set():
+                break
             
-            # メタデータにないファイルも検索（フォールバック）
-            for file_path in self.storage_path.glob("*"):
-                if file_path.is_file() and file_path.name != "metadata.json":
-                    # 既にメタデータにあるファイルはスキップ
-                    file_id = file_path.stem
-                    if file_id not in self.metadata:
-                        content_type, _ = mimetypes.guess_type(str(file_path))
-                        files.append({
-                            'file_id': file_id,
-                            'filename': file_path.name,
-                            'content_type': content_type,
-                            'file_size': file_path.stat().st_size,
-                            'message_type': self.get_message_type(content_type)
-                        })
-        except Exception as e:
-            print(f'Error listing files: {e}')
+            moved = []
+            for metadata in pending[start:start + batch_size]:
+                source = self.storage_path / metadata['stored_filename']
+                dest = self.storage_path / self._relative_path(
+                    self._blob_id(metadata), metadata['stored_filename'], LAYOUT_SHARDED
+                )
+                try:
+                    if not dest.exists():
+                        if not source.exists():
+                            result["missing"] += 1
+                            continue
+                        dest.parent.mkdir(parents=True, exist_ok=True)
+                        try:
+                            os.link(source, dest)
+                        except OSError:
+                            shutil.copy2(source, dest)
+                except Exception as e:
+                    result["failed"] += 1
+                    logger.error(f"ファイルの移行に失敗しました: {metadata['file_id']}, {e}")
+                    continue
+                metadata['layout'] = LAYOUT_SHARDED
+                moved.append((self._normalize(metadata), source, dest))
+            
+            if moved:
+                # 走査後に削除されたファイルのメタデータを書き戻さないよう、索引のロック内で存在を確かめてから保存する
+                with self._lock:
+                    alive = []
+                    for metadata, source, dest in moved:
+                        if metadata['file_id'] in self._index:
+                            alive.append((metadata, source))
+                        elif self._refcounts.get(self._blob_id(metadata), 0) <= 0:
+                            # 削除済みで、同じ実体を参照するファイルもない → 作ったリンクを消す
+                            dest.unlink(missing_ok=True)
+                    if alive:
+                        self.store.put_many([m for m, _ in alive])
+                        for metadata, _ in alive:
+                            self._index_put(metadata)
+                for _, source in alive:
+                    source.unlink(missing_ok=True)
+                result["migrated"] += len(alive)
+                logger.info(f"ファイル配置の移行: {result['migrated']}/{len(pending)}件")
+            
+            if pause:
+                self._migration_stop.wait(pause)
         
-        return files
+        logger.info(f"ファイル配置の移行完了: {result}")
+        return result
+    
+    def start_layout_migration(self) -> None:
+        """flat 配置のファイルがあればバックグラウンドで移行を開始"""
+        if self.layout != LAYOUT_SHARDED or (self._migration_thread and self._migration_thread.is_alive()):
+            return
+        with self._lock:
+            has_flat = any(m.get('layout', LAYOUT_FLAT) == LAYOUT_FLAT for m in self._index.values())
+        if not has_flat:
+            return
+        self._migration_stop.clear()
+        self._migration_thread = threading.Thread(
+            target=self.migrate_layout, name="upload-layout-migration", daemon=True
+        )
+        self._migration_thread.start()
+    
+    def stop_layout_migration(self, timeout: float = 5.0) -> None:
+        """移行を中断（処理中のバッチは完了させる。次回起動時に続きから再開）"""
+        self._migration_stop.set()
+        if self._migration_thread:
+            self._migration_thread.join(timeout)
 
 # グローバルインスタンス
 file_service = FileService()
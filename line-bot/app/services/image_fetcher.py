@@ -0,0 +1,168 @@
+"""
+リモート画像の取得サービス（接続プール付き非同期HTTPクライアント + URL/ETagキーのディスクキャッシュ）
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import weakref
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+import httpx
+
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def _guess_extension(content_type: str) -> str:
+    """Content-Typeから拡張子を推測"""
+    if "jpeg" in content_type or "jpg" in content_type:
+        return ".jpg"
+    if "png" in content_type:
+        return ".png"
+    if "gif" in content_type:
+        return ".gif"
+    if "webp" in content_type:
+        return ".webp"
+    return ".jpg"  # デフォルト
+
+
+class ImageFetcher:
+    """リモート画像の取得
+
+    httpx.AsyncClient をイベントループごとに1つ持ち、同じホストへの接続を使い回す。
+    取得した画像は IMAGE_CACHE_DIR に保存し、次回は If-None-Match で再検証する（304ならダウンロードしない）。
+    ETagを返さないサーバーの画像は毎回取得し直す。
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        self.cache_dir = Path(cache_dir or settings.IMAGE_CACHE_DIR)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # イベントループ -> クライアント（写真自分史は生成ごとに新しいループを使うため）
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._last_cleanup = 0.0
+        self.stats = {"downloads": 0, "revalidated": 0, "errors": 0, "bytes_downloaded": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """実行中のイベントループ用のクライアントを取得"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.IMAGE_FETCH_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=settings.IMAGE_FETCH_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.IMAGE_FETCH_MAX_CONNECTIONS
+                ),
+                follow_redirects=True
+            )
+            self._clients[loop] = client
+        return client
+
+    async def close(self) -> None:
+        """実行中のイベントループのクライアントを閉じる"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def _index_path(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+    def _body_path(self, url: str, etag: str, ext: str) -> Path:
+        key = hashlib.sha256(f"{url}\n{etag}".encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}{ext}"
+
+    def _read_index(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._index_path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        """一時ファイル経由で書き込む（読み込み中のファイルを壊さないため）"""
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_name, path)
+
+    async def fetch(self, url: str) -> Optional[Path]:
+        """画像を取得し、キャッシュ内のファイルパスを返す（失敗時はNone）"""
+        try:
+            return await asyncio.wait_for(self._fetch(url), timeout=settings.IMAGE_FETCH_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.stats["errors"] += 1
+            logger.warning(f"画像の取得がタイムアウトしました（{settings.IMAGE_FETCH_TIMEOUT}秒）: {url}")
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"画像の取得エラー: {url}, {str(e)}")
+        return None
+
+    async def _fetch(self, url: str) -> Path:
+        index = self._read_index(url)
+        cached_body = None
+        headers = {}
+        if index and index.get("etag"):
+            cached_body = self._body_path(url, index["etag"], index["ext"])
+            if cached_body.exists():
+                headers["If-None-Match"] = index["etag"]
+
+        response = await self._get_client().get(url, headers=headers)
+
+        if response.status_code == 304 and cached_body is not None:
+            self.stats["revalidated"] += 1
+            os.utime(cached_body)
+            os.utime(self._index_path(url))
+            logger.info(f"画像キャッシュを再利用（304）: {url}")
+            return cached_body
+
+        response.raise_for_status()
+        etag = response.headers.get("ETag", "")
+        ext = _guess_extension(response.headers.get("Content-Type", ""))
+        body_path = self._body_path(url, etag, ext)
+        self._write_atomic(body_path, response.content)
+        self._write_atomic(
+            self._index_path(url),
+            json.dumps({"url": url, "etag": etag, "ext": ext}).encode("utf-8")
+        )
+
+        # 古い版の画像を削除
+        if cached_body is not None and cached_body != body_path:
+            cached_body.unlink(missing_ok=True)
+
+        self.stats["downloads"] += 1
+        self.stats["bytes_downloaded"] += len(response.content)
+        logger.info(f"画像をダウンロード完了: {url} ({len(response.content)} bytes)")
+
+        if time.monotonic() - self._last_cleanup > 60 * 60:
+            self.cleanup_expired()
+        return body_path
+
+    def cleanup_expired(self) -> int:
+        """保持期間を過ぎたキャッシュを削除"""
+        self._last_cleanup = time.monotonic()
+        threshold = time.time() - settings.IMAGE_CACHE_RETENTION_SECONDS
+        removed = 0
+        for path in self.cache_dir.iterdir():
+            try:
+                if path.is_file() and path.stat().st_mtime < threshold:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"期限切れの画像キャッシュを削除: {removed}件")
+        return removed
+
+
+# グローバルインスタンス
+image_fetcher = ImageFetcher()
@@ -0,0 +1,164 @@
+"""
+LINE Messaging API の共有クライアント（接続プール付き非同期クライアント）
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+from linebot.v3.messaging import (
+    AsyncApiClient,
+    AsyncMessagingApi,
+    Configuration,
+    PushMessageRequest,
+    ReplyMessageRequest
+)
+
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# メッセージコンテンツ取得APIのホスト
+LINE_DATA_API_URL = "https://api-data.line.me"
+
+
+class LineMessagingClient:
+    """LINE Messaging API の共有クライアント
+
+    専用スレッドのイベントループ上に AsyncApiClient（aiohttpの接続プール）を1つだけ作り、
+    すべての返信・プッシュ・コンテンツ取得で keep-alive 接続を使い回す。
+    同期コード（Webhookハンドラーやバックグラウンドスレッド）からは call() で、
+    非同期コードからは await acall() で呼び出す。
+    """
+
+    def __init__(self, configuration: Optional[Configuration] = None):
+        if configuration is None:
+            configuration = Configuration(access_token=settings.CHANNEL_ACCESS_TOKEN)
+            configuration.connection_pool_maxsize = settings.LINE_API_MAX_CONNECTIONS
+        self.configuration = configuration
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._api_client: Optional[AsyncApiClient] = None
+        self._messaging_api: Optional[AsyncMessagingApi] = None
+        self.stats = {"requests": 0, "errors": 0}
+
+    def start(self) -> None:
+        """イベントループのスレッドとクライアントを起動"""
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="line-messaging-client", daemon=True)
+            thread.start()
+            # aiohttpのセッションは使用するイベントループ上で作る
+            asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+            self._loop, self._thread = loop, thread
+        logger.info(f"LINE Messaging APIクライアントを起動（最大接続数: {self.configuration.connection_pool_maxsize}）")
+
+    async def _open(self) -> None:
+        self._api_client = AsyncApiClient(self.configuration)
+        self._messaging_api = AsyncMessagingApi(self._api_client)
+
+    def stop(self) -> None:
+        """クライアントを閉じてイベントループを停止"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._api_client.close(), loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"LINE Messaging APIクライアントの終了エラー: {e}")
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+            self._loop = self._thread = self._api_client = self._messaging_api = None
+        logger.info("LINE Messaging APIクライアントを停止")
+
+    def _submit(self, fn: Callable[[AsyncMessagingApi], Awaitable[T]]):
+        if self._loop is None:
+            # 起動前（スクリプトやテストなど）に呼ばれた場合はその場で起動する
+            self.start()
+        self.stats["requests"] += 1
+        return asyncio.run_coroutine_threadsafe(fn(self._messaging_api), self._loop)
+
+    def call(self, fn: Callable[[AsyncMessagingApi], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """同期コードからAPIを呼び出す
+
+        Args:
+            fn: AsyncMessagingApi を受け取りコルーチンを返す関数（例: lambda api: api.reply_message(req)）
+            timeout: 待ち時間（秒）。省略時は LINE_API_TIMEOUT
+        """
+        try:
+            return self._submit(fn).result(timeout or settings.LINE_API_TIMEOUT)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+
+    async def acall(self, fn: Callable[[AsyncMessagingApi], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """非同期コードからAPIを呼び出す（呼び出し元のイベントループはブロックしない）"""
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(self._submit(fn)), timeout or settings.LINE_API_TIMEOUT
+            )
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+
+    def reply_message(self, request: ReplyMessageRequest) -> Any:
+        """返信メッセージを送信"""
+        return self.call(lambda api: api.reply_message(request))
+
+    def push_message(self, request: PushMessageRequest) -> Any:
+        """プッシュメッセージを送信"""
+        return self.call(lambda api: api.push_message(request))
+
+    def iter_content(self, message_id: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """メッセージのコンテンツ（画像など）をチャンク単位で取得
+
+        SDKの get_message_content は本文全体をメモリに読み込むため、共有の接続プールで
+        コンテンツ取得APIを直接ストリーミングで呼ぶ。
+        """
+        if self._loop is None:
+            self.start()
+        loop = self._loop
+        url = f"{LINE_DATA_API_URL}/v2/bot/message/{message_id}/content"
+        headers = {"Authorization": f"Bearer {self.configuration.access_token}"}
+        timeout = settings.LINE_API_TIMEOUT
+
+        async def _open_response():
+            session = self._api_client.rest_client.pool_manager
+            response = await session.get(url, headers=headers)
+            if response.status >= 400:
+                body = await response.text()
+                response.release()
+                raise RuntimeError(f"コンテンツの取得に失敗しました: {response.status} {body}")
+            return response
+
+        self.stats["requests"] += 1
+        try:
+            response = asyncio.run_coroutine_threadsafe(_open_response(), loop).result(timeout)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        try:
+            while True:
+                chunk = asyncio.run_coroutine_threadsafe(response.content.read(chunk_size), loop).result(timeout)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            loop.call_soon_threadsafe(response.release)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """クライアントの状態を取得"""
+        return {"running": self._loop is not None, **self.stats}
+
+
+# グローバルインスタンス
+line_client = LineMessagingClient()
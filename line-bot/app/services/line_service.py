@@ -1,8 +1,4 @@
 from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    MessagingApiBlob,
     ReplyMessageRequest,
     PushMessageRequest,
     TextMessage,
@@ -20,33 +16,27 @@ from linebot.v3.webhooks import (
     TextMessageContent,
     ImageMessageContent
 )
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 from pathlib import Path
 from ..config import settings
 from .file_service import file_service
-from .memoir_service import memoir_service
-from .quick_memoir_service import quick_memoir_service
-from .photo_memoir_service import photo_memoir_service
-from .openai_service import get_chatgpt_response
+from .line_client import line_client
+from .task_executor import task_executor, TaskQueueFull
+from .user_mailbox import user_mailbox
+from .preview_service import preview_service
+from .memoir_service import memoir_service, MemoirService
+from .quick_memoir_service import quick_memoir_service, QuickMemoirService
+from .photo_memoir_service import photo_memoir_service, PhotoMemoirService
+from .openai_service import get_chatgpt_response, handle_file_generation_request, FILE_GENERATION_KEYWORDS
+from .message_router import MessageRouter, KeywordMatcher, Route, RouteContext
 
-# LINE Bot API設定
-configuration = Configuration(access_token=settings.CHANNEL_ACCESS_TOKEN)
+# LINE Bot API設定（送信は共有クライアント line_client を使う）
 handler = WebhookHandler(settings.CHANNEL_SECRET)
 
-def download_file_from_line(message_id: str) -> bytes:
-    """LINE Platform APIからファイルをダウンロード"""
+def stream_file_from_line(message_id: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """LINE Platform APIからファイルをチャンク単位でダウンロード（全体をメモリに載せない）"""
     try:
-        with ApiClient(configuration) as api_client:
-            messaging_api_blob = MessagingApiBlob(api_client)
-            
-            # LINE Platform APIからファイルの内容を取得
-            response = messaging_api_blob.get_message_content(message_id)
-            
-            if hasattr(response, 'data'):
-                return response.data
-            else:
-                # レスポンスが直接バイナリデータの場合
-                return response
+        yield from line_client.iter_content(message_id, chunk_size)
                 
     except Exception as e:
         print(f'Error downloading file from LINE: {e}')
@@ -59,7 +49,7 @@ def create_message_by_type(message_type: str, file_metadata: Dict[str, Any]) ->
     if message_type == 'image':
         return ImageMessage(
             original_content_url=file_url,
-            preview_image_url=file_url  # プレビュー画像も同じURLを使用
+            preview_image_url=preview_service.get_preview_url(file_metadata['file_id'], settings.BASE_URL)
         )
     else:
         # その他のファイルタイプはテキストメッセージで代替
@@ -71,17 +61,14 @@ def send_file_message(reply_token: str, file_metadata: Dict[str, Any]) -> None:
         message_type = file_metadata['message_type']
         message = create_message_by_type(message_type, file_metadata)
         
-        with ApiClient(configuration) as api_client:
-            messaging_api = MessagingApi(api_client)
-            
-            response = messaging_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[message]
-                )
+        response = line_client.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[message]
             )
-            
-            print(f'File message sent successfully: {response}')
+        )
+        
+        print(f'File message sent successfully: {response}')
             
     except Exception as e:
         print(f'Error sending file message: {e}')
@@ -91,19 +78,16 @@ def send_file_message(reply_token: str, file_metadata: Dict[str, Any]) -> None:
 def send_push_message(user_id: str, text: str) -> None:
     """プッシュメッセージを送信（reply_tokenが期限切れの場合に使用）"""
     try:
-        with ApiClient(configuration) as api_client:
-            messaging_api = MessagingApi(api_client)
-            
-            push_message = TextMessage(text=text)
-            
-            response = messaging_api.push_message(
-                PushMessageRequest(
-                    to=user_id,
-                    messages=[push_message]
-                )
+        push_message = TextMessage(text=text)
+        
+        response = line_client.push_message(
+            PushMessageRequest(
+                to=user_id,
+                messages=[push_message]
             )
-            
-            print(f'Push message sent successfully: {response}')
+        )
+        
+        print(f'Push message sent successfully: {response}')
             
     except Exception as e:
         print(f'Error sending push message: {e}')
@@ -111,19 +95,16 @@ def send_push_message(user_id: str, text: str) -> None:
 def send_text_message_with_fallback(reply_token: str, user_id: str, text: str) -> None:
     """テキストメッセージを送信（reply_tokenが失敗した場合はpush messageを使用）"""
     try:
-        with ApiClient(configuration) as api_client:
-            messaging_api = MessagingApi(api_client)
-            
-            reply_message = TextMessage(text=text)
-            
-            response = messaging_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[reply_message]
-                )
+        reply_message = TextMessage(text=text)
+        
+        response = line_client.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[reply_message]
             )
-            
-            print(f'Text message sent successfully: {response}')
+        )
+        
+        print(f'Text message sent successfully: {response}')
             
     except Exception as e:
         error_message = str(e)
@@ -141,19 +122,16 @@ def send_text_message_with_fallback(reply_token: str, user_id: str, text: str) -
 def send_text_message(reply_token: str, text: str) -> None:
     """テキストメッセージを送信"""
     try:
-        with ApiClient(configuration) as api_client:
-            messaging_api = MessagingApi(api_client)
-            
-            reply_message = TextMessage(text=text)
-            
-            response = messaging_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[reply_message]
-                )
+        reply_message = TextMessage(text=text)
+        
+        response = line_client.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[reply_message]
             )
-            
-            print(f'Text message sent successfully: {response}')
+        )
+        
+        print(f'Text message sent successfully: {response}')
             
     except Exception as e:
         print(f'Error sending text message: {e}')
@@ -161,17 +139,14 @@ def send_text_message(reply_token: str, text: str) -> None:
 def send_multiple_messages(reply_token: str, messages: list) -> None:
     """複数のメッセージを送信"""
     try:
-        with ApiClient(configuration) as api_client:
-            messaging_api = MessagingApi(api_client)
-            
-            response = messaging_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=messages[:5]  # 最大5つまで
-                )
+        response = line_client.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=messages[:5]  # 最大5つまで
             )
-            
-            print(f'Multiple messages sent successfully: {response}')
+        )
+        
+        print(f'Multiple messages sent successfully: {response}')
             
     except Exception as e:
         print(f'Error sending multiple messages: {e}')
@@ -246,17 +221,14 @@ def send_memoir_complete_message(reply_token: str, user_id: str, pdf_url: str, e
             )
         )
         
-        with ApiClient(configuration) as api_client:
-            messaging_api = MessagingApi(api_client)
-            
-            response = messaging_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[flex_message]
-                )
+        response = line_client.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[flex_message]
             )
-            
-            print(f'Flex message sent successfully: {response}')
+        )
+        
+        print(f'Flex message sent successfully: {response}')
             
     except Exception as e:
         error_message = str(e)
@@ -264,14 +236,12 @@ def send_memoir_complete_message(reply_token: str, user_id: str, pdf_url: str, e
             print(f'Reply token expired, sending push message instead: {e}')
             # Flex MessageはPush Messageとしても送信可能
             try:
-                with ApiClient(configuration) as api_client:
-                    messaging_api = MessagingApi(api_client)
-                    messaging_api.push_message(
-                        PushMessageRequest(
-                            to=user_id,
-                            messages=[flex_message]
-                        )
+                line_client.push_message(
+                    PushMessageRequest(
+                        to=user_id,
+                        messages=[flex_message]
                     )
+                )
             except Exception as push_error:
                 print(f'Error sending push message: {push_error}')
                 # フォールバック: 通常のテキストメッセージ
@@ -292,8 +262,8 @@ def send_memoir_complete_message(reply_token: str, user_id: str, pdf_url: str, e
             send_push_message(user_id, fallback_text)
 
 
-def send_memoir_updated_message(user_id: str, pdf_url: str, edit_url: str) -> None:
-    """自分史更新メッセージ（Flex Message）をプッシュ送信"""
+async def send_memoir_updated_message(user_id: str, pdf_url: str, edit_url: str) -> None:
+    """自分史更新メッセージ（Flex Message）をプッシュ送信（APIルートから await で呼ぶ）"""
     try:
         flex_message = FlexMessage(
             alt_text="✨ 自分史を更新しました！",
@@ -361,15 +331,9 @@ def send_memoir_updated_message(user_id: str, pdf_url: str, edit_url: str) -> No
         )
         
         # Push Messageとして送信（reply_tokenなし）
-        with ApiClient(configuration) as api_client:
-            messaging_api = MessagingApi(api_client)
-            messaging_api.push_message(
-                PushMessageRequest(
-                    to=user_id,
-                    messages=[flex_message]
-                )
-            )
-            print(f'Updated memoir flex message sent successfully to {user_id}')
+        request = PushMessageRequest(to=user_id, messages=[flex_message])
+        await line_client.acall(lambda api: api.push_message(request))
+        print(f'Updated memoir flex message sent successfully to {user_id}')
             
     except Exception as e:
         print(f'Error sending updated memoir flex message: {e}')
@@ -379,175 +343,277 @@ def send_memoir_updated_message(user_id: str, pdf_url: str, edit_url: str) -> No
             f"📄 PDF: {pdf_url}\n"
             f"✏️ さらに編集: {edit_url}"
         )
-        send_push_message(user_id, fallback_text)
+        try:
+            request = PushMessageRequest(to=user_id, messages=[TextMessage(text=fallback_text)])
+            await line_client.acall(lambda api: api.push_message(request))
+        except Exception as e:
+            print(f'Error sending push message: {e}')
 
 
-# テキストメッセージの処理
-@handler.add(MessageEvent, message=TextMessageContent)
-def handle_text_message(event: MessageEvent):
-    """LINE テキストメッセージイベントを処理"""
-    print(f'Received text message event: {event}')
-    
-    # メッセージ内容の確認
-    print(f'Message ID: {event.message.id}')
-    print(f'Message text: {event.message.text}')
-    print(f'Reply token: {event.reply_token}')
-    
-    user_message = event.message.text
-    user_id = event.source.user_id
+def submit_background_task(user_id: str, fn, name: str, session_id: str) -> None:
+    """時間のかかる処理をバックグラウンド実行器に登録（混雑時はユーザーに通知）
+
+    fn から user_mailbox.post() した結果の反映は、Webhookワーカーではなくこのタスクのスレッドで
+    実行されることがある（UserMailbox の実行スレッドについての約束を参照）。
+    """
+    try:
+        task_executor.submit(fn, name=name, key=session_id)
+    except TaskQueueFull as e:
+        print(f'Background queue is full: {e}')
+        send_push_message(user_id, "ただいま混み合っています。しばらくしてからもう一度お試しください。")
+
+
+def start_story_generation(user_id: str, photo_session, photo) -> None:
+    """写真のストーリーをバックグラウンドで先行生成する（メールボックス内から呼ぶ）
     
-    # 写真フロー: セッションを確認（最優先）
-    photo_session = photo_memoir_service.get_session_by_user(user_id)
+    写真ごとに別のタスクとして登録するため、複数の写真が並行して生成される
+    （同時実行数はLLMゲートウェイの全体・ユーザーごとの上限で制限）。
+    """
+    snapshot, revision = photo_memoir_service.request_story(photo)
+    photo_memoir_service.save_session(photo_session)
+    session_id = photo_session.session_id
     
-    # 写真フロー: 写真収集中に「完了」
-    if photo_session and photo_session.state == "collecting_photos" and ("完了" in user_message or "おわり" in user_message or "終わり" in user_message):
-        try:
-            success, response = photo_memoir_service.finish_photo_collection(photo_session)
-            send_text_message_with_fallback(event.reply_token, user_id, response)
-            
-            if success:
-                # 最初の質問を送信
-                question_info = photo_memoir_service.get_current_question(photo_session)
-                if question_info:
-                    question, photo, q_num = question_info
-                    send_push_message(user_id, question)
+    def apply_story(story):
+        # キャンセル済み、または再生成・修正で新しい依頼があれば結果を捨てる
+        session = photo_memoir_service.get_session(session_id)
+        if session is None:
             return
-        except Exception as e:
-            error_message = f"エラーが発生しました: {str(e)}"
-            send_text_message_with_fallback(event.reply_token, user_id, error_message)
+        applied = photo_memoir_service.apply_story(session, snapshot.photo_id, revision, story)
+        if applied is None:
             return
+        
+        # 確認中の写真のストーリーなら承認メッセージを送信
+        if session.state == "story_generated" and session.get_current_photo() is applied:
+            current, total = session.get_progress()
+            approval_msg = photo_memoir_service.get_story_approval_message(session, story)
+            send_push_message(user_id, f"（{current}/{total}枚目）\n{approval_msg}")
+        
+        # 最後のストーリーが揃ったら下書きPDFを先行生成
+        start_draft_pdf(user_id, session)
     
-    # 写真フロー: 質問に対する回答
-    if photo_session and photo_session.state == "questioning":
+    def generate_story_async():
         try:
-            response_msg, needs_action = photo_memoir_service.process_answer(photo_session, user_message)
-            send_text_message_with_fallback(event.reply_token, user_id, response_msg)
-            
-            if needs_action:
-                # ストーリー生成が必要
-                import threading
-                
-                def generate_story_async():
-                    try:
-                        photo = photo_session.get_current_photo()
-                        if photo:
-                            # ストーリー生成
-                            story = photo_memoir_service.generate_story_for_photo(photo)
-                            photo.generated_story = story
-                            photo_session.state = "story_generated"
-                            
-                            # 承認メッセージを送信
-                            approval_msg = photo_memoir_service.get_story_approval_message(photo_session, story)
-                            send_push_message(user_id, approval_msg)
-                    except Exception as e:
-                        error_msg = f"ストーリー生成中にエラーが発生しました: {str(e)}"
-                        send_push_message(user_id, error_msg)
-                
-                story_thread = threading.Thread(target=generate_story_async)
-                story_thread.start()
-            
-            return
+            # ストーリー生成（セッションの更新はユーザーのメールボックスで行う）
+            story = photo_memoir_service.generate_story_for_photo(snapshot, user_id)
+            user_mailbox.post(user_id, apply_story, story)
         except Exception as e:
-            error_message = f"エラーが発生しました: {str(e)}"
-            send_text_message_with_fallback(event.reply_token, user_id, error_message)
+            error_msg = f"ストーリー生成中にエラーが発生しました: {str(e)}\n「再生成」と送信するともう一度生成します。"
+            send_push_message(user_id, error_msg)
+    
+    submit_background_task(user_id, generate_story_async, "photo_story", session_id)
+
+
+def start_draft_pdf(user_id: str, photo_session) -> None:
+    """全ストーリーが揃っていれば、承認を待たずに下書きPDFを生成しておく（メールボックス内から呼ぶ）"""
+    if not settings.PHOTO_DRAFT_PDF_ENABLED or photo_session.state != "story_generated":
+        return
+    if not photo_memoir_service.all_stories_ready(photo_session):
+        return
+    fingerprint = photo_memoir_service.stories_fingerprint(photo_session)
+    if photo_session.draft_pdf_fingerprint == fingerprint:
+        return
+    session_id = photo_session.session_id
+    
+    def apply_draft_pdf(pdf_result):
+        session = photo_memoir_service.get_session(session_id)
+        if session is None:
+            # 生成中にキャンセルされた
+            Path(pdf_result["path"]).unlink(missing_ok=True)
             return
+        photo_memoir_service.set_draft_pdf(session, pdf_result, fingerprint)
     
-    # 写真フロー: ストーリー承認・再生成
-    if photo_session and photo_session.state == "story_generated":
+    def generate_draft_pdf_async():
         try:
-            response_msg, move_next = photo_memoir_service.handle_story_approval(photo_session, user_message)
-            send_text_message_with_fallback(event.reply_token, user_id, response_msg)
-            
-            if move_next:
-                import threading
-                
-                def handle_next_action():
-                    try:
-                        if photo_session.state == "completed":
-                            # 全写真完了 → PDF生成
-                            pdf_result = photo_memoir_service.generate_pdf(photo_session)
-                            
-                            # PDFファイルを保存
-                            file_metadata = file_service.save_file(
-                                pdf_result["pdf_buffer"],
-                                pdf_result["filename"],
-                                "application/pdf"
-                            )
-                            
-                            pdf_url = file_service.get_file_url(file_metadata['file_id'], settings.BASE_URL)
-                            
-                            success_message = (
-                                f"✨ 写真自分史が完成しました！\n\n"
-                                f"📄 PDF: {pdf_url}\n"
-                                f"ファイル名: {pdf_result['filename']}\n"
-                                f"サイズ: {pdf_result['size']:,} bytes"
-                            )
-                            send_push_message(user_id, success_message)
-                        
-                        elif "再生成" in response_msg:
-                            # 再生成
-                            photo = photo_session.get_current_photo()
-                            if photo:
-                                story = photo_memoir_service.generate_story_for_photo(photo)
-                                photo.generated_story = story
-                                
-                                approval_msg = photo_memoir_service.get_story_approval_message(photo_session, story)
-                                send_push_message(user_id, approval_msg)
-                        
-                        else:
-                            # 次の写真の最初の質問を送信
-                            question_info = photo_memoir_service.get_current_question(photo_session)
-                            if question_info:
-                                question, photo, q_num = question_info
-                                send_push_message(user_id, question)
-                    
-                    except Exception as e:
-                        error_msg = f"処理中にエラーが発生しました: {str(e)}"
-                        send_push_message(user_id, error_msg)
-                
-                action_thread = threading.Thread(target=handle_next_action)
-                action_thread.start()
-            
-            return
+            pdf_result = photo_memoir_service.generate_pdf(photo_session, draft=True)
+            user_mailbox.post(user_id, apply_draft_pdf, pdf_result)
         except Exception as e:
-            error_message = f"エラーが発生しました: {str(e)}"
-            send_text_message_with_fallback(event.reply_token, user_id, error_message)
-            return
+            # 下書きは先行処理なので、失敗しても承認後に改めて生成する
+            print(f'Draft PDF generation failed: {e}')
     
-    # 簡易フローのセッションを確認（優先）
-    quick_session = quick_memoir_service.get_session_by_user(user_id)
+    submit_background_task(user_id, generate_draft_pdf_async, "photo_draft_pdf", session_id)
+
+
+def finish_photo_memoir(user_id: str, photo_session) -> None:
+    """全写真の承認後にPDFを送信（下書きPDFが今のストーリーと一致すればそれを使う。メールボックス内から呼ぶ）"""
+    session_id = photo_session.session_id
     
-    # 簡易フロー: 「作る」などのトリガーワード
-    if quick_memoir_service.is_quick_create_request(user_message):
-        try:
-            session, response = quick_memoir_service.start_quick_create(user_id)
-            send_text_message_with_fallback(event.reply_token, user_id, response)
-            return
-        except Exception as e:
-            error_message = f"エラーが発生しました: {str(e)}"
-            send_text_message_with_fallback(event.reply_token, user_id, error_message)
+    def apply_pdf(pdf_result):
+        if photo_memoir_service.get_session(session_id) is None:
+            # 生成中にキャンセルされた
+            Path(pdf_result["path"]).unlink(missing_ok=True)
             return
+        
+        # PDFファイルを保存
+        file_metadata = file_service.register_file(
+            pdf_result["path"],
+            pdf_result["filename"],
+            "application/pdf"
+        )
+        
+        pdf_url = file_service.get_file_url(file_metadata['file_id'], settings.BASE_URL)
+        
+        success_message = (
+            f"✨ 写真自分史が完成しました！\n\n"
+            f"📄 PDF: {pdf_url}\n"
+            f"ファイル名: {pdf_result['filename']}\n"
+            f"サイズ: {pdf_result['size']:,} bytes"
+        )
+        send_push_message(user_id, success_message)
     
-    # 簡易フロー: タイトル待ち
-    if quick_session and quick_session.state == "waiting_title":
+    draft = photo_memoir_service.take_draft_pdf(photo_session)
+    if draft is not None:
+        apply_pdf(draft)
+        return
+    
+    def generate_pdf_async():
         try:
-            response = quick_memoir_service.process_title(quick_session, user_message)
-            send_text_message_with_fallback(event.reply_token, user_id, response)
-            return
+            pdf_result = photo_memoir_service.generate_pdf(photo_session)
+            user_mailbox.post(user_id, apply_pdf, pdf_result)
         except Exception as e:
-            error_message = f"エラーが発生しました: {str(e)}"
-            send_text_message_with_fallback(event.reply_token, user_id, error_message)
-            return
+            error_msg = f"処理中にエラーが発生しました: {str(e)}"
+            send_push_message(user_id, error_msg)
     
-    # 特定のコマンドでファイル一覧表示
-    if user_message.lower().startswith('ファイル一覧') or user_message.lower().startswith('files'):
-        handle_file_list_command(event.reply_token)
-    # サンプル確認コマンド
-    elif user_message.lower() == 'サンプル確認':
-        handle_sample_command(event.reply_token)
-    else:
-        # 通常のChatGPT応答
-        handle_chatgpt_response(event)
+    submit_background_task(user_id, generate_pdf_async, "photo_pdf", session_id)
+
+
+# テキストメッセージの振り分け（ルート表）
+def handle_photo_finish(ctx: RouteContext) -> None:
+    """写真フロー: 写真収集中に「完了」"""
+    event, user_id, photo_session = ctx.event, ctx.user_id, ctx.session("photo")
+    try:
+        success, response = photo_memoir_service.finish_photo_collection(photo_session)
+        send_text_message_with_fallback(event.reply_token, user_id, response)
+        
+        if success:
+            # 最初の質問を送信
+            question_info = photo_memoir_service.get_current_question(photo_session)
+            if question_info:
+                question, photo, q_num = question_info
+                send_push_message(user_id, question)
+    except Exception as e:
+        error_message = f"エラーが発生しました: {str(e)}"
+        send_text_message_with_fallback(event.reply_token, user_id, error_message)
+
+
+def handle_photo_answer(ctx: RouteContext) -> None:
+    """写真フロー: 質問に対する回答"""
+    event, user_id, photo_session = ctx.event, ctx.user_id, ctx.session("photo")
+    try:
+        # 回答が揃うと次の写真に進むため、回答した写真を先に取っておく
+        photo = photo_session.get_current_photo()
+        response_msg, needs_action = photo_memoir_service.process_answer(photo_session, ctx.text)
+        send_text_message_with_fallback(event.reply_token, user_id, response_msg)
+        
+        if needs_action and photo:
+            # ストーリーを先行生成（ユーザーは生成を待たずに次の写真の質問に答えられる）
+            start_story_generation(user_id, photo_session, photo)
+    except Exception as e:
+        error_message = f"エラーが発生しました: {str(e)}"
+        send_text_message_with_fallback(event.reply_token, user_id, error_message)
+
+
+def handle_photo_story_approval(ctx: RouteContext) -> None:
+    """写真フロー: ストーリー承認・再生成"""
+    event, user_id, photo_session = ctx.event, ctx.user_id, ctx.session("photo")
+    try:
+        response_msg, needs_action = photo_memoir_service.handle_story_approval(photo_session, ctx.text)
+        send_text_message_with_fallback(event.reply_token, user_id, response_msg)
+        
+        if needs_action:
+            if photo_session.state == "completed":
+                # 全写真完了 → PDF（下書きがあればすぐに送信）
+                finish_photo_memoir(user_id, photo_session)
+            else:
+                # 再生成・修正
+                start_story_generation(user_id, photo_session, photo_session.get_current_photo())
+    except Exception as e:
+        error_message = f"エラーが発生しました: {str(e)}"
+        send_text_message_with_fallback(event.reply_token, user_id, error_message)
+
+
+def handle_flow_cancel(ctx: RouteContext) -> None:
+    """写真・簡易フローのキャンセル"""
+    cancelled = False
+    for service, flow in ((photo_memoir_service, "photo"), (quick_memoir_service, "quick")):
+        session = ctx.session(flow)
+        if session is not None:
+            cancelled = service.cancel_session(session.session_id) or cancelled
+    response = "自分史作成をキャンセルしました。通常のチャットモードに戻ります。" if cancelled else "キャンセルする作成中の自分史はありません。"
+    send_text_message_with_fallback(ctx.event.reply_token, ctx.user_id, response)
+
+
+def handle_quick_create(ctx: RouteContext) -> None:
+    """簡易フロー: 「作る」などのトリガーワード"""
+    event, user_id = ctx.event, ctx.user_id
+    try:
+        session, response = quick_memoir_service.start_quick_create(user_id)
+        send_text_message_with_fallback(event.reply_token, user_id, response)
+    except Exception as e:
+        error_message = f"エラーが発生しました: {str(e)}"
+        send_text_message_with_fallback(event.reply_token, user_id, error_message)
+
+
+def handle_quick_title(ctx: RouteContext) -> None:
+    """簡易フロー: タイトル待ち"""
+    event, user_id = ctx.event, ctx.user_id
+    try:
+        response = quick_memoir_service.process_title(ctx.session("quick"), ctx.text)
+        send_text_message_with_fallback(event.reply_token, user_id, response)
+    except Exception as e:
+        error_message = f"エラーが発生しました: {str(e)}"
+        send_text_message_with_fallback(event.reply_token, user_id, error_message)
+
+
+def handle_file_generation(ctx: RouteContext) -> None:
+    """ファイル生成コマンド（レポート作成など）"""
+    send_text_message(ctx.event.reply_token, handle_file_generation_request(ctx.text))
+
+
+def _in_flow(ctx: RouteContext) -> bool:
+    return ctx.session("photo") is not None or ctx.session("quick") is not None
+
+
+# 上から順に条件を確認し、最初に一致したルートで処理する（写真フロー → 簡易フロー → コマンド → ChatGPT の優先順）
+text_message_router = MessageRouter(
+    KeywordMatcher({
+        "photo_finish": PhotoMemoirService.FINISH_KEYWORDS,
+        "quick_create": QuickMemoirService.TRIGGER_KEYWORDS,
+        "file_generation": FILE_GENERATION_KEYWORDS,
+        "cancel": MemoirService.CANCEL_WORDS,
+        "file_list": ("ファイル一覧", "files"),
+        "sample": ("サンプル確認",),
+    }),
+    flows={
+        "photo": photo_memoir_service.get_session_by_user,
+        "quick": quick_memoir_service.get_session_by_user,
+    },
+    routes=[
+        Route("flow_cancel", lambda c: c.hits.equals("cancel") and _in_flow(c), handle_flow_cancel),
+        Route("photo_finish", lambda c: c.hits.has("photo_finish") and c.state("photo") == "collecting_photos", handle_photo_finish),
+        Route("photo_answer", lambda c: c.state("photo") == "questioning", handle_photo_answer),
+        Route("photo_story_approval", lambda c: c.state("photo") == "story_generated", handle_photo_story_approval),
+        Route("quick_create", lambda c: c.hits.has("quick_create"), handle_quick_create),
+        Route("quick_title", lambda c: c.state("quick") == "waiting_title", handle_quick_title),
+        Route("file_list", lambda c: c.hits.starts_with("file_list"), lambda c: handle_file_list_command(c.event.reply_token)),
+        Route("sample", lambda c: c.hits.equals("sample"), lambda c: handle_sample_command(c.event.reply_token)),
+        Route("file_generation", lambda c: c.hits.has("file_generation"), handle_file_generation),
+        Route("chatgpt", lambda c: True, lambda c: handle_chatgpt_response(c.event)),
+    ]
+)
+
+
+# テキストメッセージの処理
+@handler.add(MessageEvent, message=TextMessageContent)
+def handle_text_message(event: MessageEvent):
+    """LINE テキストメッセージイベントを処理"""
+    print(f'Received text message event: {event}')
+    
+    # メッセージ内容の確認
+    print(f'Message ID: {event.message.id}')
+    print(f'Message text: {event.message.text}')
+    print(f'Reply token: {event.reply_token}')
+    
+    text_message_router.dispatch(event)
 
 def handle_sample_command(reply_token: str):
     """サンプルPDFファイル一覧を返信"""
@@ -590,12 +656,9 @@ def handle_image_message(event: MessageEvent):
     print(f'Received image message event: {event}')
     
     try:
-        # LINE Platform APIから画像をダウンロード
-        image_data = download_file_from_line(event.message.id)
-        
-        # 画像ファイルを保存
-        file_metadata = file_service.save_file(
-            image_data,
+        # LINE Platform APIから画像をダウンロードしながら保存
+        file_metadata = file_service.save_stream(
+            stream_file_from_line(event.message.id),
             f"received_image_{event.message.id}.jpg",
             "image/jpeg"
         )
@@ -631,35 +694,38 @@ def handle_image_message(event: MessageEvent):
                 
                 # 非同期でPDF生成
                 if success:
-                    import threading
+                    def apply_quick_pdf(pdf_result):
+                        if quick_memoir_service.get_session(quick_session.session_id) is None:
+                            # 生成中にキャンセルされた
+                            Path(pdf_result["path"]).unlink(missing_ok=True)
+                            return
+                        
+                        # PDFファイルを保存
+                        pdf_metadata = file_service.register_file(
+                            pdf_result["path"],
+                            pdf_result["filename"],
+                            "application/pdf"
+                        )
+                        
+                        # URLを生成
+                        pdf_url = file_service.get_file_url(pdf_metadata['file_id'], settings.BASE_URL)
+                        edit_url = f"{settings.BASE_URL}/liff/edit.html?session_id={quick_session.session_id}"
+                        
+                        # Flex Messageを送信（reply_tokenは期限切れなので、空文字でPush扱い）
+                        send_memoir_complete_message("", user_id, pdf_url, edit_url)
                     
                     def generate_quick_pdf_async():
                         try:
-                            # PDF生成（async関数をスレッド内で実行）
-                            import asyncio
-                            pdf_result = asyncio.run(quick_memoir_service.generate_quick_pdf(quick_session))
-                            
-                            # PDFファイルを保存
-                            pdf_metadata = file_service.save_file(
-                                pdf_result["pdf_buffer"],
-                                pdf_result["filename"],
-                                "application/pdf"
-                            )
-                            
-                            # URLを生成
-                            pdf_url = file_service.get_file_url(pdf_metadata['file_id'], settings.BASE_URL)
-                            edit_url = f"{settings.BASE_URL}/liff/edit.html?session_id={quick_session.session_id}"
-                            
-                            # Flex Messageを送信（reply_tokenは期限切れなので、空文字でPush扱い）
-                            send_memoir_complete_message("", user_id, pdf_url, edit_url)
+                            # PDF生成（async関数は実行器の共有イベントループで実行）
+                            pdf_result = task_executor.run_coroutine(quick_memoir_service.generate_quick_pdf(quick_session))
+                            user_mailbox.post(user_id, apply_quick_pdf, pdf_result)
                             
                         except Exception as e:
                             error_message = f"PDF生成中にエラーが発生しました: {str(e)}"
                             send_push_message(user_id, error_message)
                     
-                    # 非同期スレッドを開始
-                    pdf_thread = threading.Thread(target=generate_quick_pdf_async)
-                    pdf_thread.start()
+                    # バックグラウンドで実行
+                    submit_background_task(user_id, generate_quick_pdf_async, "quick_pdf", quick_session.session_id)
                 
                 return
             except Exception as e:
@@ -706,7 +772,7 @@ def handle_chatgpt_response(event: MessageEvent):
     """ChatGPT応答を処理"""
     try:
         # ChatGPTからレスポンスを取得
-        chatgpt_response = get_chatgpt_response(event.message.text)
+        chatgpt_response = get_chatgpt_response(event.message.text, event.source.user_id)
         send_text_message(event.reply_token, chatgpt_response)
         
     except Exception as e:
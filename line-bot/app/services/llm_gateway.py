@@ -0,0 +1,357 @@
+"""
+LLM（OpenAI Chat Completions）の共有ゲートウェイ（接続プール・同時実行数の制限・リトライ・期限付き）
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# リトライするHTTPステータス（レート制限・サーバーエラー）
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+
+class LLMError(Exception):
+    """LLMの呼び出しに失敗した"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None,
+                 retryable: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.retryable = retryable or status in RETRYABLE_STATUS
+
+
+class LLMTimeout(LLMError):
+    """期限までに応答が得られなかった"""
+
+    def __init__(self, message: str):
+        super().__init__(message, retryable=False)
+
+
+class OpenAIBackend:
+    """OpenAI API を呼び出すバックエンド（httpxの接続プールを共有する AsyncOpenAI）
+
+    リトライはゲートウェイで行うため、SDKのリトライは無効にする。
+    """
+
+    def __init__(self, api_key: Optional[str] = None, max_connections: Optional[int] = None):
+        self.api_key = api_key or settings.OPENAI_API_KEY
+        self.max_connections = max_connections or settings.LLM_MAX_CONNECTIONS
+        self._client = None
+
+    async def open(self) -> None:
+        # httpxのクライアントは使用するイベントループ上で作る
+        http_client = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections
+        ))
+        self._client = AsyncOpenAI(api_key=self.api_key, http_client=http_client, max_retries=0)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                       temperature: float, timeout: float) -> str:
+        try:
+            completion = await self._client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout
+            )
+        except openai.APIStatusError as e:
+            retry_after = e.response.headers.get("retry-after")
+            try:
+                retry_after = float(retry_after) if retry_after else None
+            except ValueError:
+                retry_after = None
+            raise LLMError(str(e), status=e.status_code, retry_after=retry_after) from e
+        except (openai.APIConnectionError, openai.APITimeoutError) as e:
+            raise LLMError(str(e), retryable=True) from e
+        return completion.choices[0].message.content or ""
+
+
+class MockBackend:
+    """オフライン用のバックエンド（API キーなしでの動作確認・テスト用）
+
+    Args:
+        responder: メッセージ一覧から応答文を作る関数（省略時は最後のユーザー発話を使った定型文）
+        latency: 1回の呼び出しにかかる時間（秒）
+        errors: 先頭から順に返すエラーのHTTPステータス（リトライの確認用）
+    """
+
+    def __init__(self, responder: Optional[Callable[[List[Dict[str, str]]], str]] = None,
+                 latency: float = 0.0, errors: Optional[List[int]] = None):
+        self.responder = responder
+        self.latency = latency
+        self.errors = list(errors or [])
+        self.calls = 0
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                       temperature: float, timeout: float) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.errors:
+            status = self.errors.pop(0)
+            raise LLMError(f"モックのエラー応答: {status}", status=status)
+        if self.responder is not None:
+            return self.responder(messages)
+        user_message = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        return f"（モック応答）{user_message[:50]}"
+
+
+def create_backend(name: Optional[str] = None):
+    """設定（LLM_BACKEND）に応じたバックエンドを作成"""
+    name = (name or settings.LLM_BACKEND).lower()
+    if name == "mock":
+        return MockBackend()
+    if name == "openai":
+        return OpenAIBackend()
+    raise ValueError(f"未対応のLLMバックエンドです: {name}")
+
+
+class LLMGateway:
+    """LLMの共有ゲートウェイ
+
+    専用スレッドのイベントループ上でバックエンド（接続プール）を1つだけ使い、すべての生成処理で共有する。
+    同期コード（Webhookハンドラーやバックグラウンドスレッド）からは complete() で、
+    非同期コード（FastAPIのエンドポイント）からは await acomplete() で呼び出す。
+
+    - 同時実行数は全体で LLM_MAX_CONCURRENCY、ユーザーごとに LLM_PER_USER_CONCURRENCY まで
+    - 429・5xx・接続エラーは指数バックオフ（ジッター付き、Retry-After を優先）で LLM_MAX_RETRIES 回までリトライ
+    - 期限（timeout 秒、省略時は LLM_TIMEOUT）は空き待ち・リトライ待ち・各リクエストのタイムアウトに引き継ぐ
+    """
+
+    # complete() が期限を過ぎてから結果を待つ猶予（秒）。過ぎたら生成を打ち切って LLMTimeout
+    RESULT_GRACE = 1.0
+
+    def __init__(self, backend: Any = None, max_concurrency: Optional[int] = None,
+                 per_user_concurrency: Optional[int] = None, max_retries: Optional[int] = None,
+                 retry_base_delay: Optional[float] = None, retry_max_delay: Optional[float] = None):
+        self.backend = backend if backend is not None else create_backend()
+        self.max_concurrency = max(1, max_concurrency or settings.LLM_MAX_CONCURRENCY)
+        self.per_user_concurrency = max(1, per_user_concurrency or settings.LLM_PER_USER_CONCURRENCY)
+        self.max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_base_delay = settings.LLM_RETRY_BASE_DELAY if retry_base_delay is None else retry_base_delay
+        self.retry_max_delay = settings.LLM_RETRY_MAX_DELAY if retry_max_delay is None else retry_max_delay
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # セマフォはゲートウェイのイベントループ上で作る
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._user_slots: Dict[str, asyncio.Semaphore] = {}
+        self._user_waiters: Dict[str, int] = {}
+        self.stats = {
+            "requests": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "retries": 0,
+            "cancelled": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "total_wait": 0.0,
+            "total_time": 0.0
+        }
+
+    def start(self) -> None:
+        """イベントループのスレッドとバックエンドを起動"""
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True)
+            thread.start()
+            asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+            self._loop, self._thread = loop, thread
+        logger.info(
+            f"LLMゲートウェイを起動（{type(self.backend).__name__}, 同時実行数: {self.max_concurrency}, "
+            f"ユーザーごと: {self.per_user_concurrency}）"
+        )
+
+    async def _open(self) -> None:
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        await self.backend.open()
+
+    def stop(self) -> None:
+        """バックエンドを閉じてイベントループを停止"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self.backend.close(), loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"LLMゲートウェイの終了エラー: {e}")
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+            self._loop = self._thread = self._slots = None
+            self._user_slots.clear()
+            self._user_waiters.clear()
+        logger.info("LLMゲートウェイを停止")
+
+    def complete(self, messages: List[Dict[str, str]], *, model: str = "gpt-4o-mini", max_tokens: int = 500,
+                 temperature: float = 0.7, user_id: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """同期コードから文章を生成する（期限を過ぎると LLMTimeout）"""
+        deadline = time.monotonic() + (timeout or settings.LLM_TIMEOUT)
+        future = self._submit(messages, model, max_tokens, temperature, user_id, deadline)
+        # ゲートウェイ側で期限を守るため、ここでは少し余裕を持って待つ
+        try:
+            return future.result(max(0.0, deadline - time.monotonic()) + self.RESULT_GRACE)
+        except concurrent.futures.TimeoutError:
+            # イベントループが詰まっているなどで期限内に終わらなかった。ループ上の生成も打ち切る
+            future.cancel()
+            raise LLMTimeout("LLMの応答を待つ間に期限を過ぎました")
+
+    async def acomplete(self, messages: List[Dict[str, str]], *, model: str = "gpt-4o-mini", max_tokens: int = 500,
+                        temperature: float = 0.7, user_id: Optional[str] = None,
+                        timeout: Optional[float] = None) -> str:
+        """非同期コードから文章を生成する（呼び出し元のイベントループはブロックしない）"""
+        deadline = time.monotonic() + (timeout or settings.LLM_TIMEOUT)
+        future = self._submit(messages, model, max_tokens, temperature, user_id, deadline)
+        return await asyncio.wrap_future(future)
+
+    def _submit(self, messages, model, max_tokens, temperature, user_id, deadline):
+        if self._loop is None:
+            # 起動前（スクリプトやテストなど）に呼ばれた場合はその場で起動する
+            self.start()
+        return asyncio.run_coroutine_threadsafe(
+            self._complete(messages, model, max_tokens, temperature, user_id, deadline), self._loop
+        )
+
+    async def _acquire(self, semaphore: asyncio.Semaphore, deadline: float) -> None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError
+        await asyncio.wait_for(semaphore.acquire(), remaining)
+
+    async def _complete(self, messages: List[Dict[str, str]], model: str, max_tokens: int, temperature: float,
+                        user_id: Optional[str], deadline: float) -> str:
+        started = time.monotonic()
+        self.stats["requests"] += 1
+        user_slots = None
+        if user_id is not None:
+            user_slots = self._user_slots.setdefault(user_id, asyncio.Semaphore(self.per_user_concurrency))
+            self._user_waiters[user_id] = self._user_waiters.get(user_id, 0) + 1
+        try:
+            # ユーザーごと → 全体の順に空きを待つ（1人のユーザーが全体の枠を占有しないように）
+            try:
+                if user_slots is not None:
+                    await self._acquire(user_slots, deadline)
+                try:
+                    await self._acquire(self._slots, deadline)
+                except BaseException:
+                    if user_slots is not None:
+                        user_slots.release()
+                    raise
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                raise LLMTimeout("LLMの空きを待つ間に期限を過ぎました")
+
+            self.stats["total_wait"] += time.monotonic() - started
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            try:
+                text = await self._call_with_retry(messages, model, max_tokens, temperature, deadline)
+            finally:
+                self.stats["in_flight"] -= 1
+                self._slots.release()
+                if user_slots is not None:
+                    user_slots.release()
+            self.stats["succeeded"] += 1
+            return text
+        except asyncio.CancelledError:
+            # 呼び出し元が待つのをやめた（complete() の期限切れ・acomplete() の呼び出し元のキャンセル）
+            self.stats["cancelled"] += 1
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.stats["total_time"] += time.monotonic() - started
+            if user_id is not None:
+                # 待っているリクエストがなくなったユーザーのセマフォは破棄する
+                self._user_waiters[user_id] -= 1
+                if self._user_waiters[user_id] == 0:
+                    del self._user_waiters[user_id]
+                    del self._user_slots[user_id]
+
+    async def _call_with_retry(self, messages: List[Dict[str, str]], model: str, max_tokens: int,
+                               temperature: float, deadline: float) -> str:
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.stats["timeouts"] += 1
+                raise LLMTimeout("LLMの応答を待つ間に期限を過ぎました")
+            try:
+                return await asyncio.wait_for(
+                    self.backend.complete(model, messages, max_tokens, temperature, remaining), remaining
+                )
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                raise LLMTimeout("LLMの応答を待つ間に期限を過ぎました")
+            except LLMError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt))
+                delay = delay * (0.5 + random.random() / 2)
+                if e.retry_after is not None:
+                    delay = max(delay, e.retry_after)
+                if time.monotonic() + delay >= deadline:
+                    # 待っても期限までに再試行できない
+                    raise
+                attempt += 1
+                self.stats["retries"] += 1
+                logger.warning(f"LLMの呼び出しをリトライします（{attempt}回目, {delay:.2f}秒後）: {e}")
+                await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """ゲートウェイの状態を取得"""
+        stats = dict(self.stats)
+        finished = stats["succeeded"] + stats["failed"]
+        return {
+            "running": self._loop is not None,
+            "backend": type(self.backend).__name__,
+            "max_concurrency": self.max_concurrency,
+            "per_user_concurrency": self.per_user_concurrency,
+            "requests": stats["requests"],
+            "succeeded": stats["succeeded"],
+            "failed": stats["failed"],
+            "timeouts": stats["timeouts"],
+            "retries": stats["retries"],
+            "cancelled": stats["cancelled"],
+            "in_flight": stats["in_flight"],
+            "max_in_flight": stats["max_in_flight"],
+            "active_users": len(self._user_slots),
+            "avg_wait": stats["total_wait"] / finished if finished else 0.0,
+            "avg_time": stats["total_time"] / finished if finished else 0.0
+        }
+
+
+# グローバルインスタンス
+llm_gateway = LLMGateway()
@@ -3,6 +3,7 @@ from datetime import datetime
 from typing import Dict, Any, Optional, List
 from dataclasses import dataclass, asdict
 from ..config import settings
+from .session_store import create_session_store
 
 @dataclass
 class MemoirData:
@@ -47,33 +48,52 @@ class MemoirSession:
 class MemoirService:
     """自分史作成サービス"""
     
+    # キャンセル・ヘルプのコマンド（メッセージ全体と一致した場合）
+    CANCEL_WORDS = ('キャンセル', 'cancel', 'やめる')
+    HELP_WORDS = ('ヘルプ', 'help', '?', '？')
+    
     def __init__(self):
-        self.sessions: Dict[str, MemoirSession] = {}
+        # ユーザーIDごとに保存（一定期間操作がないセッションは期限切れになる）
+        self.sessions = create_session_store("memoir", MemoirSession)
     
     
     def get_or_create_session(self, user_id: str) -> MemoirSession:
         """ユーザーセッションを取得または作成"""
-        if user_id not in self.sessions:
-            self.sessions[user_id] = MemoirSession(user_id=user_id)
-        return self.sessions[user_id]
+        session = self.sessions.get(user_id)
+        if session is None:
+            session = MemoirSession(user_id=user_id)
+            self.sessions.put(user_id, session)
+        return session
+    
+    def save_session(self, session: MemoirSession) -> None:
+        """変更したセッションを保存"""
+        self.sessions.put(session.user_id, session)
     
     def cancel_session(self, user_id: str) -> None:
         """セッションをキャンセル"""
-        if user_id in self.sessions:
-            del self.sessions[user_id]
+        self.sessions.delete(user_id)
     
     def process_message(self, user_id: str, message: str) -> str:
         """メッセージを処理して応答を生成"""
         session = self.get_or_create_session(user_id)
         session.updated_at = datetime.now()
+        response = self._handle_message(session, message)
+        # キャンセル（削除）されたセッションは保存し直さない
+        if self.sessions.get(user_id) is not None:
+            self.save_session(session)
+        return response
+    
+    def _handle_message(self, session: MemoirSession, message: str) -> str:
+        """状態に応じてメッセージを処理"""
+        user_id = session.user_id
         
         # キャンセル処理
-        if message.lower() in ['キャンセル', 'cancel', 'やめる']:
+        if message.lower() in self.CANCEL_WORDS:
             self.cancel_session(user_id)
             return "自分史作成をキャンセルしました。通常のチャットモードに戻ります。"
         
         # ヘルプ表示
-        if message.lower() in ['ヘルプ', 'help', '?', '？']:
+        if message.lower() in self.HELP_WORDS:
             return self._show_help(session)
         
         # 状態に応じた処理
@@ -321,6 +341,7 @@ class MemoirService:
         except Exception as e:
             # セッションをリセット
             session.state = "idle"
+            self.save_session(session)
             raise Exception(f"PDF生成に失敗しました: {str(e)}")
     
     def _prepare_memoir_data(self, data: MemoirData) -> Dict[str, Any]:
@@ -375,6 +396,7 @@ class MemoirService:
         latest_item = session.data.timeline[-1]
         latest_item["image"] = image_url
         latest_item["imageCaption"] = caption
+        self.save_session(session)
         
         return True
 
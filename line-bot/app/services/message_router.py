@@ -0,0 +1,182 @@
+"""
+テキストメッセージの振り分け（キーワード照合とルート表による1回の走査でハンドラーを決める）
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class KeywordHits:
+    """キーワード照合の結果（タグごと）"""
+    found: Set[str] = field(default_factory=set)    # どこかに含まれる
+    prefix: Set[str] = field(default_factory=set)   # 先頭に含まれる
+    exact: Set[str] = field(default_factory=set)    # メッセージ全体と一致する
+
+    def has(self, tag: str) -> bool:
+        return tag in self.found
+
+    def starts_with(self, tag: str) -> bool:
+        return tag in self.prefix
+
+    def equals(self, tag: str) -> bool:
+        return tag in self.exact
+
+
+class KeywordMatcher:
+    """複数のキーワードを1回の走査で照合する（Aho-Corasick法）
+
+    キーワードはタグごとにまとめて登録し、メッセージ中に現れたタグを KeywordHits で返す。
+    照合は大文字・小文字を区別しない（キーワードもメッセージも小文字にして比べる）。
+    """
+
+    def __init__(self, keywords: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, int]]] = [[]]
+        for tag, words in keywords.items():
+            for word in words:
+                self._add(word.lower(), tag)
+        self._build()
+
+    def _add(self, word: str, tag: str) -> None:
+        state = 0
+        for ch in word:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((tag, len(word)))
+
+    def _build(self) -> None:
+        """失敗遷移を幅優先で作り、接尾辞で一致するキーワードを出力に含める"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def scan(self, text: str) -> KeywordHits:
+        """メッセージを照合"""
+        hits = KeywordHits()
+        text = text.lower()
+        last = len(text)
+        state = 0
+        for index, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for tag, length in self._out[state]:
+                hits.found.add(tag)
+                if index + 1 == length:
+                    hits.prefix.add(tag)
+                    if length == last:
+                        hits.exact.add(tag)
+        return hits
+
+
+class RouteContext:
+    """1件のメッセージの振り分けに使う情報
+
+    フローのセッションは必要になったときに1回だけ引く（ユーザーID → セッションの索引を使うため O(1)）。
+    """
+
+    def __init__(self, event: Any, text: str, user_id: str, hits: KeywordHits,
+                 flows: Dict[str, Callable[[str], Any]]):
+        self.event = event
+        self.text = text
+        self.user_id = user_id
+        self.hits = hits
+        self._flows = flows
+        self._sessions: Dict[str, Any] = {}
+
+    def session(self, flow: str) -> Any:
+        """ユーザーのフロー（"photo", "quick" など）のアクティブなセッション（なければNone）"""
+        if flow not in self._sessions:
+            self._sessions[flow] = self._flows[flow](self.user_id)
+        return self._sessions[flow]
+
+    def state(self, flow: str) -> Optional[str]:
+        """フローのセッションの状態（セッションがなければNone）"""
+        session = self.session(flow)
+        return session.state if session is not None else None
+
+
+@dataclass
+class Route:
+    """ルート表の1行（when が真になった最初のルートの handler を呼ぶ）"""
+    name: str
+    when: Callable[[RouteContext], bool]
+    handler: Callable[[RouteContext], None]
+
+
+class MessageRouter:
+    """ルート表に沿ってテキストメッセージを振り分ける
+
+    キーワードはメッセージごとに1回だけ照合し、ルート表を先頭から1回だけ走査して最初に条件を満たしたルートで処理する。
+    ルートごとに処理件数・エラー数・処理時間を記録する。
+    """
+
+    def __init__(self, matcher: KeywordMatcher, flows: Dict[str, Callable[[str], Any]], routes: List[Route]):
+        self.matcher = matcher
+        self.flows = flows
+        self.routes = routes
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, float]] = {
+            route.name: {"count": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0} for route in routes
+        }
+
+    def dispatch(self, event: Any) -> str:
+        """メッセージを処理し、使ったルートの名前を返す"""
+        started = time.perf_counter()
+        text = event.message.text
+        ctx = RouteContext(event, text, event.source.user_id, self.matcher.scan(text), self.flows)
+        route = next((route for route in self.routes if route.when(ctx)), None)
+        if route is None:
+            logger.warning(f"該当するルートがありません: {text[:20]}")
+            return ""
+
+        failed = False
+        try:
+            route.handler(ctx)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                stats = self.stats[route.name]
+                stats["count"] += 1
+                stats["errors"] += 1 if failed else 0
+                stats["total_time"] += elapsed
+                stats["max_time"] = max(stats["max_time"], elapsed)
+        return route.name
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """ルートごとの処理件数と処理時間（秒）"""
+        with self._lock:
+            return {
+                name: {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "avg_time": stats["total_time"] / stats["count"] if stats["count"] else 0.0,
+                    "max_time": stats["max_time"]
+                }
+                for name, stats in self.stats.items()
+            }
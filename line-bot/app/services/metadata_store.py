@@ -0,0 +1,246 @@
+"""
+ファイルメタデータの保存先（SQLite / JSON）
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+class MetadataStore(ABC):
+    """メタデータ保存先のインターフェース
+
+    メタデータは FileService.save_file が作る dict（file_id, stored_filename, upload_time, message_type など）。
+    """
+
+    @abstractmethod
+    def get(self, file_id: str) -> Optional[Dict]:
+        """file_idのメタデータを取得"""
+
+    @abstractmethod
+    def put(self, metadata: Dict) -> None:
+        """メタデータを追加・更新"""
+
+    def put_many(self, items: List[Dict]) -> None:
+        """複数のメタデータをまとめて追加・更新"""
+        for metadata in items:
+            self.put(metadata)
+
+    @abstractmethod
+    def delete(self, file_id: str) -> bool:
+        """メタデータを削除（存在しなければFalse）"""
+
+    @abstractmethod
+    def iter_all(self) -> Iterator[Dict]:
+        """全メタデータをアップロード順に返す"""
+
+    def list_by_type(self, message_type: str, limit: Optional[int] = None) -> List[Dict]:
+        """メッセージタイプで絞り込み、新しい順に返す"""
+        items = [m for m in self.iter_all() if m.get('message_type') == message_type]
+        items.reverse()
+        return items[:limit] if limit else items
+
+    def count(self) -> int:
+        """件数"""
+        return sum(1 for _ in self.iter_all())
+
+    def close(self) -> None:
+        pass
+
+
+class JsonMetadataStore(MetadataStore):
+    """1つのJSONファイルに全件を保存する（従来形式）
+
+    書き込みのたびに全件を書き直すため件数が多い環境には向かない。一時ファイル経由で置き換えるので
+    書き込み途中で落ちてもファイルは壊れない。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._data = json.load(f)
+
+    def _flush(self) -> None:
+        fd, tmp_name = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_name, self.path)
+
+    def get(self, file_id: str) -> Optional[Dict]:
+        metadata = self._data.get(file_id)
+        return dict(metadata) if metadata else None
+
+    def put(self, metadata: Dict) -> None:
+        with self._lock:
+            self._data[metadata['file_id']] = dict(metadata)
+            self._flush()
+
+    def put_many(self, items: List[Dict]) -> None:
+        with self._lock:
+            for metadata in items:
+                self._data[metadata['file_id']] = dict(metadata)
+            self._flush()
+
+    def delete(self, file_id: str) -> bool:
+        with self._lock:
+            if self._data.pop(file_id, None) is None:
+                return False
+            self._flush()
+            return True
+
+    def iter_all(self) -> Iterator[Dict]:
+        items = sorted(self._data.values(), key=lambda m: m.get('upload_time') or '')
+        return (dict(m) for m in items)
+
+    def count(self) -> int:
+        return len(self._data)
+
+
+class SQLiteMetadataStore(MetadataStore):
+    """SQLite（WALモード）にメタデータを保存する
+
+    file_id を主キーに1件1行で保存し、upload_time と message_type にインデックスを張る。
+    書き込みは1件ずつのトランザクションで、全件の書き直しは発生しない。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            '''
+            CREATE TABLE IF NOT EXISTS files (
+                file_id TEXT PRIMARY KEY,
+                upload_time TEXT,
+                message_type TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_files_upload_time ON files (upload_time);
+            CREATE INDEX IF NOT EXISTS idx_files_message_type ON files (message_type, upload_time);
+            CREATE TABLE IF NOT EXISTS store_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            '''
+        )
+
+    @staticmethod
+    def _row(metadata: Dict) -> tuple:
+        return (
+            metadata['file_id'],
+            metadata.get('upload_time'),
+            metadata.get('message_type'),
+            json.dumps(metadata, ensure_ascii=False)
+        )
+
+    def get(self, file_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM files WHERE file_id = ?', (file_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, metadata: Dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files (file_id, upload_time, message_type, data) VALUES (?, ?, ?, ?)',
+                self._row(metadata)
+            )
+
+    def put_many(self, items: List[Dict]) -> None:
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO files (file_id, upload_time, message_type, data) VALUES (?, ?, ?, ?)',
+                    [self._row(m) for m in items]
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def delete(self, file_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM files WHERE file_id = ?', (file_id,))
+        return cursor.rowcount > 0
+
+    def iter_all(self) -> Iterator[Dict]:
+        with self._lock:
+            rows = self._conn.execute('SELECT data FROM files ORDER BY upload_time').fetchall()
+        return (json.loads(row[0]) for row in rows)
+
+    def list_by_type(self, message_type: str, limit: Optional[int] = None) -> List[Dict]:
+        query = 'SELECT data FROM files WHERE message_type = ? ORDER BY upload_time DESC'
+        params: tuple = (message_type,)
+        if limit:
+            query += ' LIMIT ?'
+            params += (limit,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM store_meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)', (key, value))
+
+    def migrate_from_json(self, json_path: Path) -> int:
+        """従来の metadata.json を一度だけ取り込む（JSONファイル自体は残す）
+
+        Returns:
+            取り込んだ件数（取り込み済み・ファイルなしの場合は0）
+        """
+        json_path = Path(json_path)
+        if not json_path.exists() or self.get_meta('json_migrated'):
+            return 0
+
+        with open(json_path, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+        items = [m for m in legacy.values() if isinstance(m, dict) and m.get('file_id')]
+        self.put_many(items)
+        self.set_meta('json_migrated', str(json_path.stat().st_mtime))
+        return len(items)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_metadata_store(backend: str, storage_path: Path) -> MetadataStore:
+    """設定に応じた保存先を作成
+
+    Args:
+        backend: "sqlite"（デフォルト）または "json"
+        storage_path: uploadsディレクトリ
+    """
+    storage_path = Path(storage_path)
+    if backend == 'json':
+        return JsonMetadataStore(storage_path / 'metadata.json')
+    if backend != 'sqlite':
+        raise ValueError(f'不明なメタデータの保存先: {backend}')
+
+    store = SQLiteMetadataStore(storage_path / 'metadata.db')
+    migrated = store.migrate_from_json(storage_path / 'metadata.json')
+    if migrated:
+        logger.info(f'metadata.json から {migrated} 件を移行しました')
+    return store
@@ -1,21 +1,19 @@
-from openai import OpenAI
 from typing import Dict, Any, Optional
 from .file_service import file_service
+from .llm_gateway import llm_gateway
 from ..config import settings
 import json
 
-# OpenAI クライアント設定
-openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+# OpenAI の呼び出しはすべて共有のLLMゲートウェイ（接続プール・同時実行数の制限・リトライ・期限付き）を通す
 
-def get_chatgpt_response(user_message: str) -> str:
-    """ユーザーのメッセージをChatGPTに送信し、短文レスポンスを取得"""
+def get_chatgpt_response(user_message: str, user_id: Optional[str] = None) -> str:
+    """ユーザーのメッセージをChatGPTに送信し、短文レスポンスを取得（user_id はユーザーごとの同時実行数の制限に使う）"""
     try:
         # ファイル生成コマンドのチェック
         if is_file_generation_request(user_message):
             return handle_file_generation_request(user_message)
         
-        completion = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
+        response_text = llm_gateway.complete(
             messages=[
                 {
                     "role": "system", 
@@ -24,10 +22,10 @@ def get_chatgpt_response(user_message: str) -> str:
                 {"role": "user", "content": user_message}
             ],
             max_tokens=100,
-            temperature=0.7
+            temperature=0.7,
+            user_id=user_id
         )
         
-        response_text = completion.choices[0].message.content
         print(f'ChatGPT response: {response_text}')
         return response_text
         
@@ -35,15 +33,16 @@ def get_chatgpt_response(user_message: str) -> str:
         print(f'Error calling ChatGPT API: {e}')
         return f"エラーが発生しました: {str(e)}"
 
+# ファイル生成リクエストのキーワード（大文字・小文字を区別しない）
+FILE_GENERATION_KEYWORDS = (
+    'レポート作成', 'report create', 'ファイル作成', 'create file',
+    'テキスト生成', 'text generate', 'json生成', 'json generate'
+)
+
 def is_file_generation_request(message: str) -> bool:
     """ファイル生成リクエストかどうかを判定"""
-    file_generation_keywords = [
-        'レポート作成', 'report create', 'ファイル作成', 'create file',
-        'テキスト生成', 'text generate', 'JSON生成', 'json generate'
-    ]
-    
     message_lower = message.lower()
-    return any(keyword in message_lower for keyword in file_generation_keywords)
+    return any(keyword in message_lower for keyword in FILE_GENERATION_KEYWORDS)
 
 def handle_file_generation_request(message: str) -> str:
     """ファイル生成リクエストを処理"""
@@ -85,8 +84,7 @@ def handle_report_generation(message: str) -> str:
 def generate_report_content(message: str) -> str:
     """レポート内容を生成"""
     try:
-        completion = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
+        response_text = llm_gateway.complete(
             messages=[
                 {
                     "role": "system",
@@ -98,7 +96,7 @@ def generate_report_content(message: str) -> str:
             temperature=0.7
         )
         
-        return completion.choices[0].message.content
+        return response_text
         
     except Exception as e:
         print(f'Error generating report content: {e}')
@@ -128,8 +126,7 @@ def handle_json_generation(message: str) -> str:
 def generate_json_content(message: str) -> str:
     """JSON内容を生成"""
     try:
-        completion = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
+        response_text = llm_gateway.complete(
             messages=[
                 {
                     "role": "system",
@@ -141,7 +138,7 @@ def generate_json_content(message: str) -> str:
             temperature=0.7
         )
         
-        return completion.choices[0].message.content
+        return response_text
         
     except Exception as e:
         print(f'Error generating JSON content: {e}')
@@ -171,8 +168,7 @@ def handle_text_file_generation(message: str) -> str:
 def generate_text_content(message: str) -> str:
     """テキスト内容を生成"""
     try:
-        completion = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
+        response_text = llm_gateway.complete(
             messages=[
                 {
                     "role": "system",
@@ -184,7 +180,7 @@ def generate_text_content(message: str) -> str:
             temperature=0.7
         )
         
-        return completion.choices[0].message.content
+        return response_text
         
     except Exception as e:
         print(f'Error generating text content: {e}')
@@ -215,6 +211,25 @@ def generate_memoir_text(text_type: str, data: Dict[str, Any]) -> str:
         raise
 
 
+async def agenerate_memoir_text(text_type: str, data: Dict[str, Any]) -> str:
+    """自分史用のテキストを非同期で生成（FastAPIのエンドポイント用。呼び出し元のイベントループはブロックしない）"""
+    try:
+        if text_type == "profile":
+            build_request, label = build_profile_request, "プロフィール文章"
+        elif text_type == "timeline_description":
+            build_request, label = build_timeline_request, "説明文"
+        else:
+            raise ValueError(f"Unknown text type: {text_type}")
+        try:
+            response_text = await llm_gateway.acomplete(**build_request(data))
+        except Exception as e:
+            raise Exception(f"{label}の生成に失敗しました: {str(e)}")
+        return response_text.strip()
+    except Exception as e:
+        print(f'Error generating memoir text: {e}')
+        raise
+
+
 def generate_profile_text(data: Dict[str, Any]) -> str:
     """プロフィール文章を生成
     
@@ -231,51 +246,54 @@ def generate_profile_text(data: Dict[str, Any]) -> str:
         生成されたプロフィール文章
     """
     try:
-        name = data.get("name", "")
-        birth_date = data.get("birthDate", "")
-        birth_place = data.get("birthPlace", "")
-        occupation = data.get("occupation", "")
-        hobbies = data.get("hobbies", [])
-        
-        # プロンプトを構築
-        prompt = "以下の情報から、自分史のプロフィール文章を生成してください。\n"
-        prompt += "親しみやすく、読みやすい文章でお願いします。\n"
-        prompt += "自然な流れで、温かみのある文章にしてください。\n\n"
-        
-        if name:
-            prompt += f"名前: {name}\n"
-        if birth_date:
-            prompt += f"生年月日: {birth_date}\n"
-        if birth_place:
-            prompt += f"出身地: {birth_place}\n"
-        if occupation:
-            prompt += f"職業: {occupation}\n"
-        if hobbies:
-            hobbies_str = "、".join(hobbies) if isinstance(hobbies, list) else hobbies
-            prompt += f"趣味: {hobbies_str}\n"
-        
-        prompt += "\n150〜200文字程度で、自己紹介文を作成してください。"
-        
-        completion = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "あなたは自分史作成の専門家です。人生のストーリーを温かく、親しみやすい文章で表現するのが得意です。"
-                },
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.8
-        )
-        
-        return completion.choices[0].message.content.strip()
+        response_text = llm_gateway.complete(**build_profile_request(data))
+        return response_text.strip()
         
     except Exception as e:
         print(f'Error generating profile text: {e}')
         raise Exception(f"プロフィール文章の生成に失敗しました: {str(e)}")
 
 
+def build_profile_request(data: Dict[str, Any]) -> Dict[str, Any]:
+    """プロフィール文章を生成するリクエスト（llm_gateway.complete の引数）を作成"""
+    name = data.get("name", "")
+    birth_date = data.get("birthDate", "")
+    birth_place = data.get("birthPlace", "")
+    occupation = data.get("occupation", "")
+    hobbies = data.get("hobbies", [])
+    
+    # プロンプトを構築
+    prompt = "以下の情報から、自分史のプロフィール文章を生成してください。\n"
+    prompt += "親しみやすく、読みやすい文章でお願いします。\n"
+    prompt += "自然な流れで、温かみのある文章にしてください。\n\n"
+    
+    if name:
+        prompt += f"名前: {name}\n"
+    if birth_date:
+        prompt += f"生年月日: {birth_date}\n"
+    if birth_place:
+        prompt += f"出身地: {birth_place}\n"
+    if occupation:
+        prompt += f"職業: {occupation}\n"
+    if hobbies:
+        hobbies_str = "、".join(hobbies) if isinstance(hobbies, list) else hobbies
+        prompt += f"趣味: {hobbies_str}\n"
+    
+    prompt += "\n150〜200文字程度で、自己紹介文を作成してください。"
+    
+    return {
+        "messages": [
+            {
+                "role": "system",
+                "content": "あなたは自分史作成の専門家です。人生のストーリーを温かく、親しみやすい文章で表現するのが得意です。"
+            },
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 500,
+        "temperature": 0.8
+    }
+
+
 def generate_timeline_description(data: Dict[str, Any]) -> str:
     """年表の説明文を生成
     
@@ -289,39 +307,37 @@ def generate_timeline_description(data: Dict[str, Any]) -> str:
         生成された説明文
     """
     try:
-        year = data.get("year", "")
-        title = data.get("title", "")
-        
-        if not year or not title:
-            raise ValueError("年とタイトルは必須です")
-        
-        # プロンプトを構築
-        prompt = f"自分史の年表で、以下の出来事についての説明文を生成してください。\n\n"
-        prompt += f"年: {year}年\n"
-        prompt += f"出来事: {title}\n\n"
-        prompt += "当時の気持ちや状況を想像して、温かみのある文章で説明してください。\n"
-        prompt += "100〜150文字程度でお願いします。"
-        
-        completion = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "あなたは自分史作成の専門家です。人生の重要な出来事を、感動的で心温まる文章で表現するのが得意です。"
-                },
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=400,
-            temperature=0.8
-        )
-        
-        return completion.choices[0].message.content.strip()
+        response_text = llm_gateway.complete(**build_timeline_request(data))
+        return response_text.strip()
         
     except Exception as e:
         print(f'Error generating timeline description: {e}')
         raise Exception(f"説明文の生成に失敗しました: {str(e)}")
 
 
-# グローバルインスタンス（互換性のため）
-openai_service = openai_client
-
+def build_timeline_request(data: Dict[str, Any]) -> Dict[str, Any]:
+    """年表の説明文を生成するリクエスト（llm_gateway.complete の引数）を作成"""
+    year = data.get("year", "")
+    title = data.get("title", "")
+    
+    if not year or not title:
+        raise ValueError("年とタイトルは必須です")
+    
+    # プロンプトを構築
+    prompt = f"自分史の年表で、以下の出来事についての説明文を生成してください。\n\n"
+    prompt += f"年: {year}年\n"
+    prompt += f"出来事: {title}\n\n"
+    prompt += "当時の気持ちや状況を想像して、温かみのある文章で説明してください。\n"
+    prompt += "100〜150文字程度でお願いします。"
+    
+    return {
+        "messages": [
+            {
+                "role": "system",
+                "content": "あなたは自分史作成の専門家です。人生の重要な出来事を、感動的で心温まる文章で表現するのが得意です。"
+            },
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 400,
+        "temperature": 0.8
+    }
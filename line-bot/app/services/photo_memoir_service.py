@@ -5,7 +5,7 @@
 AIが自動的にストーリーを生成し、美しい自分史PDFを作成します。
 """
 
-import asyncio
+import hashlib
 import uuid
 from datetime import datetime
 from pathlib import Path
@@ -13,6 +13,9 @@ from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass, field
 from ..config import settings
 from .vivliostyle_service import vivliostyle_service
+from .task_executor import task_executor
+from .llm_gateway import llm_gateway
+from .session_store import create_session_store
 
 
 @dataclass
@@ -24,9 +27,11 @@ class PhotoItem:
     # 質問・回答
     current_question_index: int = 0
     answers: List[str] = field(default_factory=list)
-    # 生成されたストーリー
+    # 生成されたストーリー（回答が揃った時点で先行生成した下書き）
     generated_story: Optional[str] = None
     story_approved: bool = False
+    story_revision: int = 0  # 生成を依頼した回数（再生成・修正のたびに増える）
+    draft_revision: int = 0  # generated_story がどの依頼の結果か
     # メタデータ
     estimated_date: Optional[str] = None
     estimated_location: Optional[str] = None
@@ -42,6 +47,9 @@ class PhotoMemoirSession:
     current_photo_index: int = 0
     created_at: datetime = field(default_factory=datetime.now)
     updated_at: datetime = field(default_factory=datetime.now)
+    # 全ストーリーが揃った時点で先行生成した下書きPDF（draft_pdf_fingerprint はその時点のストーリーのハッシュ）
+    draft_pdf_path: Optional[str] = None
+    draft_pdf_fingerprint: Optional[str] = None
     
     def get_current_photo(self) -> Optional[PhotoItem]:
         """現在処理中の写真を取得"""
@@ -76,8 +84,15 @@ class PhotoMemoirService:
         "この時の思い出やエピソードを教えてください",
     ]
     
+    # ユーザーのメッセージを受け付ける状態
+    ACTIVE_STATES = ("collecting_photos", "questioning", "story_generated")
+    
+    # 写真の収集を終えるキーワード
+    FINISH_KEYWORDS = ("完了", "おわり", "終わり")
+    
     def __init__(self):
-        self.sessions: Dict[str, PhotoMemoirSession] = {}
+        # セッションIDごとに保存（一定期間操作がないセッションは期限切れになる）
+        self.sessions = create_session_store("photo", PhotoMemoirSession)
     
     
     def start_photo_memoir(self, user_id: str) -> Tuple[PhotoMemoirSession, str]:
@@ -88,7 +103,7 @@ class PhotoMemoirService:
             user_id=user_id,
             state="collecting_photos"
         )
-        self.sessions[session_id] = session
+        self.save_session(session)
         
         response_message = (
             "📸 写真で自分史を作りましょう！\n\n"
@@ -100,19 +115,28 @@ class PhotoMemoirService:
         return session, response_message
     
     def get_session_by_user(self, user_id: str) -> Optional[PhotoMemoirSession]:
-        """ユーザーIDから最新のアクティブセッションを取得"""
-        active_sessions = [
-            s for s in self.sessions.values()
-            if s.user_id == user_id and s.state in ["collecting_photos", "questioning", "story_generated"]
-        ]
-        if active_sessions:
-            return sorted(active_sessions, key=lambda s: s.updated_at, reverse=True)[0]
-        return None
+        """ユーザーIDから最新のアクティブセッションを取得（ユーザーID → セッションIDの索引で引く）"""
+        session_id = self.sessions.get_index(user_id)
+        if session_id is None:
+            return None
+        session = self.sessions.get(session_id)
+        if session is None or session.user_id != user_id or session.state not in self.ACTIVE_STATES:
+            self.sessions.delete_index(user_id, session_id)
+            return None
+        return session
     
     def get_session(self, session_id: str) -> Optional[PhotoMemoirSession]:
         """セッションIDからセッションを取得"""
         return self.sessions.get(session_id)
     
+    def save_session(self, session: PhotoMemoirSession) -> None:
+        """変更したセッションを保存（アクティブでなくなったセッションは索引から外す）"""
+        self.sessions.put(session.session_id, session)
+        if session.state in self.ACTIVE_STATES:
+            self.sessions.set_index(session.user_id, session.session_id)
+        else:
+            self.sessions.delete_index(session.user_id, session.session_id)
+    
     def add_photo(self, session: PhotoMemoirSession, photo_url: str) -> str:
         """写真を追加"""
         photo_id = f"photo_{uuid.uuid4().hex[:8]}"
@@ -122,6 +146,7 @@ class PhotoMemoirService:
         )
         session.photos.append(photo)
         session.updated_at = datetime.now()
+        self.save_session(session)
         
         count = len(session.photos)
         response_message = f"写真{count}枚目を受け取りました📸\n他にも写真があれば送ってください。\n完了したら「完了」と送信してください。"
@@ -136,6 +161,7 @@ class PhotoMemoirService:
         session.state = "questioning"
         session.current_photo_index = 0
         session.updated_at = datetime.now()
+        self.save_session(session)
         
         photo_count = len(session.photos)
         response_message = (
@@ -166,8 +192,11 @@ class PhotoMemoirService:
     def process_answer(self, session: PhotoMemoirSession, answer: str) -> Tuple[str, bool]:
         """回答を処理
         
+        写真の回答が揃ったら、ストーリーの生成を待たずに次の写真の質問に進む
+        （ストーリーはバックグラウンドで先行生成し、全写真の回答後にまとめて確認してもらう）。
+        
         Returns:
-            (レスポンスメッセージ, 次のアクションが必要か)
+            (レスポンスメッセージ, ストーリー生成が必要か)
         """
         photo = session.get_current_photo()
         if not photo:
@@ -177,6 +206,7 @@ class PhotoMemoirService:
         photo.answers.append(answer)
         photo.current_question_index += 1
         session.updated_at = datetime.now()
+        self.save_session(session)
         
         # まだ質問が残っている場合
         if photo.current_question_index < len(self.DEFAULT_QUESTIONS):
@@ -184,27 +214,55 @@ class PhotoMemoirService:
             response = f"ありがとうございます！\n\n次の質問です：\n{next_question}"
             return response, False
         
-        # この写真の質問が終了
+        # この写真の質問が終了 → 次の写真の質問へ
         current, total = session.get_progress()
+        if session.next_photo():
+            self.save_session(session)
+            response = (
+                f"✨ {current}枚目の写真の回答が完了しました！\n"
+                f"ストーリーはAIが裏で作成しておきます。\n\n"
+                f"次の写真です（{current + 1}/{total}枚目）\n\n"
+                f"{self.DEFAULT_QUESTIONS[0]}"
+            )
+            return response, True
+        
+        # 全写真の回答が完了 → 1枚目からストーリーを確認
+        session.state = "story_generated"
+        session.current_photo_index = 0
+        session.updated_at = datetime.now()
+        self.save_session(session)
         response = (
-            f"✨ {current}枚目の写真の回答が完了しました！\n"
-            f"AIがストーリーを生成しています...⏳"
+            f"✨ {total}枚すべての写真の回答が完了しました！\n"
+            f"ここから1枚ずつストーリーを確認してください。"
         )
+        first = session.get_current_photo()
+        if self.is_story_ready(first):
+            response += "\n\n" + self.get_story_approval_message(session, first.generated_story)
+        else:
+            response += "\n\nAIがストーリーを生成しています...⏳"
         
         # ストーリー生成が必要
         return response, True
     
-    def generate_story_for_photo(self, photo: PhotoItem) -> str:
+    # ストーリー生成のシステムプロンプト
+    STORY_SYSTEM_PROMPT = "あなたは自分史作成の専門家です。写真にまつわる思い出を、温かみのある短いストーリーにまとめるのが得意です。"
+    
+    def generate_story_for_photo(self, photo: PhotoItem, user_id: Optional[str] = None) -> str:
         """写真に対するストーリーを生成
         
+        チャット応答（get_chatgpt_response）は通さず、LLMゲートウェイを直接呼ぶ
+        （同時実行数はゲートウェイの全体・ユーザーごとの上限で制限される）。
+        
         Args:
             photo: 写真情報（回答含む）
+            user_id: ユーザーごとの同時実行数の制限に使うユーザーID
         
         Returns:
             生成されたストーリー
-        """
-        from .openai_service import openai_service
         
+        Raises:
+            LLMError: 生成に失敗した（エラー文をストーリーとして保存しないよう、呼び出し側で通知する）
+        """
         # 回答を整形
         answers_text = "\n".join([f"- {answer}" for answer in photo.answers])
         
@@ -226,8 +284,90 @@ class PhotoMemoirService:
 ストーリーのみを出力してください（説明や前置きは不要です）。
 """
         
-        story = openai_service.get_chatgpt_response(prompt.strip())
-        return story.strip()
+        story = llm_gateway.complete(
+            messages=[
+                {"role": "system", "content": self.STORY_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt.strip()}
+            ],
+            max_tokens=500,
+            temperature=0.8,
+            user_id=user_id
+        ).strip()
+        if not story:
+            raise ValueError("ストーリーが空でした")
+        return story
+    
+    def request_story(self, photo: PhotoItem) -> Tuple[PhotoItem, int]:
+        """ストーリーの生成を依頼する（呼び出し側でセッションを保存する）
+        
+        Returns:
+            (生成に使う写真のコピー, 依頼番号)
+        """
+        photo.story_revision += 1
+        snapshot = PhotoItem(photo_id=photo.photo_id, photo_url=photo.photo_url, answers=list(photo.answers))
+        return snapshot, photo.story_revision
+    
+    def apply_story(self, session: PhotoMemoirSession, photo_id: str, revision: int, story: str) -> Optional[PhotoItem]:
+        """生成したストーリーを下書きとして反映する（より新しい依頼がある場合は捨ててNone）"""
+        photo = next((p for p in session.photos if p.photo_id == photo_id), None)
+        if photo is None or photo.story_revision != revision:
+            return None
+        photo.generated_story = story
+        photo.draft_revision = revision
+        session.updated_at = datetime.now()
+        self.save_session(session)
+        return photo
+    
+    @staticmethod
+    def is_story_ready(photo: Optional[PhotoItem]) -> bool:
+        """最新の依頼のストーリーが生成済みか"""
+        return bool(photo and photo.generated_story and photo.draft_revision == photo.story_revision)
+    
+    def all_stories_ready(self, session: PhotoMemoirSession) -> bool:
+        """全写真のストーリーが生成済みか"""
+        return bool(session.photos) and all(self.is_story_ready(photo) for photo in session.photos)
+    
+    @staticmethod
+    def stories_fingerprint(session: PhotoMemoirSession) -> str:
+        """PDFの内容を決めるストーリーのハッシュ（下書きPDFを使い回せるかの判定に使う）"""
+        hasher = hashlib.sha256()
+        for photo in session.photos:
+            hasher.update(f"{photo.photo_url}\0{photo.generated_story or ''}\0".encode("utf-8"))
+        return hasher.hexdigest()
+    
+    def set_draft_pdf(self, session: PhotoMemoirSession, pdf_result: Dict[str, Any], fingerprint: str) -> bool:
+        """先行生成した下書きPDFを保存する（生成中にストーリーが変わっていたら削除してFalse）"""
+        if session.state != "story_generated" or fingerprint != self.stories_fingerprint(session):
+            Path(pdf_result["path"]).unlink(missing_ok=True)
+            return False
+        self.discard_draft_pdf(session)
+        session.draft_pdf_path = pdf_result["path"]
+        session.draft_pdf_fingerprint = fingerprint
+        self.save_session(session)
+        return True
+    
+    def take_draft_pdf(self, session: PhotoMemoirSession) -> Optional[Dict[str, Any]]:
+        """下書きPDFが今のストーリーと一致すれば、generate_pdf と同じ形の結果として取り出す"""
+        path = Path(session.draft_pdf_path) if session.draft_pdf_path else None
+        if path is None or session.draft_pdf_fingerprint != self.stories_fingerprint(session) or not path.exists():
+            self.discard_draft_pdf(session)
+            return None
+        session.draft_pdf_path = None
+        session.draft_pdf_fingerprint = None
+        self.save_session(session)
+        return {
+            "success": True,
+            "filename": path.name,
+            "size": path.stat().st_size,
+            "path": str(path)
+        }
+    
+    def discard_draft_pdf(self, session: PhotoMemoirSession) -> None:
+        """下書きPDFを削除（呼び出し側でセッションを保存する）"""
+        if session.draft_pdf_path:
+            Path(session.draft_pdf_path).unlink(missing_ok=True)
+        session.draft_pdf_path = None
+        session.draft_pdf_fingerprint = None
     
     def get_story_approval_message(self, session: PhotoMemoirSession, story: str) -> str:
         """ストーリー承認メッセージを生成"""
@@ -251,29 +391,38 @@ class PhotoMemoirService:
             (レスポンスメッセージ, 次の写真に進むか)
         """
         photo = session.get_current_photo()
-        if not photo or not photo.generated_story:
+        if not photo:
             return "エラー: ストーリーが見つかりません", False
         
+        regenerate = "🔄" in response or "再生成" in response
+        if not regenerate and not self.is_story_ready(photo):
+            # 先行生成がまだ終わっていない（完成したら承認メッセージを送る）
+            return "ストーリーを生成しています。完成したらお送りしますので、少々お待ちください⏳", False
+        
         # 絵文字または明確な承認ワード
-        if "👍" in response or "いいね" in response or "OK" in response.upper() or "次" in response:
+        if not regenerate and ("👍" in response or "いいね" in response or "OK" in response.upper() or "次" in response):
             # 承認
             photo.story_approved = True
             session.updated_at = datetime.now()
             
-            # 次の写真に進む
+            # 次の写真のストーリーへ（先行生成済みならそのまま表示）
             if session.next_photo():
+                self.save_session(session)
                 current, total = session.get_progress()
-                next_message = (
-                    f"✨ 次の写真です（{current}/{total}枚目）\n\n"
-                    f"{self.DEFAULT_QUESTIONS[0]}"
-                )
-                return next_message, True
+                next_photo = session.get_current_photo()
+                next_message = f"✨ 次の写真です（{current}/{total}枚目）\n\n"
+                if self.is_story_ready(next_photo):
+                    next_message += self.get_story_approval_message(session, next_photo.generated_story)
+                else:
+                    next_message += "AIがストーリーを生成しています...⏳"
+                return next_message, False
             else:
                 # 全写真完了
                 session.state = "completed"
+                self.save_session(session)
                 return "すべての写真のストーリーが完成しました！\nPDFを生成しています...⏳", True
         
-        elif "🔄" in response or "再生成" in response:
+        elif regenerate:
             # 再生成
             return "ストーリーを再生成しています...⏳", True
         
@@ -281,11 +430,18 @@ class PhotoMemoirService:
             # 修正内容として処理
             # 簡易実装: 修正内容を追加の回答として扱い、再生成
             photo.answers.append(f"[修正要望] {response}")
+            self.save_session(session)
             return "修正内容を反映してストーリーを再生成しています...⏳", True
     
-    def generate_pdf(self, session: PhotoMemoirSession) -> Dict[str, Any]:
+    def generate_pdf(self, session: PhotoMemoirSession, draft: bool = False) -> Dict[str, Any]:
         """写真自分史のPDFを生成
         
+        PDFは uploads ではなく一時ディレクトリ（下書きは PHOTO_DRAFT_DIR）に書き出す
+        （file_service.register_file で uploads に移動して登録する。未登録のまま残っても repair の対象にならない）。
+        
+        Args:
+            draft: 承認前に先行生成する下書きか
+        
         Returns:
             PDF生成結果
         """
@@ -293,13 +449,13 @@ class PhotoMemoirService:
             # テンプレートデータを準備
             template_data = self._prepare_template_data(session)
             
-            # ファイル名を生成
+            # ファイル名を生成（同じ秒に複数生成しても重ならないよう uuid を付ける）
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"photo_memoir_{session.user_id[:8]}_{timestamp}.pdf"
+            filename = f"photo_memoir_{session.user_id[:8]}_{timestamp}_{uuid.uuid4().hex[:8]}.pdf"
             
             # 出力PDFパス
-            output_dir = Path(settings.UPLOADS_DIR)
-            output_dir.mkdir(exist_ok=True)
+            output_dir = Path(settings.PHOTO_DRAFT_DIR if draft else settings.TEMP_DIR)
+            output_dir.mkdir(parents=True, exist_ok=True)
             output_path = output_dir / filename
             
             # Vivliostyleオプション
@@ -310,30 +466,21 @@ class PhotoMemoirService:
                 "timeout": 120  # 写真が多い場合は時間がかかる
             }
             
-            # Vivliostyleで非同期PDF生成（同期的に実行）
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(
-                    vivliostyle_service.generate_pdf(
-                        template_name="photo-memoir",
-                        data=template_data,
-                        output_path=output_path,
-                        vivliostyle_options=vivliostyle_options
-                    )
+            # Vivliostyleで非同期PDF生成（バックグラウンド実行器の共有イベントループで実行し、完了を待つ）
+            task_executor.run_coroutine(
+                vivliostyle_service.generate_pdf(
+                    template_name="photo-memoir",
+                    data=template_data,
+                    output_path=output_path,
+                    vivliostyle_options=vivliostyle_options
                 )
-            finally:
-                loop.close()
-            
-            # PDFファイルを読み込み
-            with open(output_path, "rb") as f:
-                pdf_buffer = f.read()
+            )
             
+            # PDFはメモリに読み込まず、パスを返す（file_service.register_file で登録する）
             return {
                 "success": True,
-                "pdf_buffer": pdf_buffer,
                 "filename": filename,
-                "size": len(pdf_buffer),
+                "size": output_path.stat().st_size,
                 "path": str(output_path)
             }
             
@@ -365,11 +512,14 @@ class PhotoMemoirService:
         return template_data
     
     def cancel_session(self, session_id: str) -> bool:
-        """セッションをキャンセル"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            return True
-        return False
+        """セッションをキャンセル（実行中・待機中のバックグラウンド処理も打ち切る）"""
+        task_executor.cancel(session_id)
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        self.discard_draft_pdf(session)
+        self.sessions.delete_index(session.user_id, session_id)
+        return self.sessions.delete(session_id)
 
 
 # グローバルインスタンス
@@ -0,0 +1,172 @@
+"""
+プレビュー画像（サムネイル）の生成サービス
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from ..config import settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow未導入時はプレビューを生成しない
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+class PreviewService:
+    """LINEのプレビュー用サムネイルの生成とキャッシュ
+
+    画像は長辺 PREVIEW_SIZE ピクセルのJPEGに縮小し、PDFは1ページ目を PDF_PREVIEW_COMMAND（pdftoppm）で画像にする。
+    生成結果は（内容のSHA-256, サイズ）をキーに PREVIEW_CACHE_DIR に保存し、合計サイズが
+    PREVIEW_CACHE_MAX_BYTES を超えたら最も長く使われていないものから削除する。
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir or settings.PREVIEW_CACHE_DIR)
+        self.max_bytes = settings.PREVIEW_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.size = settings.PREVIEW_SIZE
+        self.enabled = Image is not None
+        self.pdf_command = shutil.which(settings.PDF_PREVIEW_COMMAND)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+        if Image is None:
+            logger.warning("Pillowがインストールされていないため、プレビュー画像を生成しません")
+        if self.pdf_command is None:
+            logger.warning(f"{settings.PDF_PREVIEW_COMMAND} が見つからないため、PDFのプレビュー画像を生成しません")
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._load_index()
+
+    def _load_index(self) -> None:
+        """既存のプレビュー画像を最終利用時刻順に読み込む"""
+        files = sorted(self.cache_dir.glob("*.jpg"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self._total_bytes += size
+        logger.info(f"プレビューキャッシュ読み込み: {len(self._entries)}件, {self._total_bytes} bytes")
+
+    def get_preview_url(self, file_id: str, base_url: str) -> str:
+        """プレビュー画像のURLを生成"""
+        return f"{base_url}/media/preview/{file_id}"
+
+    def cache_key(self, metadata: Dict[str, Any]) -> str:
+        """プレビューのキャッシュキー（同じ内容のファイルは同じプレビューを共有する）"""
+        return f"{metadata.get('sha256') or metadata['file_id']}_{self.size}"
+
+    def supports(self, metadata: Dict[str, Any]) -> bool:
+        """プレビューを生成できるファイルか"""
+        if not self.enabled:
+            return False
+        if metadata.get('message_type') == 'image':
+            return True
+        return metadata.get('content_type') == 'application/pdf' and self.pdf_command is not None
+
+    def get_preview(self, metadata: Dict[str, Any], source: Path) -> Optional[Path]:
+        """プレビュー画像のパスを返す（初回は生成する。生成できない場合はNone）
+
+        CPUと外部コマンドを使うため、イベントループからは asyncio.to_thread などで呼び出す。
+        """
+        if not self.supports(metadata):
+            return None
+
+        key = self.cache_key(metadata)
+        path = self.cache_dir / f"{key}.jpg"
+        with self._lock:
+            if key in self._entries and path.exists():
+                self._entries.move_to_end(key)
+                os.utime(path)
+                self.stats["hits"] += 1
+                return path
+            self.stats["misses"] += 1
+
+        try:
+            if metadata.get('message_type') == 'image':
+                self._render_image(source, path)
+            else:
+                self._render_pdf(source, path)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"プレビュー画像の生成に失敗しました: {metadata['file_id']}, {e}")
+            return None
+
+        with self._lock:
+            size = path.stat().st_size
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict(keep=key)
+        logger.info(f"プレビュー画像を生成: {metadata['file_id']} ({size} bytes)")
+        return path
+
+    def _render_image(self, source: Path, dest: Path) -> None:
+        with Image.open(source) as original:
+            # EXIFの回転情報を画素に反映してから縮小
+            image = ImageOps.exif_transpose(original)
+            image.thumbnail((self.size, self.size), Image.LANCZOS)
+            self._save_jpeg(image, dest)
+
+    def _render_pdf(self, source: Path, dest: Path) -> None:
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as temp_dir:
+            prefix = Path(temp_dir) / "page"
+            subprocess.run(
+                [self.pdf_command, "-jpeg", "-f", "1", "-l", "1", "-singlefile",
+                 "-scale-to", str(self.size), str(source), str(prefix)],
+                check=True,
+                capture_output=True,
+                timeout=30
+            )
+            with Image.open(prefix.with_suffix(".jpg")) as image:
+                self._save_jpeg(image, dest)
+
+    def _save_jpeg(self, image, dest: Path) -> None:
+        """JPEGで保存（書き込み途中のファイルを読まれないよう一時ファイル経由で置き換える）"""
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, format="JPEG", quality=settings.PREVIEW_QUALITY, optimize=True)
+            os.replace(tmp_name, dest)
+        except Exception:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """上限サイズを超えた分を古い順に削除（ロック内で呼ぶ）"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = next(iter(self._entries.items()))
+            if key == keep and len(self._entries) == 1:
+                break
+            self._entries.pop(key)
+            self._total_bytes -= size
+            (self.cache_dir / f"{key}.jpg").unlink(missing_ok=True)
+            self.stats["evictions"] += 1
+            logger.info(f"プレビューキャッシュ削除: {key}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キャッシュの状態を取得"""
+        return {
+            "enabled": self.enabled,
+            "pdf": self.pdf_command is not None,
+            "entries": len(self._entries),
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            **self.stats
+        }
+
+
+# グローバルインスタンス
+preview_service = PreviewService()
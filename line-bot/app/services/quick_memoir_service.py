@@ -11,6 +11,8 @@ from typing import Dict, Any, Optional
 from dataclasses import dataclass, field, asdict
 from ..config import settings
 from .vivliostyle_service import vivliostyle_service
+from .task_executor import task_executor
+from .session_store import create_session_store
 
 
 @dataclass
@@ -50,13 +52,20 @@ class QuickMemoirSession:
 class QuickMemoirService:
     """簡易自分史作成サービス"""
     
+    # ユーザーのメッセージを受け付ける状態
+    ACTIVE_STATES = ("waiting_title", "waiting_cover")
+    
+    # 簡易作成を始めるキーワード（メッセージに含まれていれば開始）
+    TRIGGER_KEYWORDS = ('作る', '作成', 'つくる', 'create', '自分史')
+    
     def __init__(self):
-        self.sessions: Dict[str, QuickMemoirSession] = {}
+        # セッションIDごとに保存（一定期間操作がないセッションは期限切れになる）
+        self.sessions = create_session_store("quick", QuickMemoirSession)
     
     def is_quick_create_request(self, message: str) -> bool:
         """簡易作成リクエストかどうかを判定"""
-        trigger_keywords = ['作る', '作成', 'つくる', 'create', '自分史']
-        return any(keyword in message.lower() for keyword in trigger_keywords)
+        message_lower = message.lower()
+        return any(keyword in message_lower for keyword in self.TRIGGER_KEYWORDS)
     
     def start_quick_create(self, user_id: str) -> tuple[QuickMemoirSession, str]:
         """簡易作成を開始"""
@@ -66,7 +75,7 @@ class QuickMemoirService:
             user_id=user_id,
             state="waiting_title"
         )
-        self.sessions[session_id] = session
+        self.save_session(session)
         
         response_message = (
             "✨ 自分史を作成しましょう！\n\n"
@@ -77,25 +86,34 @@ class QuickMemoirService:
         return session, response_message
     
     def get_session_by_user(self, user_id: str) -> Optional[QuickMemoirSession]:
-        """ユーザーIDから最新のアクティブセッションを取得"""
-        active_sessions = [
-            s for s in self.sessions.values()
-            if s.user_id == user_id and s.state in ["waiting_title", "waiting_cover"]
-        ]
-        if active_sessions:
-            # 最新のセッションを返す
-            return sorted(active_sessions, key=lambda s: s.updated_at, reverse=True)[0]
-        return None
+        """ユーザーIDから最新のアクティブセッションを取得（ユーザーID → セッションIDの索引で引く）"""
+        session_id = self.sessions.get_index(user_id)
+        if session_id is None:
+            return None
+        session = self.sessions.get(session_id)
+        if session is None or session.user_id != user_id or session.state not in self.ACTIVE_STATES:
+            self.sessions.delete_index(user_id, session_id)
+            return None
+        return session
     
     def get_session(self, session_id: str) -> Optional[QuickMemoirSession]:
         """セッションIDからセッションを取得"""
         return self.sessions.get(session_id)
     
+    def save_session(self, session: QuickMemoirSession) -> None:
+        """変更したセッションを保存（アクティブでなくなったセッションは索引から外す）"""
+        self.sessions.put(session.session_id, session)
+        if session.state in self.ACTIVE_STATES:
+            self.sessions.set_index(session.user_id, session.session_id)
+        else:
+            self.sessions.delete_index(session.user_id, session.session_id)
+    
     def process_title(self, session: QuickMemoirSession, title: str) -> str:
         """タイトルを処理"""
         session.data.title = title
         session.state = "waiting_cover"
         session.updated_at = datetime.now()
+        self.save_session(session)
         
         response_message = (
             f"タイトル：「{title}」\n\n"
@@ -111,6 +129,7 @@ class QuickMemoirService:
         session.data.date = datetime.now().strftime("%Y年%m月")
         session.state = "editing"
         session.updated_at = datetime.now()
+        self.save_session(session)
         
         response_message = "カバー写真を受け取りました！\nPDFを生成中です...⏳"
         
@@ -162,15 +181,11 @@ class QuickMemoirService:
                 vivliostyle_options=vivliostyle_options
             )
             
-            # PDFファイルを読み込み
-            with open(output_path, "rb") as f:
-                pdf_buffer = f.read()
-            
+            # PDFはメモリに読み込まず、パスを返す（file_service.register_file で登録する）
             return {
                 "success": True,
-                "pdf_buffer": pdf_buffer,
                 "filename": filename,
-                "size": len(pdf_buffer),
+                "size": output_path.stat().st_size,
                 "path": str(output_path)
             }
             
@@ -236,6 +251,7 @@ class QuickMemoirService:
         print(f"  timeline: {session.data.timeline}")
         
         session.updated_at = datetime.now()
+        self.save_session(session)
         return True
     
     def _prepare_template_data(self, data: QuickMemoirData) -> Dict[str, Any]:
@@ -283,11 +299,13 @@ class QuickMemoirService:
         return template_data
     
     def cancel_session(self, session_id: str) -> bool:
-        """セッションをキャンセル"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            return True
-        return False
+        """セッションをキャンセル（実行中・待機中のバックグラウンド処理も打ち切る）"""
+        task_executor.cancel(session_id)
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        self.sessions.delete_index(session.user_id, session_id)
+        return self.sessions.delete(session_id)
 
 
 # グローバルインスタンス
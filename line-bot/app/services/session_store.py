@@ -0,0 +1,605 @@
+"""
+対話セッションの保存先（メモリ / SQLite / Redis）
+"""
+
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Generic, Iterator, List, Optional, Tuple, Type, TypeVar, Union, get_args, get_origin, get_type_hints
+from urllib.parse import urlparse
+
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+S = TypeVar("S")
+
+
+class SessionCodec(Generic[S]):
+    """セッションのdataclassとJSONの相互変換
+
+    フィールドの型ヒントをもとに、入れ子のdataclass・datetime・Optional・List を復元する。
+    値が None のフィールドは保存せず（復元時はデフォルト値になる）、区切り文字の空白も省いて小さく保つ。
+    """
+
+    def __init__(self, cls: Type[S]):
+        self.cls = cls
+        self._hints: Dict[type, Dict[str, Any]] = {}
+
+    def dumps(self, session: S) -> str:
+        return json.dumps(self._encode(session), ensure_ascii=False, separators=(",", ":"))
+
+    def loads(self, data: str) -> S:
+        return self._decode(self.cls, json.loads(data))
+
+    def _encode(self, value: Any) -> Any:
+        if is_dataclass(value):
+            encoded = {}
+            for f in fields(value):
+                item = getattr(value, f.name)
+                if item is not None:
+                    encoded[f.name] = self._encode(item)
+            return encoded
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, (list, tuple)):
+            return [self._encode(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._encode(item) for key, item in value.items()}
+        return value
+
+    def _decode(self, tp: Any, value: Any) -> Any:
+        if value is None:
+            return None
+        if tp is datetime:
+            return datetime.fromisoformat(value)
+        if is_dataclass(tp):
+            hints = self._hints.get(tp)
+            if hints is None:
+                hints = self._hints[tp] = get_type_hints(tp)
+            kwargs = {
+                f.name: self._decode(hints.get(f.name, Any), value[f.name])
+                for f in fields(tp) if f.init and f.name in value
+            }
+            return tp(**kwargs)
+        origin = get_origin(tp)
+        if origin is Union:
+            args = [arg for arg in get_args(tp) if arg is not type(None)]
+            return self._decode(args[0], value) if len(args) == 1 else value
+        if origin is list and get_args(tp):
+            return [self._decode(get_args(tp)[0], item) for item in value]
+        return value
+
+
+class SessionStore(ABC, Generic[S]):
+    """セッション保存先のインターフェース
+
+    最後に読み書きしてから ttl 秒経ったセッションは期限切れとして扱い（アイドルTTL）、
+    件数が max_entries を超えたら最も長く使われていないものから削除する。
+    get() で返すセッションを書き換えた場合は put() で保存し直す。
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[S]:
+        """セッションを取得（期限切れ・なしの場合はNone）。取得すると有効期限が延びる"""
+
+    @abstractmethod
+    def put(self, key: str, session: S) -> None:
+        """セッションを追加・更新"""
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """セッションを削除（存在しなければFalse）"""
+
+    @abstractmethod
+    def values(self) -> Iterator[S]:
+        """期限内の全セッション"""
+
+    @abstractmethod
+    def get_index(self, name: str) -> Optional[str]:
+        """索引（ユーザーID → セッションのキーなど）を引く。セッションと同じTTLで、引くと有効期限が延びる"""
+
+    @abstractmethod
+    def set_index(self, name: str, key: str) -> None:
+        """索引を設定"""
+
+    @abstractmethod
+    def delete_index(self, name: str, key: Optional[str] = None) -> None:
+        """索引を削除（key を指定した場合は、その key を指しているときだけ削除）"""
+
+    def count(self) -> int:
+        """期限内のセッション数"""
+        return sum(1 for _ in self.values())
+
+    def purge_expired(self) -> int:
+        """期限切れのセッションを削除（削除した件数を返す）"""
+        return 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """保存先の状態を取得"""
+        return {
+            "backend": self.__class__.__name__,
+            "sessions": self.count(),
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            **self.stats
+        }
+
+    def close(self) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore[S]):
+    """プロセス内のLRUにセッションのオブジェクトをそのまま保持する
+
+    最後に使った順に並べているため、期限切れのものは常に先頭側にまとまる。put のたびに先頭から
+    期限切れと上限超過の分を削除する。再起動で消え、複数のワーカープロセス間では共有されない。
+    """
+
+    def __init__(self, ttl: float, max_entries: int, with_index: bool = True):
+        super().__init__(ttl, max_entries)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[S, float]]" = OrderedDict()
+        # 索引も同じTTL・上限のLRUで持つ
+        self._index: "Optional[MemorySessionStore[str]]" = (
+            MemorySessionStore(ttl, max_entries, with_index=False) if with_index else None
+        )
+
+    def get(self, key: str) -> Optional[S]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            session, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries[key] = (session, now + self.ttl)
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return session
+
+    def put(self, key: str, session: S) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (session, now + self.ttl)
+            self._entries.move_to_end(key)
+            self._purge(now)
+
+    def _purge(self, now: float) -> int:
+        """先頭から期限切れ・上限超過の分を削除（ロック内で呼ぶ）"""
+        removed = 0
+        while self._entries:
+            key, (_, expires_at) = next(iter(self._entries.items()))
+            if expires_at <= now:
+                self.stats["expired"] += 1
+            elif len(self._entries) > self.max_entries:
+                self.stats["evicted"] += 1
+            else:
+                break
+            del self._entries[key]
+            removed += 1
+        return removed
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def values(self) -> Iterator[S]:
+        now = time.monotonic()
+        with self._lock:
+            sessions = [session for session, expires_at in self._entries.values() if expires_at > now]
+        return iter(sessions)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get_index(self, name: str) -> Optional[str]:
+        return self._index.get(name)
+
+    def set_index(self, name: str, key: str) -> None:
+        self._index.put(name, key)
+
+    def delete_index(self, name: str, key: Optional[str] = None) -> None:
+        self._index._delete_if(name, key)
+
+    def _delete_if(self, key: str, value: Optional[S]) -> None:
+        """key を削除（value を指定した場合は、値が一致するときだけ削除）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (value is None or entry[0] == value):
+                del self._entries[key]
+
+    def purge_expired(self) -> int:
+        if self._index is not None:
+            self._index.purge_expired()
+        with self._lock:
+            return self._purge(time.monotonic())
+
+
+class SQLiteSessionStore(SessionStore[S]):
+    """SQLite（WALモード）にセッションをJSONで保存する
+
+    1つのDBファイルを namespace（サービスごと）で分けて使う。再起動後も残り、同じホストの
+    複数のワーカープロセスから共有できる。期限切れ・上限超過の削除は PURGE_INTERVAL 回の put ごとにまとめて行う。
+    """
+
+    PURGE_INTERVAL = 100
+
+    def __init__(self, path: Path, namespace: str, codec: SessionCodec[S], ttl: float, max_entries: int):
+        super().__init__(ttl, max_entries)
+        self.path = Path(path)
+        self.namespace = namespace
+        self.codec = codec
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            '''
+            CREATE TABLE IF NOT EXISTS sessions (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (namespace, expires_at);
+            CREATE TABLE IF NOT EXISTS session_index (
+                namespace TEXT NOT NULL,
+                name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, name)
+            );
+            '''
+        )
+
+    def get(self, key: str) -> Optional[S]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, expires_at FROM sessions WHERE namespace = ? AND key = ?', (self.namespace, key)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            if row[1] <= now:
+                self._conn.execute('DELETE FROM sessions WHERE namespace = ? AND key = ?', (self.namespace, key))
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute(
+                'UPDATE sessions SET expires_at = ? WHERE namespace = ? AND key = ?', (now + self.ttl, self.namespace, key)
+            )
+            self.stats["hits"] += 1
+        return self.codec.loads(row[0])
+
+    def put(self, key: str, session: S) -> None:
+        data = self.codec.dumps(session)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sessions (namespace, key, data, expires_at) VALUES (?, ?, ?, ?)',
+                (self.namespace, key, data, time.time() + self.ttl)
+            )
+            self._puts += 1
+            if self._puts % self.PURGE_INTERVAL == 0:
+                self._purge()
+
+    def _purge(self) -> int:
+        """期限切れ・上限超過の分を削除（ロック内で呼ぶ）"""
+        expired = self._conn.execute(
+            'DELETE FROM sessions WHERE namespace = ? AND expires_at <= ?', (self.namespace, time.time())
+        ).rowcount
+        count = self._conn.execute('SELECT COUNT(*) FROM sessions WHERE namespace = ?', (self.namespace,)).fetchone()[0]
+        evicted = 0
+        if count > self.max_entries:
+            evicted = self._conn.execute(
+                '''
+                DELETE FROM sessions WHERE namespace = ? AND key IN (
+                    SELECT key FROM sessions WHERE namespace = ? ORDER BY expires_at LIMIT ?
+                )
+                ''',
+                (self.namespace, self.namespace, count - self.max_entries)
+            ).rowcount
+        # 索引は期限切れのものと、指しているセッションがなくなったものを削除
+        self._conn.execute(
+            '''
+            DELETE FROM session_index WHERE namespace = ? AND (expires_at <= ? OR key NOT IN (
+                SELECT key FROM sessions WHERE namespace = ?
+            ))
+            ''',
+            (self.namespace, time.time(), self.namespace)
+        )
+        self.stats["expired"] += expired
+        self.stats["evicted"] += evicted
+        return expired + evicted
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM sessions WHERE namespace = ? AND key = ?', (self.namespace, key))
+        return cursor.rowcount > 0
+
+    def values(self) -> Iterator[S]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT data FROM sessions WHERE namespace = ? AND expires_at > ?', (self.namespace, time.time())
+            ).fetchall()
+        return (self.codec.loads(row[0]) for row in rows)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM sessions WHERE namespace = ? AND expires_at > ?', (self.namespace, time.time())
+            ).fetchone()[0]
+
+    def get_index(self, name: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT key FROM session_index WHERE namespace = ? AND name = ? AND expires_at > ?',
+                (self.namespace, name, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                'UPDATE session_index SET expires_at = ? WHERE namespace = ? AND name = ?',
+                (now + self.ttl, self.namespace, name)
+            )
+        return row[0]
+
+    def set_index(self, name: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO session_index (namespace, name, key, expires_at) VALUES (?, ?, ?, ?)',
+                (self.namespace, name, key, time.time() + self.ttl)
+            )
+
+    def delete_index(self, name: str, key: Optional[str] = None) -> None:
+        query = 'DELETE FROM session_index WHERE namespace = ? AND name = ?'
+        params: tuple = (self.namespace, name)
+        if key is not None:
+            query += ' AND key = ?'
+            params += (key,)
+        with self._lock:
+            self._conn.execute(query, params)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisError(Exception):
+    """Redisがエラーを返した"""
+
+
+class RedisConnection:
+    """RESP（Redisのプロトコル）で1本のTCP接続を使ってコマンドを送る最小限のクライアント
+
+    GET / SET / DEL / PEXPIRE / SCAN / DBSIZE など、セッション保存に使うコマンドだけを想定している。
+    切断された場合は次のコマンドで接続し直す。
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", ""):
+            raise ValueError(f"対応していないRedisのURL: {url}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", str(self.db))
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    def execute(self, *args: Union[str, bytes, int]) -> Any:
+        """コマンドを送信して応答を返す"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._call(*args)
+                except (OSError, EOFError) as e:
+                    self._close()
+                    if attempt:
+                        raise ConnectionError(f"Redisに接続できません: {self.host}:{self.port}, {e}")
+
+    def _call(self, *args: Union[str, bytes, int]) -> Any:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+        return self._read()
+
+    def _read(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise EOFError("接続が閉じられました")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read() for _ in range(length)]
+        raise RedisError(f"不正な応答: {line!r}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+class RedisSessionStore(SessionStore[S]):
+    """Redis互換サーバーにセッションをJSONで保存する
+
+    キーは "{prefix}:{namespace}:{key}"。有効期限はRedisのキーの期限（PX）で管理し、取得のたびに延ばす。
+    複数のホスト・ワーカープロセスで共有できる。件数の上限はRedisサーバー側の maxmemory と削除ポリシー
+    （volatile-lru など）で制御する。
+    件数は SCAN で数えるため、get_stats() では COUNT_REFRESH 秒ごとに数え直した概算を返す。
+    """
+
+    # get_stats() の件数を数え直す間隔（秒）
+    COUNT_REFRESH = 60.0
+
+    def __init__(self, connection: RedisConnection, namespace: str, codec: SessionCodec[S],
+                 ttl: float, max_entries: int, prefix: str = "magazine-maker"):
+        super().__init__(ttl, max_entries)
+        self.connection = connection
+        self.codec = codec
+        self.key_prefix = f"{prefix}:{namespace}:"
+        # 索引はセッションのキーと重ならないよう別の接頭辞にする
+        self.index_prefix = f"{prefix}:{namespace}-index:"
+        self._counted: Optional[int] = None
+        self._counted_at = 0.0
+
+    def _ttl_ms(self) -> int:
+        return max(1, int(self.ttl * 1000))
+
+    def get(self, key: str) -> Optional[S]:
+        name = self.key_prefix + key
+        data = self.connection.execute("GET", name)
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+        self.connection.execute("PEXPIRE", name, self._ttl_ms())
+        self.stats["hits"] += 1
+        return self.codec.loads(data.decode("utf-8"))
+
+    def put(self, key: str, session: S) -> None:
+        self.connection.execute("SET", self.key_prefix + key, self.codec.dumps(session), "PX", self._ttl_ms())
+
+    def delete(self, key: str) -> bool:
+        return self.connection.execute("DEL", self.key_prefix + key) > 0
+
+    def _scan_keys(self) -> List[bytes]:
+        keys: List[bytes] = []
+        cursor = "0"
+        while True:
+            cursor, batch = self.connection.execute("SCAN", cursor, "MATCH", self.key_prefix + "*", "COUNT", 500)
+            keys.extend(batch)
+            cursor = cursor.decode("utf-8") if isinstance(cursor, bytes) else str(cursor)
+            if cursor == "0":
+                return keys
+
+    def values(self) -> Iterator[S]:
+        for name in self._scan_keys():
+            data = self.connection.execute("GET", name)
+            if data is not None:
+                yield self.codec.loads(data.decode("utf-8"))
+
+    def count(self) -> int:
+        """件数（全キーを SCAN するため、頻繁に呼ぶ場合は get_stats() の概算を使う）"""
+        self._counted = len(self._scan_keys())
+        self._counted_at = time.monotonic()
+        return self._counted
+
+    def get_stats(self) -> Dict[str, Any]:
+        """保存先の状態を取得（件数は最大 COUNT_REFRESH 秒前に数えた概算）"""
+        if self._counted is None or time.monotonic() - self._counted_at >= self.COUNT_REFRESH:
+            self.count()
+        return {
+            "backend": self.__class__.__name__,
+            "sessions": self._counted,
+            "sessions_approximate": True,
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            **self.stats
+        }
+
+    def get_index(self, name: str) -> Optional[str]:
+        index_key = self.index_prefix + name
+        key = self.connection.execute("GET", index_key)
+        if key is None:
+            return None
+        self.connection.execute("PEXPIRE", index_key, self._ttl_ms())
+        return key.decode("utf-8")
+
+    def set_index(self, name: str, key: str) -> None:
+        self.connection.execute("SET", self.index_prefix + name, key, "PX", self._ttl_ms())
+
+    def delete_index(self, name: str, key: Optional[str] = None) -> None:
+        if key is not None and self.get_index(name) != key:
+            return
+        self.connection.execute("DEL", self.index_prefix + name)
+
+
+_redis_connections: Dict[str, RedisConnection] = {}
+
+
+def create_session_store(namespace: str, cls: Type[S], backend: Optional[str] = None) -> SessionStore[S]:
+    """設定に応じたセッションの保存先を作成
+
+    Args:
+        namespace: サービスごとの名前（"photo", "quick" など）
+        cls: セッションのdataclass（SQLite・Redisに保存する際の変換に使う）
+        backend: "memory"（デフォルト）/ "sqlite" / "redis"。省略時は SESSION_BACKEND
+    """
+    backend = backend or settings.SESSION_BACKEND
+    ttl, max_entries = settings.SESSION_TTL, settings.SESSION_MAX_ENTRIES
+    if backend == 'memory':
+        return MemorySessionStore(ttl, max_entries)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(settings.SESSION_DB_PATH, namespace, SessionCodec(cls), ttl, max_entries)
+    if backend == 'redis':
+        # 同じURLの保存先は接続を共有する
+        connection = _redis_connections.get(settings.SESSION_REDIS_URL)
+        if connection is None:
+            connection = _redis_connections[settings.SESSION_REDIS_URL] = RedisConnection(settings.SESSION_REDIS_URL)
+        return RedisSessionStore(connection, namespace, SessionCodec(cls), ttl, max_entries)
+    raise ValueError(f'不明なセッションの保存先: {backend}')
@@ -0,0 +1,262 @@
+"""
+時間のかかるBot処理（ストーリー生成・PDF生成など）を実行するバックグラウンドタスク実行器
+"""
+
+import asyncio
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Set, TypeVar
+
+from ..config import settings
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TaskQueueFull(Exception):
+    """キューに空きがなくタスクを受け付けられない"""
+
+
+class BackgroundTask:
+    """実行器に登録したタスク
+
+    キャンセルは協調的に行う。待機中のタスクは実行されずに終わり、実行中のタスクは
+    cancelled を確認した時点で処理を打ち切る（結果の送信前などに確認する）。
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, fn: Callable[..., Any], args: tuple, name: str, key: Optional[str]):
+        self.id = next(self._ids)
+        self.fn = fn
+        self.args = args
+        self.name = name
+        self.key = key
+        self.state = "queued"  # queued / running / done / failed / cancelled
+        self.error: Optional[BaseException] = None
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """タスクの終了を待つ（終了していればTrue）"""
+        return self._done_event.wait(timeout)
+
+
+class TaskExecutor:
+    """上限付きのワーカースレッドとキューでタスクを実行する
+
+    - ワーカー数は BACKGROUND_WORKERS、待機できるタスクは BACKGROUND_QUEUE_SIZE 件まで（超えると TaskQueueFull）
+    - key（セッションIDなど）ごとにタスクをまとめてキャンセルできる
+    - コルーチンは run_coroutine() で共有のイベントループ上で実行する（タスクごとにループを作らない）
+    - stop() はキューに残ったタスクを処理し終えてから停止する
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_size: Optional[int] = None):
+        self.worker_count = max(1, workers or settings.BACKGROUND_WORKERS)
+        self.queue_size = queue_size or settings.BACKGROUND_QUEUE_SIZE
+        self._queue: "queue.Queue[Optional[BackgroundTask]]" = queue.Queue(maxsize=self.queue_size)
+        self._threads: List[threading.Thread] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._accepting = False
+        self._stopped = False
+        self._by_key: Dict[str, Set[BackgroundTask]] = {}
+        self._running = 0
+        self._local = threading.local()
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "rejected": 0,
+            "total_wait": 0.0,
+            "total_runtime": 0.0,
+            "max_wait": 0.0
+        }
+
+    def start(self) -> None:
+        """ワーカースレッドと共有イベントループを起動"""
+        with self._lock:
+            if self._threads:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(
+                target=self._loop.run_forever, name="background-loop", daemon=True
+            )
+            self._loop_thread.start()
+            for index in range(self.worker_count):
+                thread = threading.Thread(target=self._worker, name=f"background-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._accepting = True
+            self._stopped = False
+        logger.info(f"バックグラウンド実行器を起動: {self.worker_count}スレッド, キュー上限 {self.queue_size}件")
+
+    def stop(self, timeout: float = 60.0) -> None:
+        """新しいタスクの受け付けを止め、キューに残ったタスクを処理し終えてから停止"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+            self._accepting = False
+            self._stopped = True
+        if not threads:
+            return
+        deadline = time.monotonic() + timeout
+        for _ in threads:
+            try:
+                self._queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                logger.warning("バックグラウンドキューが空かないため、タスクの完了を待たずに終了します")
+                break
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        loop, self._loop = self._loop, None
+        loop.call_soon_threadsafe(loop.stop)
+        self._loop_thread.join(5)
+        loop.close()
+        logger.info(f"バックグラウンド実行器を停止（未処理: {self._queue.qsize()}件）")
+
+    def submit(self, fn: Callable[..., Any], *args: Any, name: Optional[str] = None,
+               key: Optional[str] = None) -> BackgroundTask:
+        """タスクをキューに登録する
+
+        Args:
+            fn: 実行する関数（ワーカースレッドで呼ばれる）
+            name: ログ・統計用の名前
+            key: キャンセル用のキー（セッションIDなど）
+
+        Raises:
+            TaskQueueFull: キューに空きがない
+        """
+        if not self._threads:
+            if self._stopped:
+                raise TaskQueueFull("バックグラウンド実行器は停止しています")
+            # 起動前（スクリプトやテストなど）に呼ばれた場合はその場で起動する
+            self.start()
+        task = BackgroundTask(fn, args, name or getattr(fn, "__name__", "task"), key)
+        with self._lock:
+            try:
+                self._queue.put_nowait(task)
+            except queue.Full:
+                self.stats["rejected"] += 1
+                raise TaskQueueFull(f"バックグラウンドキューが満杯です（{self.queue_size}件）")
+            self.stats["submitted"] += 1
+            if key is not None:
+                self._by_key.setdefault(key, set()).add(task)
+        logger.debug(f"タスク登録: {task.name}#{task.id} (key={key})")
+        return task
+
+    def cancel(self, key: str) -> int:
+        """key のタスクをキャンセル（待機中のものは実行しない。実行中のものには打ち切りを伝える）
+
+        Returns:
+            キャンセルを伝えたタスク数
+        """
+        with self._lock:
+            tasks = list(self._by_key.get(key, ()))
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            logger.info(f"タスクをキャンセル: key={key}, {len(tasks)}件")
+        return len(tasks)
+
+    def current_task(self) -> Optional[BackgroundTask]:
+        """実行中のワーカースレッドのタスク（ワーカー外ではNone）"""
+        return getattr(self._local, "task", None)
+
+    def run_coroutine(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """コルーチンを共有のイベントループで実行し、結果を待つ（ワーカースレッドから呼ぶ）"""
+        if self._loop is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def _worker(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task is None:
+                self._queue.task_done()
+                return
+            try:
+                self._run(task)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, task: BackgroundTask) -> None:
+        task.started_at = time.monotonic()
+        wait = task.started_at - task.submitted_at
+        if task.cancelled:
+            task.state = "cancelled"
+        else:
+            task.state = "running"
+            self._local.task = task
+            with self._lock:
+                self._running += 1
+            try:
+                task.fn(*task.args)
+                task.state = "cancelled" if task.cancelled else "done"
+            except Exception as e:
+                task.state = "failed"
+                task.error = e
+                logger.exception(f"バックグラウンドタスクのエラー: {task.name}#{task.id}, {e}")
+            finally:
+                self._local.task = None
+                with self._lock:
+                    self._running -= 1
+        task.finished_at = time.monotonic()
+        runtime = task.finished_at - task.started_at
+
+        with self._lock:
+            if task.key is not None:
+                tasks = self._by_key.get(task.key)
+                if tasks is not None:
+                    tasks.discard(task)
+                    if not tasks:
+                        del self._by_key[task.key]
+            counter = {"done": "completed", "failed": "failed", "cancelled": "cancelled"}[task.state]
+            self.stats[counter] += 1
+            self.stats["total_wait"] += wait
+            self.stats["total_runtime"] += runtime
+            self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+        task._done_event.set()
+        logger.info(f"タスク終了: {task.name}#{task.id} {task.state}（待ち {wait:.2f}秒, 実行 {runtime:.2f}秒）")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """実行器の状態を取得"""
+        with self._lock:
+            stats = dict(self.stats)
+            running = self._running
+        finished = stats["completed"] + stats["failed"] + stats["cancelled"]
+        return {
+            "workers": self.worker_count,
+            "accepting": self._accepting,
+            "queue_size": self.queue_size,
+            "queue_depth": self._queue.qsize(),
+            "running": running,
+            "submitted": stats["submitted"],
+            "completed": stats["completed"],
+            "failed": stats["failed"],
+            "cancelled": stats["cancelled"],
+            "rejected": stats["rejected"],
+            "avg_wait": stats["total_wait"] / finished if finished else 0.0,
+            "max_wait": stats["max_wait"],
+            "avg_runtime": stats["total_runtime"] / finished if finished else 0.0
+        }
+
+
+# グローバルインスタンス
+task_executor = TaskExecutor()
@@ -0,0 +1,106 @@
+"""
+ユーザーごとのメールボックス（同じユーザーのイベント処理とバックグラウンド処理の結果反映を1つずつ順番に実行する）
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+def event_source_id(event: Any) -> Optional[str]:
+    """イベントの送信元（ユーザー・グループ・ルーム）のID"""
+    source = getattr(event, "source", None)
+    if source is None:
+        return None
+    return getattr(source, "user_id", None) or getattr(source, "group_id", None) or getattr(source, "room_id", None)
+
+
+class UserMailbox:
+    """ユーザーIDごとに処理を直列化する
+
+    post() された処理は、そのユーザーの処理が実行中でなければ呼び出したスレッドでそのまま実行し、
+    実行中であればメールボックスに積んで、実行中のスレッドが順番に続けて実行する。
+    同じユーザーの処理が同時に走ることはなく、別のユーザーの処理は互いに待たずに並行して進む。
+    ロックを持ったまま待つスレッドはないため、Webhookワーカーが他のユーザーのイベントで止まることもない。
+
+    セッションの状態を変更する処理（Webhookイベントの処理、ストーリー・PDF生成結果の反映）はすべてここを通す。
+    時間のかかる生成処理そのものはメールボックスの外で実行し、結果の反映だけを post() する。
+
+    実行スレッドについての約束:
+    - 保証するのは「同じユーザーの処理は1つずつ、投入順に実行される」ことだけで、どのスレッドで実行されるかは保証しない。
+    - post() はどのスレッドから呼んでもよい（再入可能）。処理は、そのユーザーのメールボックスが空いていたときに
+      post() したスレッドが実行し、そのスレッドが後から積まれた処理も続けて実行する。
+    - そのため、バックグラウンドタスク（task_executor のスレッド）から post() した結果の反映は、
+      Webhookワーカー（EventDispatcher のシャード）ではなくタスク実行器のスレッドで動くことがある。
+      その間に届いた同じユーザーのWebhookイベントも、そのタスク実行器のスレッドで処理される。
+    - post() に渡す処理は、スレッドローカルな状態や特定のワーカースレッドで動くことを前提にしない。
+      後続の処理を引き受けている間は呼び出し元のスレッドが戻らないため、処理はなるべく短くする。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 実行中のユーザーのみエントリを持つ（値は後続の処理）
+        self._boxes: Dict[str, Deque[Tuple[Callable[..., Any], tuple]]] = {}
+        self.stats = {"posted": 0, "deferred": 0, "failed": 0, "max_depth": 0}
+
+    def post(self, key: Optional[str], fn: Callable[..., Any], *args: Any) -> bool:
+        """key（ユーザーID）の処理として fn(*args) を実行する
+
+        どのスレッドから呼んでもよい。実行スレッドはクラスの説明（実行スレッドについての約束）を参照。
+
+        Returns:
+            呼び出したスレッドで実行した場合はTrue、実行中の処理の後ろに積んだ場合はFalse
+        """
+        if key is None:
+            # 送信元のないイベントは直列化しない
+            self._invoke(fn, args)
+            return True
+
+        with self._lock:
+            self.stats["posted"] += 1
+            box = self._boxes.get(key)
+            if box is not None:
+                box.append((fn, args))
+                self.stats["deferred"] += 1
+                self.stats["max_depth"] = max(self.stats["max_depth"], len(box))
+                return False
+            self._boxes[key] = deque()
+
+        while True:
+            self._invoke(fn, args)
+            with self._lock:
+                box = self._boxes[key]
+                if not box:
+                    del self._boxes[key]
+                    return True
+                fn, args = box.popleft()
+
+    def _invoke(self, fn: Callable[..., Any], args: tuple) -> None:
+        try:
+            fn(*args)
+        except Exception as e:
+            with self._lock:
+                self.stats["failed"] += 1
+            logger.exception(f"メールボックスの処理エラー: {getattr(fn, '__name__', fn)}, {e}")
+
+    def is_busy(self, key: str) -> bool:
+        """key の処理が実行中か"""
+        with self._lock:
+            return key in self._boxes
+
+    def get_stats(self) -> Dict[str, Any]:
+        """メールボックスの状態を取得"""
+        with self._lock:
+            return {
+                "active_users": len(self._boxes),
+                "pending": sum(len(box) for box in self._boxes.values()),
+                **self.stats
+            }
+
+
+# グローバルインスタンス
+user_mailbox = UserMailbox()
@@ -3,22 +3,81 @@ Vivliostyle PDF生成サービス
 """
 
 import asyncio
+import os
 import tempfile
 import shutil
 import logging
-import requests
+import time
+import weakref
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+import httpx
 from jinja2 import Environment, FileSystemLoader
 
+from .image_fetcher import image_fetcher
+from .image_pipeline import image_pipeline
+from .image_staging import image_stager, StagingReport
+from ..config import settings
+
 
 logger = logging.getLogger(__name__)
 
 
+class RenderJobError(RuntimeError):
+    """vivliostyleサービスのジョブAPIのエラー（HTTPステータスとRetry-After秒数を保持）"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+@dataclass
+class RenderJob:
+    """PDF生成ジョブ（vivliostyleサービスの /jobs が返す JobInfo と同じ項目・状態を持つ）"""
+    job_id: str
+    status: str  # "queued" | "running" | "succeeded" | "failed"
+    template_id: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    file_size: Optional[int] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RenderJob":
+        def parse(value):
+            return datetime.fromisoformat(value) if value else None
+
+        return cls(
+            job_id=data["job_id"],
+            status=data["status"],
+            template_id=data["template_id"],
+            created_at=parse(data["created_at"]),
+            started_at=parse(data.get("started_at")),
+            finished_at=parse(data.get("finished_at")),
+            attempts=data.get("attempts", 0),
+            error=data.get("error"),
+            file_size=data.get("file_size")
+        )
+
+
 class VivliostyleService:
-    """Vivliostyle PDF生成サービス"""
+    """Vivliostyle PDF生成サービス
+
+    generate_pdf はこのプロセス内でCLIを実行する。submit_job / get_job / wait_job / download_job_pdf は
+    vivliostyleサービスの非同期ジョブAPI（POST /jobs・GET /jobs/{id}・GET /jobs/{id}/pdf）のクライアント。
+    """
     
-    def __init__(self):
+    def __init__(self, api_url: Optional[str] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
         # テンプレートディレクトリ
         self.templates_dir = Path(__file__).parent.parent.parent / "templates"
         
@@ -27,6 +86,147 @@ class VivliostyleService:
             loader=FileSystemLoader(str(self.templates_dir)),
             autoescape=True
         )
+        
+        # ジョブAPIのクライアント（イベントループごとに1つ、接続を使い回す）
+        self.api_url = (api_url or settings.VIVLIOSTYLE_API_URL).rstrip("/")
+        self._transport = transport
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """実行中のイベントループ用のジョブAPIクライアントを取得"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=self.api_url,
+                timeout=httpx.Timeout(settings.VIVLIOSTYLE_API_TIMEOUT),
+                transport=self._transport
+            )
+            self._clients[loop] = client
+        return client
+    
+    async def close(self) -> None:
+        """実行中のイベントループのジョブAPIクライアントを閉じる"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    @staticmethod
+    def _api_error(response: httpx.Response, action: str) -> RenderJobError:
+        try:
+            detail = response.json().get("detail", response.text)
+        except ValueError:
+            detail = response.text
+        retry_after = response.headers.get("Retry-After")
+        return RenderJobError(
+            f"{action}に失敗しました（HTTP {response.status_code}）: {detail}",
+            status_code=response.status_code,
+            retry_after=float(retry_after) if retry_after else None
+        )
+    
+    async def submit_job(self, template_id: str, payload: Dict[str, Any]) -> RenderJob:
+        """PDF生成ジョブを投入し、完了を待たずに返す
+        
+        Args:
+            template_id: vivliostyleサービスのテンプレートID（例: "single/minimal-single"）
+            payload: /generate と同じペイロード（title, author, images, paragraphs など）
+        
+        Returns:
+            受け付けたジョブ（状態は get_job / wait_job で確認）
+        """
+        try:
+            response = await self._get_client().post(
+                "/jobs",
+                json={"template_id": template_id, "payload": payload}
+            )
+        except httpx.HTTPError as e:
+            raise RenderJobError(f"ジョブの投入に失敗しました: {str(e)}")
+        if response.status_code != 202:
+            raise self._api_error(response, "ジョブの投入")
+        job = RenderJob.from_dict(response.json())
+        logger.info(f"PDF生成ジョブ投入: {job.job_id} ({template_id})")
+        return job
+    
+    async def get_job(self, job_id: str) -> Optional[RenderJob]:
+        """ジョブの状態を取得（存在しなければNone）"""
+        try:
+            response = await self._get_client().get(f"/jobs/{job_id}")
+        except httpx.HTTPError as e:
+            raise RenderJobError(f"ジョブの状態の取得に失敗しました: {str(e)}")
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise self._api_error(response, "ジョブの状態の取得")
+        return RenderJob.from_dict(response.json())
+    
+    async def wait_job(
+        self,
+        job_id: str,
+        timeout: Optional[float] = None,
+        poll_interval: Optional[float] = None
+    ) -> RenderJob:
+        """ジョブが終わる（succeeded / failed）までポーリングして待つ
+        
+        Raises:
+            asyncio.TimeoutError: timeout秒以内に終わらなかった場合
+            RenderJobError: ジョブが見つからない・APIエラーの場合
+        """
+        timeout = settings.VIVLIOSTYLE_JOB_WAIT_TIMEOUT if timeout is None else timeout
+        poll_interval = settings.VIVLIOSTYLE_JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get_job(job_id)
+            if job is None:
+                raise RenderJobError(f"ジョブが見つかりません: {job_id}", status_code=404)
+            if job.is_finished:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"ジョブが時間内に終わりませんでした: {job_id}（status={job.status}）")
+            await asyncio.sleep(min(poll_interval, remaining))
+    
+    async def download_job_pdf(self, job_id: str, output_path: Path) -> Path:
+        """完了したジョブのPDFを output_path に保存
+        
+        Raises:
+            RenderJobError: 未完了（409、retry_after付き）・失敗・削除済み（410）・存在しない（404）場合
+        """
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            async with self._get_client().stream("GET", f"/jobs/{job_id}/pdf") as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise self._api_error(response, "PDFのダウンロード")
+                # 途中で失敗しても壊れたPDFを残さないよう一時ファイル経由で保存
+                fd, tmp_name = tempfile.mkstemp(dir=output_path.parent, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        async for chunk in response.aiter_bytes():
+                            f.write(chunk)
+                    os.replace(tmp_name, output_path)
+                except BaseException:
+                    os.unlink(tmp_name)
+                    raise
+        except httpx.HTTPError as e:
+            raise RenderJobError(f"PDFのダウンロードに失敗しました: {str(e)}")
+        return output_path
+    
+    async def generate_pdf_via_job(
+        self,
+        template_id: str,
+        payload: Dict[str, Any],
+        output_path: Path,
+        timeout: Optional[float] = None
+    ) -> Path:
+        """ジョブAPIでPDFを生成して保存する（投入→完了待ち→ダウンロード）"""
+        job = await self.submit_job(template_id, payload)
+        job = await self.wait_job(job.job_id, timeout=timeout)
+        if job.status == "failed":
+            raise RenderJobError(f"PDF生成ジョブが失敗しました: {job.error}")
+        return await self.download_job_pdf(job.job_id, output_path)
     
     async def generate_pdf(
         self,
@@ -57,34 +257,17 @@ class VivliostyleService:
         if vivliostyle_options is None:
             vivliostyle_options = {}
         
-        # 一時ディレクトリを作成
-        with tempfile.TemporaryDirectory() as temp_dir:
+        # 一時ディレクトリを作成（アップロード画像をハードリンクで配置できるよう TEMP_DIR 配下）
+        with tempfile.TemporaryDirectory(dir=settings.TEMP_DIR) as temp_dir:
             temp_path = Path(temp_dir)
+            staging_report = StagingReport()
             
             try:
-                # 1. 画像を処理（ダウンロード＆コピー）
-                if data.get("cover_image"):
-                    cover_image_local = await self._process_image(data["cover_image"], temp_path, "cover")
-                    if cover_image_local:
-                        data["cover_image"] = cover_image_local
-                        logger.info(f"カバー画像を処理: {cover_image_local}")
-                    else:
-                        # 画像処理失敗の場合は画像なしで続行
-                        logger.warning("カバー画像の処理に失敗しました")
-                        data["cover_image"] = None
+                # 1. 画像を処理（カバーと年表の画像を並行してダウンロード＆配置）
+                await self._process_images(data, temp_path, staging_report, template_name)
                 
-                # 年表の画像も処理
-                if data.get("timeline"):
-                    for i, item in enumerate(data["timeline"]):
-                        if item.get("image"):
-                            image_local = await self._process_image(item["image"], temp_path, f"timeline_{i}")
-                            if image_local:
-                                item["image"] = image_local
-                                logger.info(f"年表画像{i}を処理: {image_local}")
-                            else:
-                                # 画像処理失敗の場合は画像なしで続行
-                                logger.warning(f"年表画像{i}の処理に失敗しました")
-                                item["image"] = None
+                if staging_report.methods:
+                    logger.info(f"画像ステージング: {staging_report}")
                 
                 # 2. HTMLファイルを保存（画像処理後）
                 html_content = self._render_template(template_name, data)
@@ -109,18 +292,65 @@ class VivliostyleService:
                 logger.error(f"PDF生成エラー: {str(e)}")
                 raise
     
+    async def _process_images(
+        self,
+        data: Dict[str, Any],
+        temp_dir: Path,
+        report: Optional[StagingReport] = None,
+        template_name: Optional[str] = None
+    ) -> None:
+        """データ内の全画像（カバー・年表・写真ページ）を並行して処理し、ファイル名に置き換える
+        
+        同時取得数は IMAGE_FETCH_CONCURRENCY 件まで。処理に失敗した画像はNoneにして画像なしで続行する。
+        """
+        semaphore = asyncio.Semaphore(settings.IMAGE_FETCH_CONCURRENCY)
+        
+        async def process(image_path: str, prefix: str, slot: str) -> Optional[str]:
+            async with semaphore:
+                return await self._process_image(
+                    image_path, temp_dir, prefix, report,
+                    image_box=settings.get_image_slot(template_name, slot)
+                )
+        
+        targets = []  # (画像を持つdict, キー, 表示名, プレフィックス, 画像枠)
+        if data.get("cover_image"):
+            targets.append((data, "cover_image", "カバー画像", "cover", "cover"))
+        for i, item in enumerate(data.get("timeline") or []):
+            if item.get("image"):
+                targets.append((item, "image", f"年表画像{i}", f"timeline_{i}", "timeline"))
+        for i, page in enumerate(data.get("pages") or []):
+            if page.get("image"):
+                targets.append((page, "image", f"写真{i + 1}", f"page_{i}", "page"))
+        
+        results = await asyncio.gather(*(
+            process(container[key], prefix, slot) for container, key, _, prefix, slot in targets
+        ))
+        
+        for (container, key, label, _, _), image_local in zip(targets, results):
+            if image_local:
+                container[key] = image_local
+                logger.info(f"{label}を処理: {image_local}")
+            else:
+                # 画像処理失敗の場合は画像なしで続行
+                logger.warning(f"{label}の処理に失敗しました")
+                container[key] = None
+    
     async def _process_image(
         self,
         image_path: str,
         temp_dir: Path,
-        prefix: str = "image"
+        prefix: str = "image",
+        report: Optional[StagingReport] = None,
+        image_box: Optional[tuple] = None
     ) -> str:
-        """画像を処理（ダウンロードまたはコピー）
+        """画像を処理（ダウンロード、またはローカルファイルを縮小して一時ディレクトリに配置）
         
         Args:
             image_path: 画像パス（URLまたはローカルパス）
             temp_dir: 一時ディレクトリ
             prefix: ファイル名のプレフィックス
+            report: ステージング結果の集計先
+            image_box: 画像枠（幅mm, 高さmm）。指定時はこの枠に合わせて縮小する
         
         Returns:
             相対パス（ファイル名のみ）
@@ -137,21 +367,18 @@ class VivliostyleService:
                     
                     # file_serviceを使ってローカルパスを取得
                     from ..services.file_service import file_service
-                    from ..config import settings
                     
                     file_metadata = file_service.get_file_by_id(file_id)
                     if file_metadata:
-                        # uploadsディレクトリからの相対パスを絶対パスに変換
-                        uploads_dir = Path(settings.UPLOADS_DIR)
-                        source_path = uploads_dir / file_metadata['stored_filename']
+                        # 配置（flat / sharded）に応じた実ファイルのパス
+                        source_path = file_service.resolve_path(file_metadata)
                         
-                        if source_path.exists():
-                            dest_path = temp_dir / f"{prefix}{source_path.suffix}"
-                            shutil.copy2(source_path, dest_path)
-                            logger.info(f"ローカル画像をコピー: {source_path} -> {dest_path.name}")
-                            return dest_path.name
+                        if source_path is not None:
+                            dest_name = await self._place_image(source_path, temp_dir, prefix, report, image_box)
+                            logger.info(f"ローカル画像を配置: {source_path} -> {dest_name}")
+                            return dest_name
                         else:
-                            logger.warning(f"ファイルが見つかりません: {source_path}")
+                            logger.warning(f"ファイルが見つかりません: {file_metadata['file_path']}")
                             return None
                     else:
                         logger.warning(f"メタデータが見つかりません: {file_id}")
@@ -159,36 +386,20 @@ class VivliostyleService:
                         pass
             
             if image_path.startswith(("http://", "https://")):
-                # 外部URLの場合：ダウンロード
+                # 外部URLの場合：ダウンロード（キャッシュ済みなら再検証のみ）して配置
                 logger.info(f"画像をダウンロード: {image_path}")
-                response = requests.get(image_path, timeout=30)
-                response.raise_for_status()
-                
-                # 拡張子を取得（Content-Typeから推測）
-                content_type = response.headers.get("Content-Type", "")
-                if "jpeg" in content_type or "jpg" in content_type:
-                    ext = ".jpg"
-                elif "png" in content_type:
-                    ext = ".png"
-                elif "gif" in content_type:
-                    ext = ".gif"
-                else:
-                    ext = ".jpg"  # デフォルト
-                
-                dest_path = temp_dir / f"{prefix}{ext}"
-                with open(dest_path, "wb") as f:
-                    f.write(response.content)
+                cached_path = await image_fetcher.fetch(image_path)
+                if cached_path is None:
+                    return None
                 
-                logger.info(f"画像をダウンロード完了: {dest_path.name}")
-                return dest_path.name
+                return await self._place_image(cached_path, temp_dir, prefix, report, image_box)
             else:
-                # ローカルファイルの場合：コピー
+                # ローカルファイルの場合：配置
                 source_path = Path(image_path)
                 if source_path.exists():
-                    dest_path = temp_dir / f"{prefix}{source_path.suffix}"
-                    shutil.copy2(source_path, dest_path)
-                    logger.info(f"画像をコピー: {dest_path.name}")
-                    return dest_path.name
+                    dest_name = await self._place_image(source_path, temp_dir, prefix, report, image_box)
+                    logger.info(f"画像を配置: {dest_name}")
+                    return dest_name
                 else:
                     logger.warning(f"画像ファイルが見つかりません: {image_path}")
                     return None
@@ -196,6 +407,21 @@ class VivliostyleService:
             logger.error(f"画像処理エラー: {image_path}, {str(e)}")
             return None
     
+    async def _place_image(
+        self,
+        source_path: Path,
+        temp_dir: Path,
+        prefix: str,
+        report: Optional[StagingReport] = None,
+        image_box: Optional[tuple] = None
+    ) -> str:
+        """画像を（必要なら縮小して）一時ディレクトリに配置し、ファイル名を返す"""
+        if image_box:
+            source_path = await asyncio.to_thread(image_pipeline.process, source_path, image_box)
+        dest_path = temp_dir / f"{prefix}{source_path.suffix}"
+        image_stager.stage(source_path, dest_path, report)
+        return dest_path.name
+    
     def _render_template(self, template_name: str, data: Dict[str, Any]) -> str:
         """Jinja2テンプレートをレンダリング
         
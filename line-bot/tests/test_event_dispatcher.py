@@ -0,0 +1,119 @@
+"""
+Webhookイベント処理の簡易テスト
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from linebot.v3.webhook import WebhookHandler
+from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+from app.services.event_dispatcher import EventDispatcher, DispatcherBusy
+
+CHANNEL_SECRET = "test-secret"
+
+
+def _webhook_body(events):
+    body = json.dumps({"destination": "Uxxx", "events": events})
+    signature = base64.b64encode(
+        hmac.new(CHANNEL_SECRET.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    ).decode("utf-8")
+    return body, signature
+
+
+def _text_event(user_id, text):
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": f"{user_id}-{text}",
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": "token",
+        "message": {"type": "text", "id": "1", "quoteToken": "q", "text": text}
+    }
+
+
+def test_per_user_ordering():
+    """同じユーザーのイベントが受信順に処理されるかのテスト"""
+    print("=" * 50)
+    print("Webhookイベント処理テスト")
+    print("=" * 50)
+
+    handler = WebhookHandler(CHANNEL_SECRET)
+    received = {}
+    lock = threading.Lock()
+
+    @handler.add(MessageEvent, message=TextMessageContent)
+    def on_text(event):
+        time.sleep(0.01)
+        with lock:
+            received.setdefault(event.source.user_id, []).append(event.message.text)
+
+    dispatcher = EventDispatcher(handler, workers=4, queue_size=100)
+    dispatcher.start()
+    for i in range(10):
+        body, signature = _webhook_body([_text_event("U1", str(i)), _text_event("U2", str(i))])
+        assert dispatcher.submit(body, signature) == 2
+    dispatcher.stop()
+
+    print(f"✅ U1: {received['U1']}")
+    assert received["U1"] == [str(i) for i in range(10)]
+    assert received["U2"] == [str(i) for i in range(10)]
+    stats = dispatcher.get_stats()
+    print(f"✅ 統計: processed={stats['processed']}, max_queue_wait={stats['max_queue_wait']:.3f}s")
+    assert stats["processed"] == 20
+    assert stats["queue_depth"] == 0
+
+    print("\n" + "=" * 50)
+    print("✨ Webhookイベント処理テスト完了！")
+    print("=" * 50)
+
+
+def test_queue_full():
+    """キューが満杯のときに受け付けを拒否するかのテスト"""
+    print("\n" + "=" * 50)
+    print("キュー上限テスト")
+    print("=" * 50)
+
+    handler = WebhookHandler(CHANNEL_SECRET)
+    dispatcher = EventDispatcher(handler, workers=1, queue_size=2)
+    # ワーカーを起動せずにキューを埋める
+    dispatcher._threads = [threading.current_thread()]
+    body, signature = _webhook_body([_text_event("U1", "a"), _text_event("U1", "b")])
+    assert dispatcher.submit(body, signature) == 2
+    try:
+        dispatcher.submit(body, signature)
+        assert False, "DispatcherBusy が送出されていません"
+    except DispatcherBusy as e:
+        print(f"✅ 拒否: {e}")
+    assert dispatcher.get_stats()["rejected"] == 2
+
+    print("\n" + "=" * 50)
+    print("✨ キュー上限テスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # Webhookイベント処理テスト
+        test_per_user_ordering()
+
+        # キュー上限テスト
+        test_queue_full()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
@@ -0,0 +1,359 @@
+"""
+ファイルサービスの簡易テスト
+"""
+
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.file_service import FileService
+from app.services.metadata_store import MetadataStore
+
+
+def test_metadata_migration():
+    """metadata.json からSQLiteへの移行テスト"""
+    print("=" * 50)
+    print("メタデータ移行テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        uploads = Path(temp_dir)
+        (uploads / "old-id.jpg").write_bytes(b"jpeg")
+        legacy = {
+            "old-id": {
+                "file_id": "old-id",
+                "original_filename": "file.jpg",
+                "stored_filename": "old-id.jpg",
+                "file_path": str(uploads / "old-id.jpg"),
+                "content_type": "image/jpeg",
+                "file_size": 4,
+                "upload_time": "2025-06-30T22:07:02",
+                "message_type": "image"
+            }
+        }
+        (uploads / "metadata.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+        # 1回目の起動で移行される
+        service = FileService(str(uploads), metadata_backend="sqlite")
+        print(f"✅ 移行後の件数: {service.store.count()}")
+        assert service.store.count() == 1
+        assert service.get_file_by_id("old-id")["stored_filename"] == "old-id.jpg"
+        service.store.close()
+
+        # 2回目の起動では再移行しない（削除したメタデータが復活しない）
+        service = FileService(str(uploads), metadata_backend="sqlite")
+        service.store.delete("old-id")
+        service.store.close()
+        service = FileService(str(uploads), metadata_backend="sqlite")
+        print(f"✅ 再起動後の件数: {service.store.count()}")
+        assert service.store.count() == 0
+        service.store.close()
+
+    # インターフェースは抽象クラス（直接は作れない）
+    try:
+        MetadataStore()
+        assert False, "TypeErrorになるはず"
+    except TypeError:
+        pass
+
+    print("\n" + "=" * 50)
+    print("✨ メタデータ移行テスト完了！")
+    print("=" * 50)
+
+
+def test_save_and_lookup():
+    """保存と検索のテスト"""
+    print("\n" + "=" * 50)
+    print("保存・検索テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        service = FileService(temp_dir, metadata_backend="sqlite")
+
+        image = service.save_file(b"image-bytes", "photo.jpg", "image/jpeg")
+        pdf = service.save_file(b"%PDF-1.4", "memoir.pdf", "application/pdf")
+
+        found = service.get_file_by_id(image["file_id"])
+        print(f"✅ 画像: {found['stored_filename']} ({found['message_type']})")
+        assert found["file_size"] == len(b"image-bytes")
+
+        images = service.store.list_by_type("image")
+        files = service.store.list_by_type("file")
+        print(f"✅ 画像: {len(images)}件, ファイル: {len(files)}件")
+        assert [m["file_id"] for m in images] == [image["file_id"]]
+        assert [m["file_id"] for m in files] == [pdf["file_id"]]
+
+        assert len(service.list_files()) == 2
+        service.store.close()
+
+    print("\n" + "=" * 50)
+    print("✨ 保存・検索テスト完了！")
+    print("=" * 50)
+
+
+def test_index_and_repair():
+    """索引の検索とrepairのテスト"""
+    print("\n" + "=" * 50)
+    print("索引・修復テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        service = FileService(temp_dir, metadata_backend="sqlite")
+
+        # 索引にないIDはNoneを返し、ネガティブキャッシュに載る
+        assert service.get_file_by_id("unknown-id") is None
+        assert "unknown-id" in service._missing
+
+        # メタデータのないファイルは repair() で登録される
+        (Path(temp_dir) / "orphan-id.png").write_bytes(b"png")
+        result = service.repair()
+        print(f"✅ 修復結果: {result}")
+        assert result == {"registered": 1, "missing": 0}
+        assert service.get_file_by_id("orphan-id")["message_type"] == "image"
+
+        # 再起動後もストアから索引が読み込まれる
+        service.store.close()
+        service = FileService(temp_dir, metadata_backend="sqlite")
+        assert service.get_file_by_id("orphan-id") is not None
+        service.store.close()
+
+    print("\n" + "=" * 50)
+    print("✨ 索引・修復テスト完了！")
+    print("=" * 50)
+
+
+def test_negative_cache():
+    """別プロセスが登録したファイルが、なしと覚えたIDでも期限後には見つかるかのテスト"""
+    print("\n" + "=" * 50)
+    print("ネガティブキャッシュテスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 同じストアを使う2つのワーカープロセスを模擬
+        reader = FileService(temp_dir, metadata_backend="sqlite")
+        writer = FileService(temp_dir, metadata_backend="sqlite")
+        reader.negative_cache_ttl = 0.2
+
+        # 索引にない既存ファイルはストアから読み込み、なしとは覚えない
+        saved = writer.save_file(b"first", "first.jpg", "image/jpeg")
+        assert reader.get_file_by_id(saved["file_id"])["file_size"] == 5
+        assert saved["file_id"] not in reader._missing
+        print("✅ 別プロセスが登録したファイルはストアから見つかる")
+
+        # ストアにもないIDだけを覚える。期限内に別プロセスが登録しても期限後には見つかる
+        assert reader.get_file_by_id("late-id") is None
+        assert "late-id" in reader._missing
+        late = writer.save_file(b"late", "late.jpg", "image/jpeg")
+        writer.store.put({**late, "file_id": "late-id"})
+        assert reader.get_file_by_id("late-id") is None
+        time.sleep(0.25)
+        assert reader.get_file_by_id("late-id") is not None
+        assert "late-id" not in reader._missing
+        print(f"✅ なしと覚えるのは {reader.negative_cache_ttl} 秒だけ")
+
+        # ストアを引いている間に同じプロセスで登録されたら、なしと覚えない
+        original_get = reader.store.get
+
+        def racing_get(file_id):
+            result = original_get(file_id)
+            reader._index_put(reader._normalize({**saved, "file_id": file_id}))
+            return result
+
+        reader.store.get = racing_get
+        assert reader.get_file_by_id("raced-id") is not None
+        assert "raced-id" not in reader._missing
+        reader.store.get = original_get
+        print("✅ 問い合わせ中に登録されたIDはなしと覚えない")
+
+        reader.store.close()
+        writer.store.close()
+
+    print("\n" + "=" * 50)
+    print("✨ ネガティブキャッシュテスト完了！")
+    print("=" * 50)
+
+
+def test_layout_migration():
+    """flat から sharded への配置移行テスト"""
+    print("\n" + "=" * 50)
+    print("配置移行テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        uploads = Path(temp_dir)
+        flat = FileService(temp_dir, metadata_backend="sqlite", layout="flat")
+        old = flat.save_file(b"old-image", "old.jpg", "image/jpeg")
+        assert Path(old["file_path"]) == uploads / old["stored_filename"]
+        flat.store.close()
+
+        service = FileService(temp_dir, metadata_backend="sqlite", layout="sharded")
+        new = service.save_file(b"new-image", "new.jpg", "image/jpeg")
+        new_path = Path(new["file_path"])
+        print(f"✅ 新規ファイル: {new_path.relative_to(uploads)}")
+        assert new_path == uploads / new["file_id"][:2] / new["file_id"][2:4] / new["stored_filename"]
+
+        # 移行前は flat の場所で見つかる
+        assert service.resolve_path(service.get_file_by_id(old["file_id"])) == uploads / old["stored_filename"]
+
+        result = service.migrate_layout(pause=0)
+        print(f"✅ 移行結果: {result}")
+        assert result["migrated"] == 1
+        moved = service.get_file_by_id(old["file_id"])
+        assert moved["layout"] == "sharded"
+        assert service.resolve_path(moved).read_bytes() == b"old-image"
+        assert not (uploads / old["stored_filename"]).exists()
+        service.store.close()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 移行の走査後に削除されたファイルは、メタデータもリンクも残さない
+        uploads = Path(temp_dir)
+        flat = FileService(temp_dir, metadata_backend="sqlite", layout="flat")
+        deleted = flat.save_file(b"deleted-image", "deleted.jpg", "image/jpeg")
+        kept = flat.save_file(b"kept-image", "kept.jpg", "image/jpeg")
+        flat.store.close()
+
+        service = FileService(temp_dir, metadata_backend="sqlite", layout="sharded")
+        original_link = os.link
+
+        def link_then_delete(source, dest):
+            original_link(source, dest)
+            if Path(source).name == deleted["stored_filename"]:
+                service.delete_file(deleted["file_id"])
+
+        os.link = link_then_delete
+        try:
+            result = service.migrate_layout(pause=0)
+        finally:
+            os.link = original_link
+        assert result["migrated"] == 1
+        assert service.get_file_by_id(deleted["file_id"]) is None
+        assert service.store.get(deleted["file_id"]) is None
+        assert not any(p.name == deleted["stored_filename"] for p in uploads.rglob("*"))
+        assert service.resolve_path(service.get_file_by_id(kept["file_id"])).read_bytes() == b"kept-image"
+        service.store.close()
+    print("✅ 移行中に削除されたファイルを復活させない")
+
+    print("\n" + "=" * 50)
+    print("✨ 配置移行テスト完了！")
+    print("=" * 50)
+
+
+def test_streaming_save():
+    """ストリーミング保存と生成済みファイルの登録テスト"""
+    print("\n" + "=" * 50)
+    print("ストリーミング保存テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        service = FileService(temp_dir, metadata_backend="sqlite")
+        data = b"x" * (3 * 1024 * 1024 + 10)
+
+        # イテレータから保存
+        from_iter = service.save_stream((data[i:i + 4096] for i in range(0, len(data), 4096)), "a.jpg")
+        # ファイルオブジェクトから保存
+        from_file = service.save_stream(io.BytesIO(data), "b.jpg")
+        for metadata in (from_iter, from_file):
+            assert metadata["file_size"] == len(data)
+            assert metadata["sha256"] == hashlib.sha256(data).hexdigest()
+            assert Path(metadata["file_path"]).read_bytes() == data
+        print(f"✅ 保存サイズ: {from_iter['file_size']:,} bytes")
+
+        # 書き出し済みのPDFは移動して登録する
+        pdf = Path(temp_dir) / "memoir_test.pdf"
+        pdf.write_bytes(b"%PDF-1.4 test")
+        registered = service.register_file(pdf, pdf.name, "application/pdf")
+        print(f"✅ PDF登録: {registered['stored_filename']}")
+        assert not pdf.exists()
+        assert Path(registered["file_path"]).read_bytes() == b"%PDF-1.4 test"
+        assert registered["message_type"] == "file"
+
+        # 一時ファイルが残っていない
+        assert not list(Path(temp_dir).glob("*.tmp"))
+        service.store.close()
+
+    print("\n" + "=" * 50)
+    print("✨ ストリーミング保存テスト完了！")
+    print("=" * 50)
+
+
+def test_dedup():
+    """同じ内容のファイルの重複排除と参照数による削除のテスト"""
+    print("\n" + "=" * 50)
+    print("重複排除テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        service = FileService(temp_dir, metadata_backend="sqlite")
+
+        first = service.save_file(b"same-photo", "photo1.jpg", "image/jpeg")
+        second = service.save_file(b"same-photo", "photo2.jpg", "image/jpeg")
+        other = service.save_file(b"other-photo", "photo3.jpg", "image/jpeg")
+        print(f"✅ 参照先: {second.get('blob_id')}")
+        assert second["file_id"] != first["file_id"]
+        assert second["blob_id"] == first["file_id"]
+        assert second["file_path"] == first["file_path"]
+        assert "blob_id" not in other
+        assert len([p for p in Path(temp_dir).rglob("*.jpg")]) == 2
+
+        # 最初のファイルを削除しても、参照が残っている間は実ファイルを残す
+        assert service.delete_file(first["file_id"])
+        assert service.get_file_by_id(first["file_id"]) is None
+        assert service.resolve_path(service.get_file_by_id(second["file_id"])).read_bytes() == b"same-photo"
+
+        # 再起動後も参照数は索引から復元される
+        service.store.close()
+        service = FileService(temp_dir, metadata_backend="sqlite")
+        third = service.save_file(b"same-photo", "photo4.jpg", "image/jpeg")
+        assert third["blob_id"] == first["file_id"]
+
+        # 最後の参照を削除すると実ファイルも削除される
+        blob_path = Path(third["file_path"])
+        assert service.delete_file(second["file_id"])
+        assert blob_path.exists()
+        assert service.delete_file(third["file_id"])
+        assert not blob_path.exists()
+        assert not service.delete_file(third["file_id"])
+        service.store.close()
+
+    print("\n" + "=" * 50)
+    print("✨ 重複排除テスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # メタデータ移行テスト
+        test_metadata_migration()
+
+        # 保存・検索テスト
+        test_save_and_lookup()
+
+        # 索引・修復テスト
+        test_index_and_repair()
+
+        # ネガティブキャッシュテスト
+        test_negative_cache()
+
+        # 配置移行テスト
+        test_layout_migration()
+
+        # ストリーミング保存テスト
+        test_streaming_save()
+
+        # 重複排除テスト
+        test_dedup()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
@@ -0,0 +1,75 @@
+"""
+画像パイプラインの簡易テスト（Pillowが必要）
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from PIL import Image
+
+from app.services.image_pipeline import ImagePipeline
+
+
+def _noisy_image():
+    return Image.merge("RGB", [Image.effect_noise((64, 48), 80) for _ in range(3)])
+
+
+def test_metadata_removed():
+    """縮小不要な画像でもEXIF（位置情報）付きのまま配らないかのテスト"""
+    print("=" * 50)
+    print("メタデータ除去テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        pipeline = ImagePipeline(cache_dir=tmp / "cache", profile="print")
+        pipeline.enabled = True
+        # 再エンコード後が必ず元より大きくなるよう最高品質にする
+        pipeline.profile = dict(pipeline.profile, quality=100)
+        pipeline.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # 枠より小さく、強めに圧縮済みのJPEG
+        photo = tmp / "gps.jpg"
+        exif = Image.Exif()
+        exif[0x010F] = "TestCamera"
+        exif.get_ifd(0x8825)[2] = (35.0, 41.0, 0.0)  # GPSLatitude
+        _noisy_image().save(photo, quality=5, exif=exif)
+        with Image.open(photo) as original:
+            assert original.getexif().get_ifd(0x8825)
+
+        result = pipeline.process(photo, (100, 100))
+        assert result != photo
+        with Image.open(result) as processed:
+            assert not processed.getexif()
+            assert "exif" not in processed.info
+        assert pipeline.stats["passthrough"] == 0
+        print(f"✅ EXIF付き画像は再エンコード: {result.name}")
+
+        # メタデータのない画像は小さくならなければ元のまま
+        plain = tmp / "plain.jpg"
+        _noisy_image().save(plain, quality=5)
+        assert pipeline.process(plain, (100, 100)) == plain
+        assert pipeline.process(plain, (100, 100)) == plain
+        assert pipeline.stats["passthrough"] == 1
+        print(f"✅ メタデータなしは元画像: {pipeline.get_stats()}")
+
+    print("\n" + "=" * 50)
+    print("✨ メタデータ除去テスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # メタデータ除去テスト
+        test_metadata_removed()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
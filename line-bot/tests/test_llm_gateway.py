@@ -0,0 +1,173 @@
+"""
+LLMゲートウェイの簡易テスト（モックバックエンドでオフライン実行）
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.llm_gateway import LLMGateway, LLMError, LLMTimeout, MockBackend
+
+
+def _messages(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_retry_and_errors():
+    """429・5xxはリトライし、それ以外のエラーはそのまま返すかのテスト"""
+    print("=" * 50)
+    print("リトライテスト")
+    print("=" * 50)
+
+    backend = MockBackend(errors=[429, 503])
+    gateway = LLMGateway(backend, max_retries=3, retry_base_delay=0.01, retry_max_delay=0.05)
+    try:
+        assert gateway.complete(_messages("こんにちは")) == "（モック応答）こんにちは"
+        assert backend.calls == 3
+        assert gateway.get_stats()["retries"] == 2
+        print(f"✅ 2回リトライして成功: {gateway.get_stats()}")
+
+        backend.errors = [400]
+        try:
+            gateway.complete(_messages("不正なリクエスト"))
+            assert False, "エラーになるはず"
+        except LLMError as e:
+            assert e.status == 400
+        assert backend.calls == 4
+        print("✅ 400はリトライしない")
+    finally:
+        gateway.stop()
+
+    print("\n" + "=" * 50)
+    print("✨ リトライテスト完了！")
+    print("=" * 50)
+
+
+def test_deadline():
+    """期限が空き待ち・応答待ちに引き継がれるかのテスト"""
+    print("\n" + "=" * 50)
+    print("期限テスト")
+    print("=" * 50)
+
+    gateway = LLMGateway(MockBackend(latency=0.3), max_concurrency=1, max_retries=0)
+    try:
+        try:
+            gateway.complete(_messages("遅い応答"), timeout=0.1)
+            assert False, "タイムアウトするはず"
+        except LLMTimeout:
+            pass
+        print("✅ 応答待ちで期限切れ")
+
+        # 1件目が枠を使っている間、2件目は空きを待つうちに期限を過ぎる
+        first = threading.Thread(target=gateway.complete, args=(_messages("1件目"),), kwargs={"timeout": 2})
+        first.start()
+        while gateway.get_stats()["in_flight"] == 0:
+            time.sleep(0.005)
+        try:
+            gateway.complete(_messages("2件目"), timeout=0.1)
+            assert False, "タイムアウトするはず"
+        except LLMTimeout:
+            pass
+        first.join(5)
+        stats = gateway.get_stats()
+        assert stats["timeouts"] == 2 and stats["succeeded"] == 1
+        print(f"✅ 空き待ちで期限切れ: {stats}")
+    finally:
+        gateway.stop()
+
+    class BlockingBackend(MockBackend):
+        async def complete(self, model, messages, max_tokens, temperature, timeout):
+            # イベントループを止めてしまう処理（ゲートウェイ側の期限では打ち切れない）
+            time.sleep(0.4)
+            await asyncio.sleep(1)
+            return "遅すぎる応答"
+
+    gateway = LLMGateway(BlockingBackend(), max_retries=0)
+    gateway.RESULT_GRACE = 0.05
+    try:
+        started = time.monotonic()
+        try:
+            gateway.complete(_messages("止まる応答"), timeout=0.1)
+            assert False, "タイムアウトするはず"
+        except LLMTimeout:
+            pass
+        assert time.monotonic() - started < 0.35
+        # 呼び出し元が諦めた生成はループ上でも打ち切られる
+        while gateway.get_stats()["in_flight"]:
+            time.sleep(0.01)
+        assert gateway.get_stats()["cancelled"] == 1
+        print("✅ ループが詰まっていても期限で LLMTimeout")
+    finally:
+        gateway.stop()
+
+    print("\n" + "=" * 50)
+    print("✨ 期限テスト完了！")
+    print("=" * 50)
+
+
+def test_concurrency_limits():
+    """全体・ユーザーごとの同時実行数の上限と、非同期コードからの呼び出しのテスト"""
+    print("\n" + "=" * 50)
+    print("同時実行数テスト")
+    print("=" * 50)
+
+    running = {"all": 0, "max_all": 0, "U1": 0, "max_U1": 0}
+
+    class CountingBackend(MockBackend):
+        async def complete(self, model, messages, max_tokens, temperature, timeout):
+            user = messages[0]["content"].split(":")[0]
+            running["all"] += 1
+            running["max_all"] = max(running["max_all"], running["all"])
+            if user == "U1":
+                running["U1"] += 1
+                running["max_U1"] = max(running["max_U1"], running["U1"])
+            await asyncio.sleep(0.05)
+            running["all"] -= 1
+            if user == "U1":
+                running["U1"] -= 1
+            return "ok"
+
+    gateway = LLMGateway(CountingBackend(), max_concurrency=3, per_user_concurrency=1)
+    try:
+        async def run_all():
+            # 呼び出し元（別のイベントループ）から並行に投げる
+            requests = [gateway.acomplete(_messages(f"U1:{i}"), user_id="U1") for i in range(4)]
+            requests += [gateway.acomplete(_messages(f"U{i}:x"), user_id=f"U{i}") for i in range(2, 6)]
+            return await asyncio.gather(*requests)
+
+        results = asyncio.run(run_all())
+        assert results == ["ok"] * 8
+        assert running["max_all"] == 3
+        assert running["max_U1"] == 1
+        assert gateway.get_stats()["active_users"] == 0
+        print(f"✅ 同時実行数: 全体 最大{running['max_all']}, U1 最大{running['max_U1']}")
+    finally:
+        gateway.stop()
+
+    print("\n" + "=" * 50)
+    print("✨ 同時実行数テスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # リトライテスト
+        test_retry_and_errors()
+
+        # 期限テスト
+        test_deadline()
+
+        # 同時実行数テスト
+        test_concurrency_limits()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
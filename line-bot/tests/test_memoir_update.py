@@ -0,0 +1,80 @@
+"""
+自分史更新メッセージ送信の簡易テスト（同期の call を使わず await acall で送るか）
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services import line_service
+
+
+class FakeLineClient:
+    """acall だけを受け付ける（同期の call はイベントループを止めるので失敗させる）"""
+
+    def __init__(self, fail_first=False):
+        self.fail_first = fail_first
+        self.sent = []
+
+    async def acall(self, fn, timeout=None):
+        client = self
+
+        class Api:
+            async def push_message(self, request):
+                if client.fail_first and not client.sent:
+                    client.sent.append(None)
+                    raise RuntimeError("Flex Messageの送信に失敗")
+                client.sent.append(request)
+                return {}
+
+        return await fn(Api())
+
+    def call(self, fn, timeout=None):
+        raise AssertionError("非同期のルートから同期の call を呼んではいけない")
+
+
+def test_memoir_updated_message():
+    """Flex Messageを送り、失敗時はテキストで送り直すかのテスト"""
+    print("=" * 50)
+    print("自分史更新メッセージテスト")
+    print("=" * 50)
+
+    original = line_service.line_client
+    try:
+        client = FakeLineClient()
+        line_service.line_client = client
+        asyncio.run(line_service.send_memoir_updated_message("U1", "https://example.com/a.pdf", "https://example.com/edit"))
+        assert len(client.sent) == 1
+        assert client.sent[0].to == "U1"
+        assert type(client.sent[0].messages[0]).__name__ == "FlexMessage"
+        print("✅ Flex Messageを await acall で送信")
+
+        client = FakeLineClient(fail_first=True)
+        line_service.line_client = client
+        asyncio.run(line_service.send_memoir_updated_message("U1", "https://example.com/a.pdf", "https://example.com/edit"))
+        fallback = client.sent[1].messages[0]
+        assert type(fallback).__name__ == "TextMessage"
+        assert "https://example.com/a.pdf" in fallback.text
+        print("✅ 失敗時はテキストメッセージで送り直す")
+    finally:
+        line_service.line_client = original
+
+    print("\n" + "=" * 50)
+    print("✨ 自分史更新メッセージテスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # 自分史更新メッセージテスト
+        test_memoir_updated_message()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
@@ -0,0 +1,171 @@
+"""
+テキストメッセージ振り分けの簡易テスト
+"""
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.message_router import KeywordMatcher, MessageRouter, Route
+
+
+def _event(user_id, text):
+    return SimpleNamespace(
+        message=SimpleNamespace(text=text),
+        source=SimpleNamespace(user_id=user_id),
+        reply_token="token"
+    )
+
+
+def test_keyword_matcher():
+    """キーワード照合が単純な部分一致の判定と同じ結果になるかのテスト"""
+    print("=" * 50)
+    print("キーワード照合テスト")
+    print("=" * 50)
+
+    keywords = {
+        "create": ["作る", "作成", "create", "自分史"],
+        "report": ["レポート作成", "report create"],
+        "cancel": ["キャンセル", "cancel"],
+        "overlap": ["she", "he", "hers"],
+    }
+    matcher = KeywordMatcher(keywords)
+    messages = ["自分史を作りたい", "レポート作成して", "Report Create please", "ushers", "キャンセル", "hello", ""]
+    for message in messages:
+        hits = matcher.scan(message)
+        expected = {tag for tag, words in keywords.items() if any(w.lower() in message.lower() for w in words)}
+        assert hits.found == expected, (message, hits.found, expected)
+        print(f"✅ {message!r}: {sorted(hits.found)}")
+
+    assert matcher.scan("Cancel").equals("cancel")
+    assert not matcher.scan("cancel please").equals("cancel")
+    assert matcher.scan("cancel please").starts_with("cancel")
+    assert not matcher.scan("please cancel").starts_with("cancel")
+
+    print("\n" + "=" * 50)
+    print("✨ キーワード照合テスト完了！")
+    print("=" * 50)
+
+
+def test_router_dispatch():
+    """ルート表の優先順と、フローのセッションの参照回数のテスト"""
+    print("\n" + "=" * 50)
+    print("ルート振り分けテスト")
+    print("=" * 50)
+
+    sessions = {"U1": SimpleNamespace(state="waiting_title")}
+    lookups = []
+
+    def get_session_by_user(user_id):
+        lookups.append(user_id)
+        return sessions.get(user_id)
+
+    handled = []
+    router = MessageRouter(
+        KeywordMatcher({"create": ["作る"], "files": ["files"]}),
+        flows={"quick": get_session_by_user},
+        routes=[
+            Route("create", lambda c: c.hits.has("create"), lambda c: handled.append(("create", c.text))),
+            Route("title", lambda c: c.state("quick") == "waiting_title", lambda c: handled.append(("title", c.text))),
+            Route("files", lambda c: c.hits.starts_with("files"), lambda c: handled.append(("files", c.text))),
+            Route("chat", lambda c: True, lambda c: handled.append(("chat", c.text))),
+        ]
+    )
+
+    assert router.dispatch(_event("U1", "自分史を作る")) == "create"
+    assert router.dispatch(_event("U1", "私の人生")) == "title"
+    assert router.dispatch(_event("U2", "FILES")) == "files"
+    assert router.dispatch(_event("U2", "こんにちは")) == "chat"
+    # キーワードで決まる場合はセッションを引かない。引く場合も1メッセージ1回
+    assert lookups == ["U1", "U2", "U2"]
+    print(f"✅ 振り分け: {handled}")
+
+    stats = router.get_stats()
+    assert stats["title"]["count"] == 1
+    assert stats["chat"]["count"] == 1
+    assert stats["create"]["max_time"] >= 0
+    print(f"✅ 統計: {stats['title']}")
+
+    print("\n" + "=" * 50)
+    print("✨ ルート振り分けテスト完了！")
+    print("=" * 50)
+
+
+def test_flow_cancel():
+    """キャンセル語だけのメッセージは、写真・簡易フローのどの状態でもフローを終了させるかのテスト
+
+    ルート表への置き換えで変わった挙動を固定する。以前の if の連鎖では、質問への回答待ち・ストーリー確認中は
+    回答や修正依頼として扱い、タイトル待ちではタイトルとして保存し、写真の受付中・表紙待ちでは ChatGPT に渡していた。
+    """
+    print("\n" + "=" * 50)
+    print("フローのキャンセルテスト")
+    print("=" * 50)
+
+    from app.services import line_service
+    from app.services.photo_memoir_service import photo_memoir_service
+    from app.services.quick_memoir_service import quick_memoir_service
+
+    replies = []
+    chats = []
+    original = (line_service.send_text_message_with_fallback, line_service.handle_chatgpt_response)
+    line_service.send_text_message_with_fallback = lambda token, user_id, text: replies.append(text)
+    line_service.handle_chatgpt_response = lambda event: chats.append(event.message.text)
+    router = line_service.text_message_router
+    try:
+        cases = [
+            (photo_memoir_service, state, "キャンセル") for state in photo_memoir_service.ACTIVE_STATES
+        ] + [
+            (quick_memoir_service, state, word)
+            for state, word in zip(quick_memoir_service.ACTIVE_STATES, ("やめる", "Cancel"))
+        ]
+        for service, state, word in cases:
+            user_id = f"cancel-{state}"
+            session = service.start_photo_memoir(user_id)[0] if service is photo_memoir_service \
+                else service.start_quick_create(user_id)[0]
+            session.state = state
+            service.save_session(session)
+
+            assert router.dispatch(_event(user_id, word)) == "flow_cancel", state
+            assert service.get_session_by_user(user_id) is None
+            assert replies[-1].startswith("自分史作成をキャンセルしました")
+        print(f"✅ すべての状態でキャンセル: {[state for _, state, _ in cases]}")
+
+        # キャンセル語を含むだけの文はフローの入力として扱う
+        session, _ = quick_memoir_service.start_quick_create("cancel-partial")
+        assert router.dispatch(_event("cancel-partial", "キャンセルしない人生")) == "quick_title"
+        assert quick_memoir_service.get_session(session.session_id).data.title == "キャンセルしない人生"
+        quick_memoir_service.cancel_session(session.session_id)
+        print("✅ 完全一致でなければフローの入力")
+
+        # フローの外ではキャンセル語も ChatGPT に渡す
+        assert router.dispatch(_event("cancel-idle", "キャンセル")) == "chatgpt"
+        assert chats == ["キャンセル"]
+        print("✅ フローの外ではChatGPTへ")
+    finally:
+        line_service.send_text_message_with_fallback, line_service.handle_chatgpt_response = original
+
+    print("\n" + "=" * 50)
+    print("✨ フローのキャンセルテスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # キーワード照合テスト
+        test_keyword_matcher()
+
+        # ルート振り分けテスト
+        test_router_dispatch()
+
+        # フローのキャンセルテスト
+        test_flow_cancel()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
@@ -2,13 +2,20 @@
 写真自分史サービスの簡易テスト
 """
 
+import asyncio
 import sys
+import tempfile
+import threading
 from pathlib import Path
 
 # プロジェクトのルートディレクトリをパスに追加
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from app.services.photo_memoir_service import photo_memoir_service, PhotoMemoirSession, PhotoItem
+from app.services.photo_memoir_service import photo_memoir_service, PhotoMemoirService, PhotoMemoirSession, PhotoItem
+from app.services import photo_memoir_service as photo_memoir_module
+from app.services.llm_gateway import LLMGateway, LLMError, MockBackend
+from app.services.vivliostyle_service import vivliostyle_service
+from app.config import settings
 
 
 def test_basic_flow():
@@ -181,6 +188,164 @@ def test_template_data_preparation():
     print("=" * 50)
 
 
+def test_story_pregeneration():
+    """回答が揃った写真のストーリーを先行生成し、下書きPDFを使い回せるかのテスト"""
+    print("\n" + "=" * 50)
+    print("ストーリー先行生成テスト")
+    print("=" * 50)
+    
+    service = PhotoMemoirService()
+    session, _ = service.start_photo_memoir("test_user_pre")
+    for i in range(3):
+        service.add_photo(session, f"https://example.com/photo{i + 1}.jpg")
+    service.finish_photo_collection(session)
+    
+    # 1枚目の回答が揃うと、ストーリーを待たずに2枚目の質問に進む
+    requests = []
+    for answer in ["2015年春", "代々木公園", "家族と花見"]:
+        response, needs_action = service.process_answer(session, answer)
+    assert needs_action and session.current_photo_index == 1 and session.state == "questioning"
+    requests.append(service.request_story(session.photos[0]))
+    print(f"✅ 次の写真へ: {response.splitlines()[0]}")
+    
+    for photo_index in (1, 2):
+        for answer in ["夏", "海", "泳いだ"]:
+            response, needs_action = service.process_answer(session, answer)
+        requests.append(service.request_story(session.photos[photo_index]))
+    assert session.state == "story_generated" and session.current_photo_index == 0
+    
+    # 生成前に承認しようとすると待ってもらう
+    response, needs_action = service.handle_story_approval(session, "👍")
+    assert not needs_action and session.current_photo_index == 0
+    
+    # 再生成を依頼した後に古い結果が届いても反映しない
+    stale = requests[0]
+    requests[0] = service.request_story(session.photos[0])
+    assert service.apply_story(session, stale[0].photo_id, stale[1], "古いストーリー") is None
+    for snapshot, revision in requests:
+        assert service.apply_story(session, snapshot.photo_id, revision, f"{snapshot.photo_url}のストーリー")
+    assert service.all_stories_ready(session)
+    print("✅ 最新の依頼の結果だけを反映")
+    
+    # 先行生成済みなら、承認すると次のストーリーがすぐに表示される
+    response, needs_action = service.handle_story_approval(session, "👍")
+    assert not needs_action and "photo2.jpgのストーリー" in response
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 下書きPDFは生成時のストーリーと一致する場合だけ使う
+        fingerprint = service.stories_fingerprint(session)
+        draft_path = Path(temp_dir) / "draft.pdf"
+        draft_path.write_bytes(b"%PDF-draft")
+        assert service.set_draft_pdf(session, {"path": str(draft_path)}, fingerprint)
+        assert service.take_draft_pdf(session)["size"] == len(b"%PDF-draft")
+        
+        stale_path = Path(temp_dir) / "stale.pdf"
+        stale_path.write_bytes(b"%PDF-stale")
+        assert service.set_draft_pdf(session, {"path": str(stale_path)}, "old-fingerprint") is False
+        assert not stale_path.exists()
+    print("✅ 下書きPDFをストーリーのハッシュで判定")
+    
+    print("\n" + "=" * 50)
+    print("✨ ストーリー先行生成テスト完了！")
+    print("=" * 50)
+
+
+def test_story_generation_via_gateway():
+    """ストーリー生成がチャット応答を通さずLLMゲートウェイで行われ、失敗は例外になるかのテスト"""
+    print("\n" + "=" * 50)
+    print("ストーリー生成テスト")
+    print("=" * 50)
+    
+    running = {"now": 0, "max": 0}
+    requests = []
+    
+    class RecordingBackend(MockBackend):
+        async def complete(self, model, messages, max_tokens, temperature, timeout):
+            requests.append((messages, max_tokens))
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            await asyncio.sleep(0.05)
+            running["now"] -= 1
+            return " 桜の下で家族と過ごした春の日。 "
+    
+    service = PhotoMemoirService()
+    original = photo_memoir_module.llm_gateway
+    photo_memoir_module.llm_gateway = LLMGateway(RecordingBackend(), max_concurrency=8, per_user_concurrency=2)
+    try:
+        # ファイル生成のキーワードを含む回答でもストーリーとして生成する
+        photos = [PhotoItem(photo_id=f"p{i}", photo_url="https://example.com/p.jpg", answers=["レポート作成の帰り道"]) for i in range(5)]
+        stories = []
+        threads = [threading.Thread(target=lambda p=p: stories.append(service.generate_story_for_photo(p, "U1"))) for p in photos]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        assert stories == ["桜の下で家族と過ごした春の日。"] * 5
+        messages, max_tokens = requests[0]
+        assert messages[0]["content"] == PhotoMemoirService.STORY_SYSTEM_PROMPT
+        assert max_tokens >= 400
+        # ユーザーごとの同時実行数の上限はゲートウェイで守られる
+        assert running["max"] == 2
+        print(f"✅ ゲートウェイ経由で生成（同時生成数: 最大{running['max']}）")
+        photo_memoir_module.llm_gateway.stop()
+        
+        # 失敗はエラー文ではなく例外で返す
+        photo_memoir_module.llm_gateway = LLMGateway(MockBackend(errors=[400]), max_retries=0)
+        try:
+            service.generate_story_for_photo(photos[0], "U1")
+            assert False, "エラーになるはず"
+        except LLMError:
+            pass
+        print("✅ 失敗は例外になる")
+    finally:
+        photo_memoir_module.llm_gateway.stop()
+        photo_memoir_module.llm_gateway = original
+    
+    print("\n" + "=" * 50)
+    print("✨ ストーリー生成テスト完了！")
+    print("=" * 50)
+
+
+def test_draft_pdf_paths():
+    """下書きPDFが uploads の外に、重ならない名前で書き出されるかのテスト"""
+    print("\n" + "=" * 50)
+    print("下書きPDFの保存先テスト")
+    print("=" * 50)
+    
+    async def fake_generate_pdf(template_name, data, output_path, vivliostyle_options):
+        Path(output_path).write_bytes(b"%PDF-test")
+    
+    service = PhotoMemoirService()
+    session, _ = service.start_photo_memoir("test_user_draft")
+    service.add_photo(session, "https://example.com/photo1.jpg")
+    original_dir = settings.PHOTO_DRAFT_DIR
+    original_generate = vivliostyle_service.generate_pdf
+    with tempfile.TemporaryDirectory() as temp_dir:
+        settings.PHOTO_DRAFT_DIR = Path(temp_dir) / "drafts"
+        vivliostyle_service.generate_pdf = fake_generate_pdf
+        try:
+            # 同じ秒に2回生成しても別のファイルになる
+            first = service.generate_pdf(session, draft=True)
+            second = service.generate_pdf(session, draft=True)
+        finally:
+            settings.PHOTO_DRAFT_DIR = original_dir
+            vivliostyle_service.generate_pdf = original_generate
+        assert first["path"] != second["path"]
+        assert all(Path(r["path"]).parent == Path(temp_dir) / "drafts" for r in (first, second))
+        
+        # 古い下書きを捨てても新しい下書きは残る
+        fingerprint = service.stories_fingerprint(session)
+        session.state = "story_generated"
+        assert service.set_draft_pdf(session, first, fingerprint)
+        assert service.set_draft_pdf(session, second, fingerprint)
+        assert not Path(first["path"]).exists() and Path(second["path"]).exists()
+    print("✅ 下書きごとに別のファイル")
+    
+    print("\n" + "=" * 50)
+    print("✨ 下書きPDFの保存先テスト完了！")
+    print("=" * 50)
+
+
 if __name__ == "__main__":
     try:
         # 基本フローテスト
@@ -192,6 +357,15 @@ if __name__ == "__main__":
         # テンプレートデータ準備テスト
         test_template_data_preparation()
         
+        # ストーリー先行生成テスト
+        test_story_pregeneration()
+        
+        # ストーリー生成テスト
+        test_story_generation_via_gateway()
+        
+        # 下書きPDFの保存先テスト
+        test_draft_pdf_paths()
+        
         print("\n" + "=" * 50)
         print("🎉 すべてのテスト完了！")
         print("=" * 50)
@@ -0,0 +1,97 @@
+"""
+プレビュー画像サービスの簡易テスト
+"""
+
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+from PIL import Image
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.preview_service import PreviewService
+
+
+def _write_photo(path: Path, size=(1600, 1200)) -> None:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(buffer, format="JPEG", quality=95)
+    path.write_bytes(buffer.getvalue())
+
+
+def test_image_preview():
+    """画像のサムネイル生成とキャッシュのテスト"""
+    print("=" * 50)
+    print("プレビュー画像テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp = Path(temp_dir)
+        photo = temp / "photo.jpg"
+        _write_photo(photo)
+        service = PreviewService(cache_dir=temp / "previews")
+        metadata = {"file_id": "photo-id", "message_type": "image", "sha256": "abc"}
+
+        preview = service.get_preview(metadata, photo)
+        with Image.open(preview) as image:
+            print(f"✅ プレビュー: {image.size}, {preview.stat().st_size} bytes")
+            assert max(image.size) == service.size
+        assert preview.stat().st_size < photo.stat().st_size
+
+        # 2回目はキャッシュから返す
+        assert service.get_preview(metadata, photo) == preview
+        assert service.stats["hits"] == 1
+
+        # 再起動後もキャッシュを引き継ぐ
+        service = PreviewService(cache_dir=temp / "previews")
+        assert service.get_preview(metadata, photo) == preview
+        assert service.stats["hits"] == 1
+
+        # 対応していないファイルは生成しない
+        assert service.get_preview({"file_id": "zip-id", "message_type": "file", "content_type": "application/zip"}, photo) is None
+
+    print("\n" + "=" * 50)
+    print("✨ プレビュー画像テスト完了！")
+    print("=" * 50)
+
+
+def test_eviction():
+    """上限サイズを超えたときの削除テスト"""
+    print("\n" + "=" * 50)
+    print("プレビューキャッシュ削除テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp = Path(temp_dir)
+        photo = temp / "photo.jpg"
+        _write_photo(photo)
+        service = PreviewService(cache_dir=temp / "previews", max_bytes=1)
+
+        first = service.get_preview({"file_id": "a", "message_type": "image"}, photo)
+        second = service.get_preview({"file_id": "b", "message_type": "image"}, photo)
+        print(f"✅ 削除件数: {service.stats['evictions']}")
+        assert not first.exists()
+        assert second.exists()
+        assert service.stats["evictions"] == 1
+
+    print("\n" + "=" * 50)
+    print("✨ プレビューキャッシュ削除テスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # プレビュー画像テスト
+        test_image_preview()
+
+        # プレビューキャッシュ削除テスト
+        test_eviction()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
@@ -0,0 +1,341 @@
+"""
+セッション保存先の簡易テスト
+"""
+
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.photo_memoir_service import PhotoMemoirService, PhotoMemoirSession, PhotoItem
+from app.services.quick_memoir_service import QuickMemoirSession
+from app.services.session_store import (
+    MemorySessionStore,
+    SQLiteSessionStore,
+    RedisSessionStore,
+    RedisConnection,
+    RedisError,
+    SessionCodec,
+    SessionStore
+)
+
+
+def _photo_session(session_id="photo_1"):
+    session = PhotoMemoirSession(session_id=session_id, user_id="U1", state="questioning")
+    session.photos.append(PhotoItem(photo_id="p1", photo_url="https://example.com/1.jpg", answers=["2015年春"]))
+    return session
+
+
+class _RedisStandIn(socketserver.ThreadingTCPServer):
+    """テスト用のRedis互換サーバー（AUTH / SELECT / GET / SET PX / DEL / PEXPIRE / SCAN のみ）"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RedisHandler)
+        self.data = {}
+        self.commands = []
+        self.clients = []
+
+    def drop_clients(self):
+        """接続中のクライアントを切断する（サーバーの再起動・アイドル切断の代わり）"""
+        for client in self.clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.clients = []
+
+
+class _RedisHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _bulk(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        data = self.server.data
+        self.server.clients.append(self.connection)
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            command = args[0].upper()
+            self.server.commands.append([command] + args[1:])
+            now = time.time()
+            for key in [k for k, (_, expires_at) in data.items() if expires_at <= now]:
+                del data[key]
+            if command in (b"AUTH", b"SELECT"):
+                reply = b"+OK\r\n"
+            elif command == b"GET":
+                entry = data.get(args[1])
+                reply = self._bulk(entry[0] if entry else None)
+            elif command == b"SET":
+                data[args[1]] = (args[2], now + int(args[4]) / 1000)
+                reply = b"+OK\r\n"
+            elif command == b"PEXPIRE":
+                entry = data.get(args[1])
+                if entry:
+                    data[args[1]] = (entry[0], now + int(args[2]) / 1000)
+                reply = b":%d\r\n" % (1 if entry else 0)
+            elif command == b"DEL":
+                reply = b":%d\r\n" % (1 if data.pop(args[1], None) else 0)
+            elif command == b"SCAN":
+                prefix = args[3].rstrip(b"*")
+                keys = [key for key in data if key.startswith(prefix)]
+                reply = b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(keys) + b"".join(self._bulk(key) for key in keys)
+            else:
+                reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+def test_memory_store():
+    """メモリの保存先のTTLと件数上限のテスト"""
+    print("=" * 50)
+    print("メモリ保存先テスト")
+    print("=" * 50)
+
+    store = MemorySessionStore(ttl=0.2, max_entries=2)
+    for key in ("a", "b", "c"):
+        store.put(key, _photo_session(key))
+    # 上限を超えた分は最も古いものから削除
+    assert store.get("a") is None
+    assert store.get("b").session_id == "b"
+    print(f"✅ LRU: {store.get_stats()}")
+
+    time.sleep(0.25)
+    assert store.get("b") is None
+    assert store.purge_expired() == 1
+    assert store.count() == 0
+    print("✅ アイドルTTLで期限切れ")
+
+    # インターフェースは抽象クラス（直接は作れない）
+    try:
+        SessionStore(ttl=1, max_entries=1)
+        assert False, "TypeErrorになるはず"
+    except TypeError:
+        pass
+
+    print("\n" + "=" * 50)
+    print("✨ メモリ保存先テスト完了！")
+    print("=" * 50)
+
+
+def test_sqlite_store():
+    """SQLiteの保存先でdataclassが復元されるかのテスト"""
+    print("\n" + "=" * 50)
+    print("SQLite保存先テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "sessions.db"
+        store = SQLiteSessionStore(path, "photo", SessionCodec(PhotoMemoirSession), ttl=60, max_entries=100)
+        session = _photo_session()
+        store.put(session.session_id, session)
+        store.close()
+
+        # 別のインスタンス（再起動後）から読み出す
+        store = SQLiteSessionStore(path, "photo", SessionCodec(PhotoMemoirSession), ttl=60, max_entries=100)
+        loaded = store.get("photo_1")
+        assert loaded == session
+        assert isinstance(loaded.photos[0], PhotoItem)
+        assert loaded.created_at == session.created_at
+        assert [s.session_id for s in store.values()] == ["photo_1"]
+
+        # 索引も再起動後に残る
+        store.set_index("U1", "photo_1")
+        store.close()
+        store = SQLiteSessionStore(path, "photo", SessionCodec(PhotoMemoirSession), ttl=60, max_entries=100)
+        assert store.get_index("U1") == "photo_1"
+
+        # namespaceが違えば別のセッション
+        other = SQLiteSessionStore(path, "quick", SessionCodec(QuickMemoirSession), ttl=60, max_entries=100)
+        assert other.get("photo_1") is None
+        assert store.delete("photo_1") is True
+        assert store.count() == 0
+        store.close()
+        other.close()
+    print("✅ 再起動後も復元")
+
+    print("\n" + "=" * 50)
+    print("✨ SQLite保存先テスト完了！")
+    print("=" * 50)
+
+
+def test_redis_store():
+    """Redis互換サーバー（テスト用の代替）での保存・期限切れのテスト"""
+    print("\n" + "=" * 50)
+    print("Redis保存先テスト")
+    print("=" * 50)
+
+    server = _RedisStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = RedisConnection(f"redis://127.0.0.1:{server.server_address[1]}/0")
+        store = RedisSessionStore(connection, "quick", SessionCodec(QuickMemoirSession), ttl=0.3, max_entries=100)
+        session = QuickMemoirSession(session_id="quick_1", user_id="U1", state="editing")
+        session.data.title = "私の人生物語"
+        session.data.timeline.append({"year": 2015, "title": "入学"})
+        store.put(session.session_id, session)
+
+        loaded = store.get("quick_1")
+        assert loaded == session
+        assert loaded.data.title == "私の人生物語"
+        assert store.count() == 1
+        # 統計の件数は数え直すまで概算のまま
+        assert store.get_stats()["sessions"] == 1
+        store.put("quick_2", QuickMemoirSession(session_id="quick_2", user_id="U2", state="editing"))
+        assert store.get_stats()["sessions"] == 1 and store.get_stats()["sessions_approximate"]
+        assert store.count() == 2
+        assert store.delete("quick_2") is True
+        store.set_index("U1", "quick_1")
+        assert store.get_index("U1") == "quick_1"
+        store.delete_index("U1", "quick_other")
+        assert store.get_index("U1") == "quick_1"
+        print(f"✅ 保存形式: {next(iter(server.data.values()))[0][:60]}...")
+
+        time.sleep(0.35)
+        assert store.get("quick_1") is None
+        print("✅ TTLで期限切れ")
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print("\n" + "=" * 50)
+    print("✨ Redis保存先テスト完了！")
+    print("=" * 50)
+
+
+def test_redis_connection():
+    """RESPクライアントの応答の解析・エラー・再接続のテスト"""
+    print("\n" + "=" * 50)
+    print("Redis接続テスト")
+    print("=" * 50)
+
+    server = _RedisStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_address[1]
+    try:
+        # URLのパスワード・DB番号は接続時に AUTH / SELECT で送る
+        connection = RedisConnection(f"redis://:secret@127.0.0.1:{port}/2")
+        assert connection.execute("SET", "k", "値", "PX", 60000) == "OK"
+        assert server.commands[:2] == [[b"AUTH", b"secret"], [b"SELECT", b"2"]]
+        assert connection.execute("GET", "k") == "値".encode("utf-8")
+        assert connection.execute("GET", "missing") is None
+        assert connection.execute("DEL", "k") == 1
+        cursor, keys = connection.execute("SCAN", "0", "MATCH", "*", "COUNT", 10)
+        assert cursor == b"0" and keys == []
+        print("✅ 文字列・整数・nil・配列の応答")
+
+        # エラー応答は RedisError になり、接続はそのまま使える
+        try:
+            connection.execute("FLUSHALL")
+            assert False, "エラーになるはず"
+        except RedisError as e:
+            assert "unknown command" in str(e)
+        assert connection.execute("SET", "k", "v", "PX", 60000) == "OK"
+        print("✅ エラー応答")
+
+        # サーバー側で切断されても次のコマンドで接続し直す（AUTH / SELECT もやり直す）
+        server.drop_clients()
+        server.commands.clear()
+        assert connection.execute("GET", "k") == b"v"
+        assert server.commands[:2] == [[b"AUTH", b"secret"], [b"SELECT", b"2"]]
+        print("✅ 切断後に再接続")
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # サーバーに接続できなければ ConnectionError
+    try:
+        RedisConnection(f"redis://127.0.0.1:{port}/0", timeout=0.5).execute("GET", "k")
+        assert False, "エラーになるはず"
+    except ConnectionError:
+        pass
+    print("✅ 接続できない場合は ConnectionError")
+
+    print("\n" + "=" * 50)
+    print("✨ Redis接続テスト完了！")
+    print("=" * 50)
+
+
+def test_user_index():
+    """ユーザーID → アクティブなセッションの索引が状態の変化に追従するかのテスト"""
+    print("\n" + "=" * 50)
+    print("ユーザー索引テスト")
+    print("=" * 50)
+
+    service = PhotoMemoirService()
+    service.sessions = MemorySessionStore(ttl=60, max_entries=100)
+    assert service.get_session_by_user("U1") is None
+
+    service.start_photo_memoir("U1")
+    session, _ = service.start_photo_memoir("U1")
+    other, _ = service.start_photo_memoir("U2")
+    # 新しく始めたセッションが引ける
+    assert service.get_session_by_user("U1") is session
+    assert service.get_session_by_user("U2") is other
+
+    # 完了したセッションは索引から外れる
+    session.state = "completed"
+    service.save_session(session)
+    assert service.get_session_by_user("U1") is None
+
+    # キャンセルしたセッションも外れる
+    assert service.cancel_session(other.session_id) is True
+    assert service.get_session_by_user("U2") is None
+    assert service.sessions.get_index("U2") is None
+    print("✅ 索引が状態の変化に追従")
+
+    print("\n" + "=" * 50)
+    print("✨ ユーザー索引テスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # メモリ保存先テスト
+        test_memory_store()
+
+        # SQLite保存先テスト
+        test_sqlite_store()
+
+        # Redis保存先テスト
+        test_redis_store()
+
+        # Redis接続テスト
+        test_redis_connection()
+
+        # ユーザー索引テスト
+        test_user_index()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
@@ -0,0 +1,114 @@
+"""
+バックグラウンドタスク実行器の簡易テスト
+"""
+
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.task_executor import TaskExecutor, TaskQueueFull
+
+
+def test_queue_full_and_cancel():
+    """キュー上限での拒否と、キー単位のキャンセルのテスト"""
+    print("=" * 50)
+    print("バックグラウンド実行器テスト")
+    print("=" * 50)
+
+    executor = TaskExecutor(workers=1, queue_size=2)
+    release = threading.Event()
+    started = threading.Event()
+    results = []
+
+    def blocker():
+        started.set()
+        release.wait(5)
+        results.append("blocker")
+
+    executor.start()
+    executor.submit(blocker, name="blocker", key="session-a")
+    assert started.wait(5)
+    queued = executor.submit(results.append, "queued", key="session-b")
+    executor.submit(results.append, "other", key="session-c")
+    try:
+        executor.submit(results.append, "overflow")
+        assert False, "TaskQueueFull が送出されていません"
+    except TaskQueueFull as e:
+        print(f"✅ 拒否: {e}")
+
+    # 待機中のタスクはキャンセルすると実行されない
+    assert executor.cancel("session-b") == 1
+    release.set()
+    assert queued.wait(5)
+    executor.stop()
+
+    print(f"✅ 実行結果: {results}")
+    assert results == ["blocker", "other"]
+    assert queued.state == "cancelled"
+    stats = executor.get_stats()
+    assert stats["completed"] == 2
+    assert stats["cancelled"] == 1
+    assert stats["rejected"] == 1
+    assert stats["queue_depth"] == 0
+
+    # 停止後は受け付けない
+    try:
+        executor.submit(results.append, "after-stop")
+        assert False, "停止後に受け付けています"
+    except TaskQueueFull:
+        pass
+
+    print("\n" + "=" * 50)
+    print("✨ バックグラウンド実行器テスト完了！")
+    print("=" * 50)
+
+
+def test_run_coroutine():
+    """ワーカーから共有イベントループでコルーチンを実行するテスト"""
+    print("\n" + "=" * 50)
+    print("共有イベントループテスト")
+    print("=" * 50)
+
+    executor = TaskExecutor(workers=2, queue_size=10)
+    loops = []
+
+    async def job(value):
+        await asyncio.sleep(0.01)
+        loops.append(asyncio.get_running_loop())
+        return value * 2
+
+    def work(value):
+        assert executor.current_task().name == "work"
+        assert executor.run_coroutine(job(value)) == value * 2
+
+    tasks = [executor.submit(work, i) for i in range(4)]
+    # stop() は残りのタスクを処理し終えてから戻る
+    executor.stop()
+
+    assert all(task.state == "done" for task in tasks)
+    assert len(loops) == 4 and len(set(map(id, loops))) == 1
+    print(f"✅ 4件のコルーチンを1つのイベントループで実行")
+
+    print("\n" + "=" * 50)
+    print("✨ 共有イベントループテスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # バックグラウンド実行器テスト
+        test_queue_full_and_cancel()
+
+        # 共有イベントループテスト
+        test_run_coroutine()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
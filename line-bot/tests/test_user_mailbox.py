@@ -0,0 +1,150 @@
+"""
+ユーザーごとのメールボックスの簡易テスト
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.user_mailbox import UserMailbox
+
+
+def test_serialized_per_user():
+    """同じユーザーの処理が重ならず投入順に実行され、別ユーザーは待たされないかのテスト"""
+    print("=" * 50)
+    print("メールボックステスト")
+    print("=" * 50)
+
+    mailbox = UserMailbox()
+    order = []
+    active = {"U1": 0}
+    overlaps = []
+    release = threading.Event()
+
+    def slow(label):
+        active["U1"] += 1
+        if active["U1"] > 1:
+            overlaps.append(label)
+        release.wait(5)
+        order.append(label)
+        active["U1"] -= 1
+
+    def quick(label):
+        if active["U1"] > 1:
+            overlaps.append(label)
+        order.append(label)
+
+    # U1の処理を実行中のまま、別スレッドからU1・U2の処理を投入する
+    owner = threading.Thread(target=mailbox.post, args=("U1", slow, "event-1"))
+    owner.start()
+    while not mailbox.is_busy("U1"):
+        time.sleep(0.001)
+
+    assert mailbox.post("U1", quick, "completion") is False
+    assert mailbox.post("U1", quick, "event-2") is False
+    # 別ユーザーはその場で実行される
+    assert mailbox.post("U2", quick, "other-user") is True
+    assert order == ["other-user"]
+
+    release.set()
+    owner.join(5)
+
+    print(f"✅ 実行順: {order}")
+    assert order == ["other-user", "event-1", "completion", "event-2"]
+    assert overlaps == []
+    stats = mailbox.get_stats()
+    assert stats["deferred"] == 2
+    assert stats["active_users"] == 0 and stats["pending"] == 0
+    assert not mailbox.is_busy("U1")
+
+    print("\n" + "=" * 50)
+    print("✨ メールボックステスト完了！")
+    print("=" * 50)
+
+
+def test_error_does_not_block():
+    """処理が例外を送出しても後続の処理が実行されるかのテスト"""
+    print("\n" + "=" * 50)
+    print("メールボックスのエラー処理テスト")
+    print("=" * 50)
+
+    mailbox = UserMailbox()
+    results = []
+
+    def failing():
+        mailbox.post("U1", results.append, "after-error")
+        raise RuntimeError("テスト用のエラー")
+
+    assert mailbox.post("U1", failing) is True
+    assert results == ["after-error"]
+    assert mailbox.get_stats()["failed"] == 1
+    print("✅ エラー後も後続の処理を実行")
+
+    print("\n" + "=" * 50)
+    print("✨ メールボックスのエラー処理テスト完了！")
+    print("=" * 50)
+
+
+def test_thread_contract():
+    """処理はメールボックスが空いていたときに post() したスレッドが実行する（タスク実行器のスレッドもあり得る）"""
+    print("\n" + "=" * 50)
+    print("メールボックスの実行スレッドテスト")
+    print("=" * 50)
+
+    mailbox = UserMailbox()
+    ran_on = []
+    release = threading.Event()
+    started = threading.Event()
+
+    def apply_result(label):
+        ran_on.append((label, threading.current_thread().name))
+        if label == "story-result":
+            started.set()
+            release.wait(5)
+
+    # バックグラウンドタスクの結果反映が先にメールボックスを取ると、
+    # その間に届いたWebhookイベントもタスク実行器のスレッドで処理される
+    task = threading.Thread(target=mailbox.post, args=("U1", apply_result, "story-result"), name="task-executor-0")
+    task.start()
+    assert started.wait(5)
+    webhook = threading.Thread(target=mailbox.post, args=("U1", apply_result, "text-event"), name="webhook-worker-0")
+    webhook.start()
+    webhook.join(5)
+    assert ran_on == [("story-result", "task-executor-0")]
+
+    release.set()
+    task.join(5)
+    assert ran_on == [("story-result", "task-executor-0"), ("text-event", "task-executor-0")]
+    print(f"✅ 実行スレッド: {ran_on}")
+
+    # 空いていれば呼び出したスレッドでその場で実行する
+    assert mailbox.post("U1", apply_result, "next-event") is True
+    assert ran_on[-1] == ("next-event", threading.current_thread().name)
+    print("✅ 空いていれば呼び出したスレッドで実行")
+
+    print("\n" + "=" * 50)
+    print("✨ メールボックスの実行スレッドテスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # メールボックステスト
+        test_serialized_per_user()
+
+        # メールボックスのエラー処理テスト
+        test_error_does_not_block()
+
+        # メールボックスの実行スレッドテスト
+        test_thread_contract()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
@@ -0,0 +1,141 @@
+"""
+vivliostyleサービスのジョブAPIクライアントの簡易テスト（httpx.MockTransport で /jobs を模擬）
+"""
+
+import asyncio
+import json
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+
+from app.services.vivliostyle_service import VivliostyleService, RenderJobError
+
+
+class FakeJobsAPI:
+    """/jobs・/jobs/{id}・/jobs/{id}/pdf を模擬（状態を取得するたびにジョブが進む）"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.jobs = {}
+        self.requests = []
+
+    def info(self, job):
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "template_id": job["template_id"],
+            "created_at": datetime(2026, 1, 1, 12, 0, 0).isoformat(),
+            "started_at": None,
+            "finished_at": datetime(2026, 1, 1, 12, 0, 5).isoformat() if job["status"] == "succeeded" else None,
+            "attempts": 1,
+            "error": "描画に失敗" if job["status"] == "failed" else None,
+            "file_size": 8 if job["status"] == "succeeded" else None,
+        }
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.method, request.url.path))
+        parts = request.url.path.strip("/").split("/")
+        if request.method == "POST" and parts == ["jobs"]:
+            body = json.loads(request.content)
+            job = {"job_id": f"job{len(self.jobs)}", "status": "queued", "template_id": body["template_id"]}
+            self.jobs[job["job_id"]] = job
+            return httpx.Response(202, json=self.info(job), headers={"Location": f"/jobs/{job['job_id']}"})
+
+        job = self.jobs.get(parts[1]) if len(parts) >= 2 else None
+        if job is None:
+            return httpx.Response(404, json={"detail": "ジョブが見つかりません"})
+        if len(parts) == 2:
+            # ポーリングのたびに queued → running → succeeded / failed と進める
+            job["status"] = {
+                "queued": "running",
+                "running": "failed" if self.fail else "succeeded"
+            }.get(job["status"], job["status"])
+            return httpx.Response(200, json=self.info(job))
+        if job["status"] == "succeeded":
+            return httpx.Response(200, content=b"%PDF-1.4", headers={"Content-Type": "application/pdf"})
+        if job["status"] == "failed":
+            return httpx.Response(409, json={"detail": "ジョブは失敗しました"})
+        return httpx.Response(409, json={"detail": "ジョブは処理中です"}, headers={"Retry-After": "3"})
+
+
+def test_job_client():
+    """投入→ポーリング→ダウンロードと、エラー時の例外のテスト"""
+    print("=" * 50)
+    print("ジョブAPIクライアントテスト")
+    print("=" * 50)
+
+    api = FakeJobsAPI()
+    service = VivliostyleService(api_url="http://vivliostyle.test", transport=httpx.MockTransport(api))
+
+    async def scenario(tmp):
+        job = await service.submit_job("single/minimal-single", {"title": "タイトル", "author": "著者"})
+        assert job.status == "queued" and job.template_id == "single/minimal-single"
+        assert isinstance(job.created_at, datetime)
+
+        # 完了前のダウンロードは409（Retry-After付き）
+        try:
+            await service.download_job_pdf(job.job_id, tmp / "early.pdf")
+            assert False, "409になるはず"
+        except RenderJobError as e:
+            assert e.status_code == 409 and e.retry_after == 3
+        assert not (tmp / "early.pdf").exists()
+        print("✅ 未完了のダウンロードは409")
+
+        finished = await service.wait_job(job.job_id, poll_interval=0.01)
+        assert finished.status == "succeeded" and finished.file_size == 8
+        path = await service.download_job_pdf(job.job_id, tmp / "out" / "result.pdf")
+        assert path.read_bytes() == b"%PDF-1.4"
+        assert list(path.parent.iterdir()) == [path]
+        print(f"✅ 完了まで待ってダウンロード: {api.requests}")
+
+        assert await service.get_job("missing") is None
+        path = await service.generate_pdf_via_job("single/minimal-single", {"title": "t", "author": "a"}, tmp / "via.pdf")
+        assert path.read_bytes() == b"%PDF-1.4"
+        print("✅ 投入から保存までまとめて実行")
+
+        # 失敗したジョブは RenderJobError
+        api.fail = True
+        try:
+            await service.generate_pdf_via_job("single/minimal-single", {"title": "t", "author": "a"}, tmp / "ng.pdf")
+            assert False, "失敗するはず"
+        except RenderJobError as e:
+            assert "描画に失敗" in str(e)
+        print("✅ 失敗したジョブは RenderJobError")
+
+        # 終わらないジョブは期限で打ち切る
+        stuck = await service.submit_job("single/minimal-single", {"title": "t", "author": "a"})
+        api.jobs[stuck.job_id]["status"] = "stuck"
+        try:
+            await service.wait_job(stuck.job_id, timeout=0.05, poll_interval=0.01)
+            assert False, "タイムアウトするはず"
+        except asyncio.TimeoutError:
+            pass
+        print("✅ 期限を過ぎたら asyncio.TimeoutError")
+
+        await service.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(Path(tmp)))
+
+    print("\n" + "=" * 50)
+    print("✨ ジョブAPIクライアントテスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # ジョブAPIクライアントテスト
+        test_job_client()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
@@ -0,0 +1,252 @@
+"""
+バッチ生成用のHTML/CSSユーティリティ
+複数テンプレートを1つのHTMLにまとめる際、各ページのCSSがほかのページに影響しないようスコープする
+"""
+
+import html as html_lib
+import logging
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_SHEET_RE = re.compile(r"<style[^>]*>(.*?)</style>|<link\b([^>]*)>", re.DOTALL | re.IGNORECASE)
+_HTML_TAG_RE = re.compile(r"<html\b([^>]*)>", re.IGNORECASE)
+_BODY_RE = re.compile(r"<body\b([^>]*)>(.*?)</body>", re.DOTALL | re.IGNORECASE)
+_ATTRIBUTE_RE = re.compile(r"""([^\s=/>"']+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?""")
+_ROOT_SELECTOR_RE = re.compile(r"(html|body|:root)(?![\w-])", re.IGNORECASE)
+_PAGE_PRELUDE_RE = re.compile(r"^@page\b\s*([\w-]*)\s*(.*)$", re.IGNORECASE | re.DOTALL)
+_KEYFRAMES_RE = re.compile(r"@(?:-webkit-)?keyframes\s+([\w-]+)", re.IGNORECASE)
+_NAMED_PAGE_RE = re.compile(r"@page\s+([\w-]+)", re.IGNORECASE)
+_DECLARATION_RE = re.compile(
+    r"(?<![\w-])((?:-webkit-)?animation(?:-name)?|page)(\s*:\s*)([^;}]*)",
+    re.IGNORECASE
+)
+
+# 中身がルールセットのまま残るat-rule（中のセレクタもスコープする）
+_NESTED_AT_RULES = ("@media", "@supports", "@layer", "@container")
+
+
+def split_html_document(html: str, base_dir: Optional[Path] = None) -> Tuple[str, str, Dict[str, str]]:
+    """レンダリング済みHTMLから CSS・<body> の中身・<html>/<body> の属性を取り出す
+
+    <style> と <link rel="stylesheet"> は文書中の順に連結する。リンク先のシートは base_dir
+    （テンプレートのディレクトリ）から読み込んで埋め込み、読めないもの（外部URLなど）は警告して除く。
+
+    Returns:
+        (CSS, bodyの内側のHTML, htmlとbodyの属性。bodyの属性が優先され、class と style は連結する)
+    """
+    sheets = []
+    for match in _SHEET_RE.finditer(html):
+        if match.group(1) is not None:
+            sheets.append(match.group(1))
+        else:
+            sheet = _read_linked_sheet(_parse_attributes(match.group(2)), base_dir)
+            if sheet:
+                sheets.append(sheet)
+    css = "\n".join(sheets)
+
+    html_match = _HTML_TAG_RE.search(html)
+    body_match = _BODY_RE.search(html)
+    attributes = _merge_attributes(
+        _parse_attributes(html_match.group(1)) if html_match else {},
+        _parse_attributes(body_match.group(1)) if body_match else {}
+    )
+    body = body_match.group(2) if body_match else html
+    return css, body, attributes
+
+
+def wrap_section(body: str, attributes: Dict[str, str], class_name: str) -> str:
+    """bodyの中身を <section> で包み、元の <html>/<body> の属性を引き継ぐ"""
+    attributes = dict(attributes)
+    attributes["class"] = f"{class_name} {attributes['class']}" if attributes.get("class") else class_name
+    rendered = "".join(
+        f' {name}="{html_lib.escape(value, quote=True)}"' for name, value in attributes.items()
+    )
+    return f"<section{rendered}>{body}</section>"
+
+
+def _parse_attributes(text: str) -> Dict[str, str]:
+    attributes = {}
+    for name, value in _ATTRIBUTE_RE.findall(text or ""):
+        if value[:1] in ('"', "'"):
+            value = value[1:-1]
+        attributes[name.lower()] = html_lib.unescape(value)
+    return attributes
+
+
+def _merge_attributes(html_attributes: Dict[str, str], body_attributes: Dict[str, str]) -> Dict[str, str]:
+    merged = {}
+    for attributes in (html_attributes, body_attributes):
+        for name, value in attributes.items():
+            if name.startswith("xmlns"):
+                continue
+            if name == "class" and merged.get("class"):
+                value = f"{merged['class']} {value}"
+            elif name == "style" and merged.get("style"):
+                value = f"{merged['style'].rstrip().rstrip(';')}; {value}"
+            merged[name] = value
+    return merged
+
+
+def _read_linked_sheet(attributes: Dict[str, str], base_dir: Optional[Path]) -> str:
+    """<link rel="stylesheet"> の参照先を読み込む（media属性は @media で包む）"""
+    if "stylesheet" not in attributes.get("rel", "").lower().split():
+        return ""
+    href = attributes.get("href", "").split("#")[0].split("?")[0]
+    if not href:
+        return ""
+    if re.match(r"^[a-z][a-z0-9+.-]*:", href, re.IGNORECASE) or href.startswith("//"):
+        logger.warning(f"外部スタイルシートはバッチ生成で読み込めないため除外します: {href}")
+        return ""
+    path = Path(href) if href.startswith("/") or base_dir is None else Path(base_dir) / href
+    try:
+        sheet = path.read_text(encoding="utf-8")
+    except OSError as e:
+        logger.warning(f"スタイルシートを読み込めないため除外します: {path}, {str(e)}")
+        return ""
+    media = attributes.get("media", "").strip()
+    if media and media.lower() != "all":
+        sheet = f"@media {media} {{\n{sheet}\n}}"
+    return sheet
+
+
+def _split_selectors(selector_text: str) -> List[str]:
+    """カンマ区切りのセレクタを分割（括弧内のカンマは無視）"""
+    selectors, depth, current = [], 0, []
+    for char in selector_text:
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        if char == "," and depth == 0:
+            selectors.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    if "".join(current).strip():
+        selectors.append("".join(current).strip())
+    return selectors
+
+
+def _take_compound(selector: str) -> Tuple[str, str]:
+    """先頭の複合セレクタの続き（.foo・[lang]・:hover など）と、残りのセレクタに分ける"""
+    depth = 0
+    for index, char in enumerate(selector):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif depth == 0 and (char.isspace() or char in ">+~"):
+            return selector[:index], selector[index:].lstrip()
+    return selector, ""
+
+
+def _scope_selector(selector: str, scope: str) -> str:
+    """1つのセレクタをスコープ（html/body/:root はスコープ要素自身に置き換える）
+
+    <html>/<body> の属性はスコープ要素に引き継ぐため、body.dark や html[lang] .x の
+    クラス・属性などの条件もスコープ要素側に付ける（.scope.dark / .scope[lang] .x）。
+    """
+    rest = selector
+    compounds = []
+    # body > .x / html body .x などの先頭部分をまとめて置き換える
+    while True:
+        match = _ROOT_SELECTOR_RE.match(rest)
+        if not match:
+            break
+        compound, rest = _take_compound(rest[match.end():])
+        compounds.append(compound)
+    if not compounds:
+        return f"{scope} {selector}"
+    scoped = scope + "".join(compounds)
+    return f"{scoped} {rest}".strip() if rest else scoped
+
+
+def _rename_references(block: str, namespace: str, keyframes: Set[str], pages: Set[str]) -> str:
+    """宣言中の animation / animation-name / page が参照する名前を namespace 付きに置き換える"""
+    def replace(match):
+        names = pages if match.group(1).lower() == "page" else keyframes
+        if not names:
+            return match.group(0)
+        pattern = r"(?<![\w-])(" + "|".join(re.escape(name) for name in names) + r")(?![\w-])"
+        value = re.sub(pattern, lambda m: f"{namespace}-{m.group(1)}", match.group(3))
+        return f"{match.group(1)}{match.group(2)}{value}"
+    return _DECLARATION_RE.sub(replace, block)
+
+
+def scope_css(css: str, scope: str, namespace: Optional[str] = None) -> str:
+    """CSS内の全セレクタに scope を前置する
+
+    @media・@supports の中身は再帰的にスコープし、@font-face などはそのまま残す。
+    namespace を指定すると、ページ全体に効く @page と @keyframes も名前を付け替えてそのページに閉じ込める。
+    無名の @page は名前付きページ namespace に（scope の要素に page: namespace を指定）、
+    @page foo・@keyframes foo は namespace-foo にし、それを参照する page・animation も置き換える。
+    """
+    css = _COMMENT_RE.sub("", css)
+    keyframes: Set[str] = set()
+    pages: Set[str] = set()
+    if namespace:
+        keyframes = set(_KEYFRAMES_RE.findall(css))
+        pages = set(_NAMED_PAGE_RE.findall(css))
+    output = [f"{scope} {{ page: {namespace}; }}"] if namespace else []
+    output.append(_scope_rules(css, scope, namespace, keyframes, pages))
+    return "\n".join(output)
+
+
+def _scope_rules(css: str, scope: str, namespace: Optional[str], keyframes: Set[str], pages: Set[str]) -> str:
+    output = []
+    pos = 0
+    length = len(css)
+
+    while pos < length:
+        brace = css.find("{", pos)
+        semicolon = css.find(";", pos)
+
+        # ブロックを持たないat-rule（@import, @charset など）
+        if semicolon != -1 and (brace == -1 or semicolon < brace) and css[pos:semicolon].strip().startswith("@"):
+            output.append(css[pos:semicolon + 1].strip())
+            pos = semicolon + 1
+            continue
+
+        if brace == -1:
+            break
+
+        prelude = css[pos:brace].strip()
+
+        # 対応する閉じ括弧を探す
+        depth, end = 1, brace + 1
+        while end < length and depth:
+            if css[end] == "{":
+                depth += 1
+            elif css[end] == "}":
+                depth -= 1
+            end += 1
+        block = css[brace + 1:end - 1]
+        pos = end
+
+        if not prelude:
+            continue
+        if prelude.startswith("@"):
+            lowered = prelude.lower()
+            if lowered.startswith(_NESTED_AT_RULES):
+                output.append(f"{prelude} {{\n{_scope_rules(block, scope, namespace, keyframes, pages)}\n}}")
+            elif namespace and lowered.startswith("@page"):
+                name, pseudo = _PAGE_PRELUDE_RE.match(prelude).groups()
+                page_name = f"{namespace}-{name}" if name else namespace
+                output.append(f"@page {page_name}{pseudo} {{{block}}}")
+            elif namespace and _KEYFRAMES_RE.match(prelude):
+                at_keyword, name = prelude.split(None, 1)
+                output.append(f"{at_keyword} {namespace}-{name.strip()} {{{block}}}")
+            else:
+                output.append(f"{prelude} {{{block}}}")
+            continue
+
+        if namespace:
+            block = _rename_references(block, namespace, keyframes, pages)
+        selectors = ", ".join(_scope_selector(s, scope) for s in _split_selectors(prelude))
+        output.append(f"{selectors} {{{block}}}")
+
+    return "\n".join(output)
@@ -0,0 +1,213 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+from .settings import settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow未導入時は元画像をそのまま使う
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+MM_PER_INCH = 25.4
+
+
+class ImagePipeline:
+    """画像の縮小・再エンコード
+
+    テンプレートの画像枠（mm）とプロファイルのDPIから必要なピクセル数を求め、それより大きい画像だけを縮小する。
+    EXIFなどのメタデータは除去し、プロファイルの形式（printはプログレッシブJPEG、screenはWebP）で保存する。
+    結果は（元画像のハッシュ, 枠のピクセル数, 品質, 形式）をキーに IMAGE_CACHE_DIR にキャッシュする。
+    """
+
+    # 画像ハッシュ・素通し判定のメモの上限件数（古いものから捨てる）
+    SOURCE_HASH_MEMO_SIZE = 4096
+    PASSTHROUGH_MEMO_SIZE = 4096
+
+    def __init__(self, cache_dir: Optional[Path] = None, profile: Optional[str] = None):
+        self.cache_dir = Path(cache_dir or settings.IMAGE_CACHE_DIR)
+        self.profile_name = profile or settings.IMAGE_PROFILE
+        if self.profile_name not in settings.IMAGE_PROFILES:
+            logger.warning(f"不明な画像プロファイルのため print を使います: {self.profile_name}")
+            self.profile_name = "print"
+        self.profile = settings.IMAGE_PROFILES[self.profile_name]
+        self.enabled = Image is not None and settings.IMAGE_PIPELINE_ENABLED
+        # 画像ハッシュのメモ（パス, 更新時刻, サイズ）-> sha256
+        self._source_hashes: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        # 縮小しても小さくならず元画像を使うと判定したキー
+        self._passthrough: "OrderedDict[str, None]" = OrderedDict()
+        # process は複数スレッドから呼ばれるため、メモと stats の更新はこのロックで守る
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self.stats = {"hits": 0, "misses": 0, "passthrough": 0, "bytes_in": 0, "bytes_out": 0}
+        if Image is None:
+            logger.warning("Pillowがインストールされていないため、画像の縮小を行いません")
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _hash_source(self, source: Path) -> str:
+        stat = source.stat()
+        memo_key = (str(source), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._source_hashes.get(memo_key)
+            if digest is not None:
+                self._source_hashes.move_to_end(memo_key)
+                return digest
+
+        hasher = hashlib.sha256()
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with self._lock:
+            self._remember(self._source_hashes, memo_key, digest, self.SOURCE_HASH_MEMO_SIZE)
+        return digest
+
+    @staticmethod
+    def _remember(memo: OrderedDict, key: Any, value: Any, max_size: int) -> None:
+        """メモに追加し、上限を超えた分を最も長く使われていないものから捨てる（ロック内で呼ぶ）"""
+        memo[key] = value
+        memo.move_to_end(key)
+        while len(memo) > max_size:
+            memo.popitem(last=False)
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+    def target_pixels(self, box_mm: Tuple[float, float]) -> Tuple[int, int]:
+        """画像枠（mm）をプロファイルのDPIでピクセル数に換算"""
+        dpi = self.profile["dpi"]
+        return (
+            max(1, round(box_mm[0] / MM_PER_INCH * dpi)),
+            max(1, round(box_mm[1] / MM_PER_INCH * dpi))
+        )
+
+    def process(self, source: Path, box_mm: Tuple[float, float]) -> Path:
+        """画像枠に合わせて縮小・再エンコードした画像のパスを返す（不要・失敗時は元画像）
+
+        CPUを使うため、イベントループからは asyncio.to_thread などで呼び出す。
+        """
+        if not self.enabled:
+            return source
+
+        source = Path(source)
+        box_px = self.target_pixels(box_mm)
+        quality = self.profile["quality"]
+        image_format = self.profile["format"]
+        key = hashlib.sha256(
+            f"{self._hash_source(source)}:{box_px[0]}x{box_px[1]}:{quality}:{image_format}".encode("utf-8")
+        ).hexdigest()
+
+        with self._lock:
+            passthrough = key in self._passthrough
+            if passthrough:
+                self._passthrough.move_to_end(key)
+        if passthrough:
+            self._count(hits=1)
+            return source
+        for suffix in (".jpg", ".webp", ".png"):
+            cached = self.cache_dir / f"{key}{suffix}"
+            if cached.exists():
+                self._count(hits=1)
+                os.utime(cached)
+                return cached
+        self._count(misses=1)
+
+        try:
+            result = self._encode(source, box_px, key)
+        except Exception as e:
+            logger.warning(f"画像の縮小に失敗したため元画像を使います: {source}, {str(e)}")
+            return source
+
+        if time.monotonic() - self._last_cleanup > 60 * 60:
+            self.cleanup_expired()
+        return result
+
+    def _encode(self, source: Path, box_px: Tuple[int, int], key: str) -> Path:
+        source_size = source.stat().st_size
+        with Image.open(source) as original:
+            # 元画像にEXIF（位置情報など）やXMPが残っていれば、小さくならなくても再エンコードした方を使う
+            has_metadata = bool(original.getexif()) or "xmp" in original.info
+            # EXIFの回転情報を画素に反映してからメタデータを捨てる
+            image = ImageOps.exif_transpose(original)
+            resized = image.width > box_px[0] or image.height > box_px[1]
+            if resized:
+                image.thumbnail(box_px, Image.LANCZOS)
+
+            has_alpha = image.mode in ("RGBA", "LA", "P") and (
+                image.mode != "P" or "transparency" in image.info
+            )
+            image_format = self.profile["format"]
+            save_options: Dict[str, Any] = {"quality": self.profile["quality"]}
+            if has_alpha and image_format == "JPEG":
+                # 透過を保つためPNGで保存
+                image_format = "PNG"
+                save_options = {"optimize": True}
+            elif image_format == "JPEG":
+                image = image.convert("RGB")
+                save_options.update({"progressive": True, "optimize": True})
+            elif image_format == "WEBP":
+                image = image.convert("RGBA" if has_alpha else "RGB")
+                save_options["method"] = 4
+
+            icc_profile = original.info.get("icc_profile")
+            if icc_profile:
+                save_options["icc_profile"] = icc_profile
+
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format, **save_options)
+
+        data = buffer.getvalue()
+        if not resized and not has_metadata and len(data) >= source_size:
+            # 縮小不要・メタデータなしで、再エンコードしても小さくならない画像は元のまま使う
+            with self._lock:
+                self._remember(self._passthrough, key, None, self.PASSTHROUGH_MEMO_SIZE)
+            self._count(passthrough=1, bytes_in=source_size, bytes_out=source_size)
+            return source
+
+        suffix = {"JPEG": ".jpg", "WEBP": ".webp", "PNG": ".png"}[image_format]
+        dest = self.cache_dir / f"{key}{suffix}"
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_name, dest)
+        self._count(bytes_in=source_size, bytes_out=len(data))
+        logger.info(f"画像を縮小: {source.name} {source_size} -> {len(data)} bytes（{dest.name}）")
+        return dest
+
+    def cleanup_expired(self) -> int:
+        """保持期間を過ぎたキャッシュを削除"""
+        self._last_cleanup = time.monotonic()
+        threshold = time.time() - settings.IMAGE_CACHE_RETENTION_SECONDS
+        removed = 0
+        for path in self.cache_dir.iterdir():
+            try:
+                if path.is_file() and path.stat().st_mtime < threshold:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"期限切れの画像キャッシュを削除: {removed}件")
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """パイプラインの状態を取得"""
+        with self._lock:
+            stats = dict(self.stats)
+        return {"enabled": self.enabled, "profile": self.profile_name, **stats}
+
+
+# 画像パイプラインインスタンス
+image_pipeline = ImagePipeline()
@@ -0,0 +1,126 @@
+import errno
+import logging
+import os
+import shutil
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from .settings import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Linuxのioctl FICLONE（btrfs/XFSなどでのCopy-on-Write複製）
+_FICLONE = 0x40049409
+
+# リンク不可を示すエラー（別ファイルシステム・非対応など）。この組み合わせは以降試さない
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY}
+
+
+class StagingReport:
+    """1リクエスト分のステージング結果"""
+
+    def __init__(self):
+        self.methods: Counter = Counter()
+        self.bytes_avoided = 0
+        self.bytes_copied = 0
+
+    def add(self, method: str, size: int) -> None:
+        self.methods[method] += 1
+        if method == "copy":
+            self.bytes_copied += size
+        else:
+            self.bytes_avoided += size
+
+    def merge(self, other: "StagingReport") -> None:
+        self.methods.update(other.methods)
+        self.bytes_avoided += other.bytes_avoided
+        self.bytes_copied += other.bytes_copied
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "methods": dict(self.methods),
+            "bytes_avoided": self.bytes_avoided,
+            "bytes_copied": self.bytes_copied
+        }
+
+    def __str__(self) -> str:
+        methods = ", ".join(f"{k}={v}" for k, v in sorted(self.methods.items())) or "なし"
+        return f"{methods}, コピー回避 {self.bytes_avoided} bytes, コピー {self.bytes_copied} bytes"
+
+
+class ImageStager:
+    """画像を一時ディレクトリに配置する（コピーを避けられる方法から順に試す）
+
+    methods の順（デフォルト hardlink → reflink → copy）に試し、失敗したらコピーする。
+    symlink はVivliostyleのローカルサーバーがシンボリックリンクを辿らない場合があるため、
+    IMAGE_STAGING_METHODS で明示した場合のみ使う。
+    """
+
+    def __init__(self, methods: Optional[List[str]] = None):
+        self.methods = list(methods if methods is not None else settings.IMAGE_STAGING_METHODS)
+        # (方法, 元のデバイス, 配置先のデバイス) の失敗記録
+        self._unsupported: Set[Tuple[str, int, int]] = set()
+        self.totals = StagingReport()
+
+    def _try_method(self, method: str, source: Path, dest: Path) -> bool:
+        if method == "hardlink":
+            os.link(source, dest)
+        elif method == "symlink":
+            os.symlink(source.resolve(), dest)
+        elif method == "reflink":
+            if fcntl is None:
+                raise OSError(errno.ENOTSUP, "reflink非対応")
+            with open(source, "rb") as src, open(dest, "wb") as dst:
+                try:
+                    fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+                except OSError:
+                    dst.close()
+                    dest.unlink()
+                    raise
+        else:
+            return False
+        return True
+
+    def stage(self, source: Path, dest: Path, report: Optional[StagingReport] = None) -> str:
+        """source を dest に配置し、使った方法を返す"""
+        source = Path(source)
+        dest = Path(dest)
+        size = source.stat().st_size
+        devices = (source.stat().st_dev, dest.parent.stat().st_dev)
+
+        method = "copy"
+        for candidate in self.methods:
+            if candidate == "copy":
+                break
+            if (candidate, *devices) in self._unsupported:
+                continue
+            try:
+                if self._try_method(candidate, source, dest):
+                    method = candidate
+                    break
+            except OSError as e:
+                if e.errno in _UNSUPPORTED_ERRNOS:
+                    self._unsupported.add((candidate, *devices))
+                logger.debug(f"{candidate}で配置できません: {source}, {str(e)}")
+
+        if method == "copy":
+            shutil.copy2(source, dest)
+
+        self.totals.add(method, size)
+        if report is not None:
+            report.add(method, size)
+        return method
+
+    def get_stats(self) -> Dict[str, Any]:
+        """累計のステージング結果を取得"""
+        return {"order": self.methods, **self.totals.as_dict()}
+
+
+# ステージングインスタンス
+image_stager = ImageStager()
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .settings import settings
+from .schemas import Payload, JobRecord
+from .pdf_service import PDFService
+from .pdf_cache import pdf_cache
+from .render_scheduler import render_scheduler, SchedulerRejected
+
+logger = logging.getLogger(__name__)
+
+
+class JobService:
+    """非同期PDF生成ジョブサービス
+
+    ジョブはJOBS_DIRに1件1ファイル（{job_id}.json）で永続化し、生成結果は{job_id}.pdfに保存する。
+    起動時に未完了（queued/running）のジョブを読み戻して再投入するため、再起動してもジョブは失われない。
+    """
+
+    def __init__(self, pdf_service: PDFService, jobs_dir: Optional[Path] = None, workers: Optional[int] = None):
+        self.pdf_service = pdf_service
+        self.jobs_dir = Path(jobs_dir or settings.JOBS_DIR)
+        self.workers = settings.JOB_WORKERS if workers is None else workers
+        self._jobs: Dict[str, JobRecord] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._last_cleanup = 0.0
+
+    def _record_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _result_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.pdf"
+
+    def _persist(self, job: JobRecord) -> None:
+        """ジョブレコードを原子的に書き込む"""
+        fd, tmp_name = tempfile.mkstemp(dir=self.jobs_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(job.model_dump_json())
+        os.replace(tmp_name, self._record_path(job.job_id))
+
+    def _load(self) -> List[JobRecord]:
+        """永続化済みジョブを読み込み、再実行が必要なものを受付順に返す"""
+        pending = []
+        for record_path in self.jobs_dir.glob("*.json"):
+            try:
+                job = JobRecord.model_validate_json(record_path.read_text(encoding="utf-8"))
+            except Exception as e:
+                logger.warning(f"ジョブレコードを読み込めません: {record_path}, {str(e)}")
+                continue
+            self._jobs[job.job_id] = job
+            if job.status in ("queued", "running"):
+                job.status = "queued"
+                pending.append(job)
+        return sorted(pending, key=lambda j: j.created_at)
+
+    async def start(self) -> None:
+        """永続化済みジョブを復元してワーカーを起動"""
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._queue = asyncio.Queue()
+
+        pending = self._load()
+        self.cleanup_expired()
+        for job in pending:
+            self._persist(job)
+            self._queue.put_nowait(job.job_id)
+        if pending:
+            logger.info(f"未完了ジョブを再投入: {len(pending)}件")
+
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"ジョブワーカー開始: workers={self.workers}")
+
+    async def stop(self) -> None:
+        """ワーカーを停止（実行中のジョブは次回起動時に再実行される）"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("ジョブワーカー停止")
+
+    def submit(self, template_id: str, payload: Payload) -> JobRecord:
+        """ジョブを受け付けてキューに投入"""
+        if not settings.is_allowed_template(template_id):
+            raise ValueError(f"許可されていないテンプレートID: {template_id}")
+
+        job = JobRecord(
+            job_id=uuid.uuid4().hex,
+            status="queued",
+            template_id=template_id,
+            payload=payload,
+            created_at=datetime.now()
+        )
+        self._jobs[job.job_id] = job
+        self._persist(job)
+        self._queue.put_nowait(job.job_id)
+        logger.info(f"ジョブ受付: job_id={job.job_id}, template_id={template_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        """ジョブを取得"""
+        return self._jobs.get(job_id)
+
+    def get_result_path(self, job_id: str) -> Optional[Path]:
+        """完了済みジョブのPDFパスを取得"""
+        job = self._jobs.get(job_id)
+        if not job or job.status != "succeeded":
+            return None
+        path = self._result_path(job_id)
+        return path if path.exists() else None
+
+    def queue_depth(self) -> int:
+        """待機中のジョブ数"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def _worker(self, worker_index: int) -> None:
+        """キューからジョブを取り出して順に処理"""
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self._jobs.get(job_id)
+                if job and job.status == "queued":
+                    await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"ジョブワーカー{worker_index}エラー: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job: JobRecord) -> None:
+        """1件のジョブを実行"""
+        if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            self._finish(job, "failed", error="再実行の上限回数に達しました")
+            return
+
+        job.status = "running"
+        job.started_at = datetime.now()
+        job.attempts += 1
+        self._persist(job)
+
+        try:
+            cache_key, pdf_path = await self.pdf_service.find_cached_pdf(job.template_id, job.payload)
+            rejections = 0
+            while not pdf_path:
+                try:
+                    async with render_scheduler.slot(job.template_id):
+                        pdf_path = await self.pdf_service.generate_pdf(
+                            template_id=job.template_id,
+                            payload=job.payload,
+                            cache_key=cache_key
+                        )
+                except SchedulerRejected as e:
+                    # 同期APIが混雑している間は待ってから再試行する（上限を超えたらジョブを失敗にする）
+                    rejections += 1
+                    if rejections > settings.JOB_MAX_SCHEDULER_RETRIES:
+                        raise RuntimeError(f"混雑のため実行枠を確保できませんでした（{rejections}回拒否）: {str(e)}")
+                    await asyncio.sleep(e.retry_after)
+
+            self._store_result(job.job_id, Path(pdf_path))
+            self._finish(job, "succeeded", file_size=self._result_path(job.job_id).stat().st_size)
+        except asyncio.CancelledError:
+            # 停止時は running のまま残し、次回起動時に再実行する
+            raise
+        except Exception as e:
+            logger.error(f"ジョブ失敗: job_id={job.job_id}, {str(e)}")
+            self._finish(job, "failed", error=str(e))
+
+    def _store_result(self, job_id: str, pdf_path: Path) -> None:
+        """生成されたPDFをジョブディレクトリに保存"""
+        result_path = self._result_path(job_id)
+        if pdf_cache.is_cached_path(pdf_path):
+            # キャッシュは削除され得るため、リンク（不可ならコピー）で保持する
+            try:
+                os.link(pdf_path, result_path)
+            except OSError:
+                shutil.copyfile(pdf_path, result_path)
+        else:
+            shutil.move(str(pdf_path), result_path)
+
+    def _finish(self, job: JobRecord, status: str, error: Optional[str] = None, file_size: Optional[int] = None) -> None:
+        job.status = status
+        job.finished_at = datetime.now()
+        job.error = error
+        job.file_size = file_size
+        self._persist(job)
+        logger.info(f"ジョブ終了: job_id={job.job_id}, status={status}")
+
+        if time.monotonic() - self._last_cleanup > 60 * 60:
+            self.cleanup_expired()
+
+    def cleanup_expired(self) -> int:
+        """保持期限を過ぎた完了済みジョブを削除"""
+        self._last_cleanup = time.monotonic()
+        threshold = time.time() - settings.JOB_RETENTION_SECONDS
+        removed = 0
+        for record_path in self.jobs_dir.glob("*.json"):
+            if record_path.stat().st_mtime >= threshold:
+                continue
+            job_id = record_path.stem
+            job = self._jobs.get(job_id)
+            if job and job.status in ("queued", "running"):
+                continue
+            record_path.unlink(missing_ok=True)
+            self._result_path(job_id).unlink(missing_ok=True)
+            self._jobs.pop(job_id, None)
+            removed += 1
+        if removed:
+            logger.info(f"期限切れジョブを削除: {removed}件")
+        return removed
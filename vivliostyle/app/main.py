@@ -1,29 +1,53 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import tempfile
 import os
 import subprocess
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from .pdf_service import PDFService
-from .schemas import GenerateRequest, GenerateResponse
+from .render_pool import render_pool
+from .render_scheduler import render_scheduler, SchedulerRejected
+from .pdf_cache import pdf_cache
+from .template_registry import template_registry
+from .image_staging import image_stager
+from .image_pipeline import image_pipeline
+from .schemas import GenerateRequest, GenerateResponse, BatchGenerateRequest, JobInfo
+from .job_service import JobService
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時にテンプレートの事前読み込みと常駐レンダリングワーカーの起動を行い、終了時に停止"""
+    await template_registry.start()
+    await render_pool.start()
+    await job_service.start()
+    yield
+    await job_service.stop()
+    render_scheduler.close()
+    await render_pool.stop()
+    await template_registry.stop()
+
 app = FastAPI(
     title="雑誌風PDF自動生成サービス",
     description="Vivliostyle CLIを使用して雑誌風PDFを生成するサービス",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # PDFサービスインスタンス
 pdf_service = PDFService()
 
+# 非同期ジョブサービスインスタンス
+job_service = JobService(pdf_service)
+
 @app.get("/")
 async def root():
     """ヘルスチェックエンドポイント"""
@@ -35,41 +59,134 @@ async def list_templates():
     templates = pdf_service.get_available_templates()
     return {"templates": templates}
 
+def _pdf_streaming_response(pdf_path: str, filename: str) -> StreamingResponse:
+    """生成したPDFをストリーミングで返す"""
+    def iterfile():
+        with open(pdf_path, "rb") as f:
+            yield from f
+        # 一時ファイル削除（キャッシュ内のファイルは残す）
+        if not pdf_cache.is_cached_path(pdf_path):
+            os.unlink(pdf_path)
+    
+    return StreamingResponse(
+        iterfile(),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        }
+    )
+
 @app.post("/generate", response_model=GenerateResponse)
 async def generate_pdf(request: GenerateRequest):
     """PDF生成エンドポイント"""
     try:
         logger.info(f"PDF生成開始: template_id={request.template_id}")
         
-        # PDF生成
-        pdf_path = await pdf_service.generate_pdf(
-            template_id=request.template_id,
-            payload=request.payload
-        )
+        # 生成済みならキャッシュから返す（実行枠を待たない）
+        cache_key, pdf_path = await pdf_service.find_cached_pdf(request.template_id, request.payload)
+        if not pdf_path:
+            # PDF生成（同時実行数を制限し、超過分は優先度付きで待機）
+            async with render_scheduler.slot(request.template_id):
+                pdf_path = await pdf_service.generate_pdf(
+                    template_id=request.template_id,
+                    payload=request.payload,
+                    cache_key=cache_key
+                )
         
         # ファイルサイズ確認
         file_size = os.path.getsize(pdf_path)
         logger.info(f"PDF生成完了: {pdf_path}, サイズ: {file_size} bytes")
         
         # ストリーミングレスポンス
-        def iterfile():
-            with open(pdf_path, "rb") as f:
-                yield from f
-            # 一時ファイル削除
-            os.unlink(pdf_path)
+        return _pdf_streaming_response(pdf_path, f"magazine_{request.template_id}.pdf")
         
-        return StreamingResponse(
-            iterfile(),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=magazine_{request.template_id}.pdf"
-            }
+    except SchedulerRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
         )
-        
     except Exception as e:
         logger.error(f"PDF生成エラー: {str(e)}")
         raise HTTPException(status_code=500, detail=f"PDF生成に失敗しました: {str(e)}")
 
+@app.post("/generate/batch", response_model=GenerateResponse)
+async def generate_batch_pdf(request: BatchGenerateRequest):
+    """複数ページを1回のVivliostyle CLI実行で1つのPDFにまとめて生成"""
+    try:
+        logger.info(f"バッチPDF生成開始: {len(request.pages)}ページ")
+        
+        cache_key, pdf_path = await pdf_service.find_cached_batch_pdf(request.pages)
+        if not pdf_path:
+            # バッチは最も重い扱い（見開きページと同じ優先度以下）で実行枠を確保
+            async with render_scheduler.slot("batch"):
+                pdf_path = await pdf_service.generate_batch_pdf(request.pages, cache_key=cache_key)
+        
+        file_size = os.path.getsize(pdf_path)
+        logger.info(f"バッチPDF生成完了: {pdf_path}, サイズ: {file_size} bytes")
+        
+        return _pdf_streaming_response(pdf_path, "magazine_batch.pdf")
+        
+    except SchedulerRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"バッチPDF生成エラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"PDF生成に失敗しました: {str(e)}")
+
+@app.post("/jobs", response_model=JobInfo, status_code=202)
+async def create_job(request: GenerateRequest):
+    """非同期PDF生成ジョブを受け付け、ジョブIDを即座に返す"""
+    try:
+        job = job_service.submit(request.template_id, request.payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return JSONResponse(
+        status_code=202,
+        content=JobInfo(**job.model_dump(exclude={"payload"})).model_dump(mode="json"),
+        headers={"Location": f"/jobs/{job.job_id}"}
+    )
+
+@app.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str):
+    """ジョブの状態を取得"""
+    job = job_service.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return JobInfo(**job.model_dump(exclude={"payload"}))
+
+@app.get("/jobs/{job_id}/pdf")
+async def get_job_pdf(job_id: str):
+    """完了したジョブのPDFをダウンロード"""
+    job = job_service.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    if job.status == "failed":
+        raise HTTPException(status_code=409, detail=f"ジョブは失敗しました: {job.error}")
+    
+    pdf_path = job_service.get_result_path(job_id)
+    if not pdf_path and job.status == "succeeded":
+        raise HTTPException(status_code=410, detail="ジョブのPDFは削除されています")
+    if not pdf_path:
+        retry_after = max(1, int(render_scheduler.estimate_wait(job_service.queue_depth())))
+        raise HTTPException(
+            status_code=409,
+            detail=f"ジョブは処理中です（status={job.status}）",
+            headers={"Retry-After": str(retry_after)}
+        )
+    
+    return FileResponse(
+        path=str(pdf_path),
+        media_type="application/pdf",
+        filename=f"magazine_{job.template_id.replace('/', '_')}.pdf"
+    )
+
 @app.get("/health")
 async def health_check():
     """システムヘルスチェック"""
@@ -86,7 +203,14 @@ async def health_check():
         return {
             "status": "healthy",
             "vivliostyle_cli": "available" if vivliostyle_available else "not_available",
-            "vivliostyle_version": result.stdout.strip() if vivliostyle_available else None
+            "vivliostyle_version": result.stdout.strip() if vivliostyle_available else None,
+            "render_pool": render_pool.get_stats(),
+            "render_scheduler": render_scheduler.get_stats(),
+            "pdf_cache": pdf_cache.get_stats(),
+            "templates": template_registry.get_stats(),
+            "image_staging": image_stager.get_stats(),
+            "image_pipeline": image_pipeline.get_stats(),
+            "job_queue_depth": job_service.queue_depth()
         }
     except Exception as e:
         return {
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from .settings import settings
+from .schemas import Payload
+from .template_registry import template_registry
+
+logger = logging.getLogger(__name__)
+
+
+class PDFCache:
+    """生成済みPDFのコンテンツアドレス型ディスクキャッシュ
+
+    キーは template_id・Payload・参照画像のバイト列・テンプレートファイルの更新時刻から
+    計算したSHA-256。合計サイズがmax_bytesを超えたら最も長く使われていないものから削除する。
+    キーの計算（画像のハッシュ）はスレッドから呼ばれることがある。
+    """
+
+    # 画像ハッシュのメモの上限件数
+    IMAGE_HASH_MEMO_SIZE = 4096
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir or settings.PDF_CACHE_DIR)
+        self.max_bytes = settings.PDF_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.enabled = settings.PDF_CACHE_ENABLED and self.max_bytes > 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        # 画像ハッシュのメモ（パス, 更新時刻, サイズ）-> sha256（古いものから捨てる）
+        self._image_hashes: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._image_hashes_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._load_index()
+
+    def _load_index(self) -> None:
+        """既存のキャッシュファイルを最終利用時刻順に読み込む"""
+        files = sorted(self.cache_dir.glob("*.pdf"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self._total_bytes += size
+        logger.info(f"PDFキャッシュ読み込み: {len(self._entries)}件, {self._total_bytes} bytes")
+
+    def _path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pdf"
+
+    def _hash_image(self, image_path: Path) -> str:
+        """画像ファイルのハッシュ（更新されていなければメモを再利用）"""
+        stat = image_path.stat()
+        memo_key = (str(image_path), stat.st_mtime_ns, stat.st_size)
+        with self._image_hashes_lock:
+            digest = self._image_hashes.get(memo_key)
+            if digest is not None:
+                self._image_hashes.move_to_end(memo_key)
+                return digest
+
+        hasher = hashlib.sha256()
+        with open(image_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with self._image_hashes_lock:
+            self._image_hashes[memo_key] = digest
+            self._image_hashes.move_to_end(memo_key)
+            while len(self._image_hashes) > self.IMAGE_HASH_MEMO_SIZE:
+                self._image_hashes.popitem(last=False)
+        return digest
+
+    def compute_key(
+        self,
+        template_id: str,
+        payload: Payload,
+        image_paths: List[Optional[Path]]
+    ) -> str:
+        """キャッシュキーを計算"""
+        # テンプレートの更新時刻はレジストリが保持しているものを使う（実際に描画に使う版と一致させる）
+        template_files = [list(f) for f in template_registry.get_fingerprint(template_id)]
+
+        material = {
+            "template_id": template_id,
+            "payload": payload.model_dump(mode="json"),
+            "images": [
+                self._hash_image(p) if p is not None and p.exists() else None
+                for p in image_paths
+            ],
+            "template_files": template_files,
+            # 画像の縮小設定が変われば別のPDFになる
+            "image_profile": settings.IMAGE_PROFILE if settings.IMAGE_PIPELINE_ENABLED else None
+        }
+        canonical = json.dumps(material, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def combine_keys(self, keys: List[str]) -> str:
+        """複数ページのキーから、ページ順を含めたバッチ全体のキーを計算"""
+        return hashlib.sha256(("batch:" + ",".join(keys)).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Path]:
+        """キャッシュ済みPDFのパスを取得（なければNone）"""
+        if not self.enabled:
+            return None
+        path = self._path_for(key)
+        if key in self._entries and path.exists():
+            self._entries.move_to_end(key)
+            os.utime(path)
+            self.stats["hits"] += 1
+            return path
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, pdf_path: Path) -> Path:
+        """生成したPDFをキャッシュに登録し、キャッシュ内のパスを返す"""
+        path = self._path_for(key)
+        # 書き込み途中のファイルを読まれないよう一時ファイル経由で置き換える
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(pdf_path, tmp_name)
+        os.replace(tmp_name, path)
+
+        size = path.stat().st_size
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)
+        self._entries[key] = size
+        self._total_bytes += size
+        self._evict(keep=key)
+        return path
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """上限サイズを超えた分を古い順に削除"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = next(iter(self._entries.items()))
+            if key == keep and len(self._entries) == 1:
+                break
+            self._entries.pop(key)
+            self._total_bytes -= size
+            try:
+                self._path_for(key).unlink()
+            except FileNotFoundError:
+                pass
+            self.stats["evictions"] += 1
+            logger.info(f"PDFキャッシュ削除: {key}")
+
+    def is_cached_path(self, path) -> bool:
+        """パスがキャッシュ内のファイルか（削除してはいけないファイルか）"""
+        return Path(path).parent.resolve() == self.cache_dir.resolve()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キャッシュの状態を取得"""
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            **self.stats
+        }
+
+
+# キャッシュインスタンス
+pdf_cache = PDFCache()
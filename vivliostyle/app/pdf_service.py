@@ -5,12 +5,17 @@ import logging
 import os
 import shutil
 from pathlib import Path
-from typing import Dict, Any, List
-from jinja2 import Environment, FileSystemLoader, Template
+from typing import Dict, Any, List, Optional, Tuple
 import time
 
 from .settings import settings
-from .schemas import Payload
+from .schemas import Payload, BatchPage
+from .render_pool import render_pool, RenderWorkerError
+from .pdf_cache import pdf_cache
+from .css_scope import split_html_document, scope_css, wrap_section
+from .template_registry import template_registry
+from .image_staging import image_stager, StagingReport
+from .image_pipeline import image_pipeline
 
 logger = logging.getLogger(__name__)
 
@@ -18,61 +23,89 @@ class PDFService:
     """PDF生成サービス"""
     
     def __init__(self):
-        self.jinja_env = Environment(
-            loader=FileSystemLoader(str(settings.TEMPLATES_DIR)),
-            autoescape=True
-        )
+        self.templates = template_registry
         settings.ensure_temp_dir()
     
     def get_available_templates(self) -> List[str]:
         """利用可能なテンプレート一覧を取得"""
         return settings.get_available_templates()
     
-    async def generate_pdf(
+    async def find_cached_pdf(
         self, 
         template_id: str, 
         payload: Payload
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """キャッシュキーを計算し、生成済みPDFを探す（実行枠を確保する前に呼ぶ）
+        
+        画像のハッシュ計算はイベントループを止めないようスレッドで行う。
+        
+        Returns:
+            (キャッシュキー（キャッシュ無効時はNone）, 生成済みPDFのパス（なければNone）)
+        """
+        if not settings.is_allowed_template(template_id):
+            raise ValueError(f"許可されていないテンプレートID: {template_id}")
+        if not pdf_cache.enabled:
+            return None, None
+        
+        source_images = [self._resolve_image_path(image_path) for image_path in payload.images]
+        cache_key = await asyncio.to_thread(pdf_cache.compute_key, template_id, payload, source_images)
+        cached_pdf = pdf_cache.get(cache_key)
+        if cached_pdf:
+            logger.info(f"PDFキャッシュヒット: {template_id}, {cached_pdf}")
+            return cache_key, str(cached_pdf)
+        return cache_key, None
+    
+    async def generate_pdf(
+        self, 
+        template_id: str, 
+        payload: Payload,
+        cache_key: Optional[str] = None
     ) -> str:
-        """PDFを生成"""
+        """PDFを生成
+        
+        cache_key には find_cached_pdf で計算済みのキーを渡せる（枠を待つ間に生成されていればそれを返す）。
+        """
         
         # テンプレートIDの検証
         if not settings.is_allowed_template(template_id):
             raise ValueError(f"許可されていないテンプレートID: {template_id}")
         
+        # 同一内容のPDFが生成済みならCLIを起動せずにキャッシュを返す
+        if cache_key is None:
+            cache_key, cached_pdf = await self.find_cached_pdf(template_id, payload)
+        else:
+            cached_pdf = pdf_cache.get(cache_key)
+        if cached_pdf:
+            return str(cached_pdf)
+        
         # 一時ディレクトリ作成
         with tempfile.TemporaryDirectory(dir=settings.TEMP_DIR) as temp_dir:
             temp_path = Path(temp_dir)
             
             try:
-                # 1. テンプレートファイルをコピー
-                template_path = settings.get_template_path(template_id)
-                if not template_path.exists():
-                    raise ValueError(f"テンプレートが見つかりません: {template_id}")
-                
-                # 2. 画像ファイルをコピー
-                processed_images = await self._process_images(payload.images, temp_path)
+                # 1. 画像ファイルをコピー
+                processed_images = await self._process_images(payload.images, temp_path, template_id=template_id)
                 
-                # 3. HTMLテンプレートを処理
+                # 2. HTMLテンプレートを処理
                 html_content = await self._render_template(
                     template_id, 
                     payload, 
                     processed_images
                 )
                 
-                # 4. HTMLファイルを保存
+                # 3. HTMLファイルを保存
                 html_file = temp_path / "index.html"
                 with open(html_file, "w", encoding="utf-8") as f:
                     f.write(html_content)
                 
-                # 5. Vivliostyle CLIでPDF生成
+                # 4. Vivliostyle CLIでPDF生成
                 pdf_path = await self._generate_pdf_with_vivliostyle(
                     html_file, 
                     temp_path
                 )
                 
-                # 6. PDFファイルを一時ディレクトリにコピー（削除を遅延させるため）
-                final_pdf_path = settings.TEMP_DIR / f"magazine_{int(time.time())}.pdf"
-                shutil.copy2(pdf_path, final_pdf_path)
+                # 5. PDFファイルをキャッシュ（無効時は一時ディレクトリ）にコピー（削除を遅延させるため）
+                final_pdf_path = self._store_pdf(pdf_path, cache_key)
                 
                 logger.info(f"PDF生成完了: {final_pdf_path}")
                 return str(final_pdf_path)
@@ -81,26 +114,171 @@ class PDFService:
                 logger.error(f"PDF生成エラー: {str(e)}")
                 raise
     
-    async def _process_images(self, image_paths: List[str], temp_dir: Path) -> List[str]:
-        """画像ファイルを処理して一時ディレクトリにコピーし、HTML用にはファイル名のみ返す"""
+    async def find_cached_batch_pdf(self, pages: List[BatchPage]) -> Tuple[Optional[str], Optional[str]]:
+        """全ページのキャッシュキーをまとめたキーで生成済みのバッチPDFを探す（実行枠を確保する前に呼ぶ）
+        
+        Returns:
+            (キャッシュキー（キャッシュ無効時はNone）, 生成済みPDFのパス（なければNone）)
+        """
+        self._validate_batch(pages)
+        if not pdf_cache.enabled:
+            return None, None
+        
+        def compute_keys() -> List[str]:
+            return [
+                pdf_cache.compute_key(
+                    page.template_id,
+                    page.payload,
+                    [self._resolve_image_path(image_path) for image_path in page.payload.images]
+                )
+                for page in pages
+            ]
+        
+        cache_key = pdf_cache.combine_keys(await asyncio.to_thread(compute_keys))
+        cached_pdf = pdf_cache.get(cache_key)
+        if cached_pdf:
+            logger.info(f"PDFキャッシュヒット（バッチ {len(pages)}ページ）: {cached_pdf}")
+            return cache_key, str(cached_pdf)
+        return cache_key, None
+    
+    def _validate_batch(self, pages: List[BatchPage]) -> None:
+        """ページ数とテンプレートIDの検証"""
+        if not pages:
+            raise ValueError("ページが指定されていません")
+        if len(pages) > settings.BATCH_MAX_PAGES:
+            raise ValueError(f"ページ数が上限（{settings.BATCH_MAX_PAGES}）を超えています: {len(pages)}")
+        
+        # テンプレートIDの検証
+        for page in pages:
+            if not settings.is_allowed_template(page.template_id):
+                raise ValueError(f"許可されていないテンプレートID: {page.template_id}")
+    
+    async def generate_batch_pdf(self, pages: List[BatchPage], cache_key: Optional[str] = None) -> str:
+        """複数ページを1つのHTMLにまとめ、Vivliostyle CLIの1回の実行でPDFを生成"""
+        
+        self._validate_batch(pages)
+        
+        # 全ページのキャッシュキーをまとめたキーで生成済みPDFを探す
+        if cache_key is None:
+            cache_key, cached_pdf = await self.find_cached_batch_pdf(pages)
+        else:
+            cached_pdf = pdf_cache.get(cache_key)
+        if cached_pdf:
+            return str(cached_pdf)
+        
+        with tempfile.TemporaryDirectory(dir=settings.TEMP_DIR) as temp_dir:
+            temp_path = Path(temp_dir)
+            
+            try:
+                styles = []
+                sections = []
+                for index, page in enumerate(pages):
+                    # ページごとにファイル名の衝突しない画像を用意してテンプレートを処理
+                    processed_images = await self._process_images(
+                        page.payload.images,
+                        temp_path,
+                        prefix=f"page{index}_image",
+                        template_id=page.template_id
+                    )
+                    html_content = await self._render_template(
+                        page.template_id,
+                        page.payload,
+                        processed_images
+                    )
+                    
+                    # 各ページのCSS（@page・@keyframes を含む）をそのページのsectionに閉じ込める
+                    css, body, attributes = split_html_document(
+                        html_content,
+                        base_dir=settings.get_template_path(page.template_id)
+                    )
+                    scope = f"batch-page-{index}"
+                    styles.append(scope_css(css, f".{scope}", namespace=scope))
+                    sections.append(wrap_section(body, attributes, f"batch-page {scope}"))
+                
+                html_file = temp_path / "index.html"
+                with open(html_file, "w", encoding="utf-8") as f:
+                    f.write(self._compose_batch_html(styles, sections))
+                
+                pdf_path = await self._generate_pdf_with_vivliostyle(html_file, temp_path)
+                final_pdf_path = self._store_pdf(pdf_path, cache_key)
+                
+                logger.info(f"バッチPDF生成完了: {final_pdf_path}（{len(pages)}ページ）")
+                return str(final_pdf_path)
+                
+            except Exception as e:
+                logger.error(f"バッチPDF生成エラー: {str(e)}")
+                raise
+    
+    def _compose_batch_html(self, styles: List[str], sections: List[str]) -> str:
+        """スコープ済みCSSと各ページのsectionから1つのHTML文書を組み立てる"""
+        style_block = "\n".join(styles)
+        section_block = "\n".join(sections)
+        return (
+            '<!DOCTYPE html>\n'
+            '<html lang="ja">\n'
+            '<head>\n'
+            '<meta charset="UTF-8">\n'
+            '<style>\n'
+            '.batch-page { break-after: page; }\n'
+            '.batch-page:last-child { break-after: auto; }\n'
+            f'{style_block}\n'
+            '</style>\n'
+            '</head>\n'
+            f'<body>\n{section_block}\n</body>\n'
+            '</html>\n'
+        )
+    
+    def _store_pdf(self, pdf_path: Path, cache_key: Optional[str]) -> Path:
+        """生成したPDFをキャッシュ（無効時は一時ディレクトリ）に移す"""
+        if cache_key:
+            return pdf_cache.put(cache_key, pdf_path)
+        
+        final_pdf_path = settings.TEMP_DIR / f"magazine_{int(time.time())}.pdf"
+        shutil.copy2(pdf_path, final_pdf_path)
+        return final_pdf_path
+    
+    def _resolve_image_path(self, image_path: str) -> Optional[Path]:
+        """画像パス（サンプル画像名または絶対パス）を実ファイルのパスに解決"""
+        # サンプル画像パスの場合
+        if not image_path.startswith(("http://", "https://", "/")):
+            sample_image_path = settings.get_sample_image_path(image_path)
+            if sample_image_path.exists():
+                return sample_image_path
+        
+        # 絶対パスの場合
+        if os.path.exists(image_path):
+            return Path(image_path)
+        return None
+    
+    async def _process_images(
+        self, 
+        image_paths: List[str], 
+        temp_dir: Path, 
+        prefix: str = "image",
+        template_id: Optional[str] = None
+    ) -> List[str]:
+        """画像ファイルを一時ディレクトリに配置し、HTML用にはファイル名のみ返す
+        
+        画像はテンプレートの画像枠に合わせて縮小・再エンコードしたもの（キャッシュ済み）を使い、
+        可能ならハードリンク等で配置して画像のコピーを避ける。
+        """
         processed_images = []
+        report = StagingReport()
         
         for i, image_path in enumerate(image_paths):
             try:
-                # サンプル画像パスの場合
-                if not image_path.startswith(("http://", "https://", "/")):
-                    sample_image_path = settings.get_sample_image_path(image_path)
-                    if sample_image_path.exists():
-                        # 一時ディレクトリにコピー
-                        dest_path = temp_dir / f"image_{i}{sample_image_path.suffix}"
-                        shutil.copy2(sample_image_path, dest_path)
-                        processed_images.append(dest_path.name)  # ファイル名のみ
-                        continue
-                
-                # 絶対パスの場合
-                if os.path.exists(image_path):
-                    dest_path = temp_dir / f"image_{i}{Path(image_path).suffix}"
-                    shutil.copy2(image_path, dest_path)
+                source_path = self._resolve_image_path(image_path)
+                if source_path:
+                    # 画像枠に合わせて縮小
+                    source_path = await asyncio.to_thread(
+                        image_pipeline.process,
+                        source_path,
+                        settings.get_image_slot(template_id, i)
+                    )
+                    
+                    # 一時ディレクトリに配置
+                    dest_path = temp_dir / f"{prefix}_{i}{source_path.suffix}"
+                    image_stager.stage(source_path, dest_path, report)
                     processed_images.append(dest_path.name)  # ファイル名のみ
                 else:
                     logger.warning(f"画像ファイルが見つかりません: {image_path}")
@@ -110,6 +288,8 @@ class PDFService:
                 logger.error(f"画像処理エラー: {image_path}, {str(e)}")
                 processed_images.append("")
         
+        if report.methods:
+            logger.info(f"画像ステージング: {report}")
         return processed_images
     
     async def _render_template(
@@ -118,23 +298,9 @@ class PDFService:
         payload: Payload, 
         processed_images: List[str]
     ) -> str:
-        """Jinja2テンプレートをレンダリング"""
-        
-        template_path = settings.get_template_path(template_id)
-        html_file = template_path / "template.html"
-        css_file = template_path / "style.css"
+        """Jinja2テンプレートをレンダリング（コンパイル済みテンプレートとCSSはレジストリから取得）"""
         
-        if not html_file.exists():
-            raise ValueError(f"HTMLテンプレートが見つかりません: {html_file}")
-        
-        # テンプレートを読み込み
-        template = self.jinja_env.get_template(f"{template_id}/template.html")
-        
-        # CSSファイルの内容を読み込み
-        css_content = ""
-        if css_file.exists():
-            with open(css_file, "r", encoding="utf-8") as f:
-                css_content = f.read()
+        entry = self.templates.get(template_id)
         
         # テンプレート変数を準備
         template_vars = {
@@ -145,22 +311,51 @@ class PDFService:
             "subtitle": payload.subtitle,
             "quote": payload.quote,
             "quote_author": payload.quote_author,
-            "css_content": css_content,
+            "css_content": entry.css_content,
             "additional_data": payload.additional_data or {}
         }
         
         # テンプレートをレンダリング
-        return template.render(**template_vars)
+        return entry.template.render(**template_vars)
     
     async def _generate_pdf_with_vivliostyle(
         self, 
         html_file: Path, 
         output_dir: Path
     ) -> Path:
-        """Vivliostyle CLIでPDFを生成"""
+        """Vivliostyle CLIでPDFを生成（常駐ワーカーが使えればワーカー経由）"""
         
         output_file = output_dir / "output.pdf"
         
+        if render_pool.is_running:
+            try:
+                await render_pool.render(
+                    html_file,
+                    output_file,
+                    {
+                        "format": settings.VIVLIOSTYLE_OUTPUT_FORMAT,
+                        "size": "A4",
+                        "single_doc": True,
+                        "timeout": settings.VIVLIOSTYLE_TIMEOUT
+                    }
+                )
+                if not output_file.exists():
+                    raise RuntimeError("PDFファイルが生成されませんでした")
+                
+                logger.info(f"レンダリングワーカーで生成完了: {output_file}")
+                return output_file
+            except RenderWorkerError as e:
+                logger.warning(f"レンダリングワーカーが利用できないためCLIで生成します: {str(e)}")
+        
+        return await self._run_vivliostyle_cli(html_file, output_file)
+    
+    async def _run_vivliostyle_cli(
+        self, 
+        html_file: Path, 
+        output_file: Path
+    ) -> Path:
+        """Vivliostyle CLIプロセスを起動してPDFを生成"""
+        
         # Vivliostyle CLIコマンド
         cmd = [
             "vivliostyle",
@@ -0,0 +1,311 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RenderWorkerError(RuntimeError):
+    """レンダリングワーカー自体の異常（起動失敗・異常終了・プロトコル不整合）"""
+
+
+class RenderWorker:
+    """常駐Nodeプロセス（render-worker.js）1つ分のワーカー
+
+    ワーカーは起動時にChromiumを1回だけ起動し、プロセスが終了するまで全ジョブで使い回す。
+    ブラウザを起動できなかった場合はCLIのbuild API（ブラウザはジョブごとに起動）で生成する（renderer="cli"）。
+    """
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.jobs_done = 0
+        self.started_at = 0.0
+        self.last_used_at = 0.0
+        self.renderer: Optional[str] = None
+
+    def is_alive(self) -> bool:
+        """プロセスが生存しているか"""
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> None:
+        """ワーカープロセスを起動し、readyを待つ"""
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                "node",
+                str(settings.RENDER_WORKER_SCRIPT),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                cwd=str(settings.PROJECT_ROOT),
+                env={
+                    **os.environ,
+                    "RENDER_WORKER_REUSE_BROWSER": "true" if settings.RENDER_WORKER_REUSE_BROWSER else "false"
+                }
+            )
+        except OSError as e:
+            raise RenderWorkerError(f"レンダリングワーカーを起動できません: {str(e)}")
+
+        try:
+            message = await asyncio.wait_for(
+                self._read_message(),
+                timeout=settings.RENDER_WORKER_STARTUP_TIMEOUT
+            )
+        except (asyncio.TimeoutError, RenderWorkerError) as e:
+            await self.stop()
+            raise RenderWorkerError(f"レンダリングワーカー{self.worker_id}の起動に失敗しました: {str(e)}")
+
+        if message.get("type") != "ready":
+            await self.stop()
+            raise RenderWorkerError(f"レンダリングワーカー{self.worker_id}から不正な応答: {message}")
+
+        self.started_at = self.last_used_at = time.monotonic()
+        self.renderer = message.get("renderer", "cli")
+        logger.info(
+            f"レンダリングワーカー起動: id={self.worker_id}, pid={self.process.pid}, renderer={self.renderer}"
+        )
+        if settings.RENDER_WORKER_REUSE_BROWSER and self.renderer != "browser":
+            logger.warning(f"レンダリングワーカー{self.worker_id}はブラウザを常駐できず、ジョブごとに起動します")
+
+    async def stop(self) -> None:
+        """ワーカープロセスを停止"""
+        if not self.is_alive():
+            return
+        try:
+            self.process.stdin.close()
+            await asyncio.wait_for(self.process.wait(), timeout=5)
+        except (asyncio.TimeoutError, OSError):
+            self.process.kill()
+            await self.process.wait()
+        logger.info(f"レンダリングワーカー停止: id={self.worker_id}, jobs={self.jobs_done}")
+
+    async def _read_message(self) -> Dict[str, Any]:
+        """標準出力から1件のJSONメッセージを読む（JSON以外の行は読み飛ばす）"""
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                raise RenderWorkerError(f"レンダリングワーカー{self.worker_id}が終了しました")
+            try:
+                return json.loads(line)
+            except ValueError:
+                logger.debug(f"ワーカー出力（非JSON）: {line.decode(errors='replace').strip()}")
+
+    async def _request(self, job: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """ジョブを送信し、同じIDの応答を待つ（タイムアウト時はプロセスを破棄）"""
+        if not self.is_alive():
+            raise RenderWorkerError(f"レンダリングワーカー{self.worker_id}は停止しています")
+
+        job_id = uuid.uuid4().hex
+        self.process.stdin.write((json.dumps({"id": job_id, **job}) + "\n").encode("utf-8"))
+
+        async def wait_response() -> Dict[str, Any]:
+            await self.process.stdin.drain()
+            while True:
+                message = await self._read_message()
+                if message.get("id") == job_id:
+                    return message
+
+        try:
+            return await asyncio.wait_for(wait_response(), timeout=timeout)
+        except asyncio.TimeoutError:
+            # 処理中のジョブを中断できないためプロセスごと破棄する
+            self.process.kill()
+            await self.process.wait()
+            raise
+        except (ConnectionError, OSError) as e:
+            raise RenderWorkerError(f"レンダリングワーカー{self.worker_id}との通信に失敗しました: {str(e)}")
+        finally:
+            self.last_used_at = time.monotonic()
+
+    async def ping(self) -> bool:
+        """ヘルスチェック（ブラウザを常駐している場合はその接続も確認）"""
+        try:
+            response = await self._request(
+                {"type": "ping"},
+                timeout=settings.RENDER_WORKER_HEALTH_TIMEOUT
+            )
+            return bool(response.get("ok"))
+        except (asyncio.TimeoutError, RenderWorkerError):
+            return False
+
+    async def render(self, html_file: Path, output_file: Path, options: Dict[str, Any]) -> None:
+        """HTMLファイルからPDFを生成"""
+        timeout = options.get("timeout", settings.VIVLIOSTYLE_TIMEOUT)
+        job = {
+            "type": "build",
+            "input": str(html_file),
+            "output": str(output_file),
+            "format": options.get("format", settings.VIVLIOSTYLE_OUTPUT_FORMAT),
+            "size": options.get("size", "A4"),
+            "singleDoc": options.get("single_doc", True),
+            "timeout": timeout * 1000
+        }
+        response = await self._request(job, timeout=timeout)
+        self.jobs_done += 1
+
+        if not response.get("ok"):
+            raise RuntimeError(f"Vivliostyle CLIエラー: {response.get('error', 'Unknown error')}")
+
+
+class RenderPool:
+    """常駐レンダリングワーカー（Nodeプロセス）のプール
+
+    起動済みのワーカーを待ち行列（asyncio.Queue）で管理し、リクエスト間で再利用する。
+    各ワーカーはNodeプロセスと起動済みのブラウザを保持し、ジョブごとにはタブを開くだけで描画する。
+    一定時間使われていないワーカーは取得時にpingで生存確認し（ブラウザが落ちていれば再起動）、
+    RENDER_WORKER_MAX_JOBS件処理したワーカーはブラウザごとバックグラウンドで入れ替える。
+    """
+
+    def __init__(self, size: Optional[int] = None, max_jobs_per_worker: Optional[int] = None):
+        self.size = settings.RENDER_POOL_SIZE if size is None else size
+        self.max_jobs_per_worker = (
+            settings.RENDER_WORKER_MAX_JOBS if max_jobs_per_worker is None else max_jobs_per_worker
+        )
+        self._idle: Optional[asyncio.Queue] = None
+        self._next_worker_id = 0
+        self._running = False
+        self._waiting = 0
+        self.stats = {"jobs": 0, "failures": 0, "recycled": 0, "restarted": 0}
+
+    @property
+    def is_running(self) -> bool:
+        """プールが稼働中か"""
+        return self._running
+
+    async def start(self) -> None:
+        """ワーカーを起動してプールを開始（起動できない場合はプール無効のまま）"""
+        if self._running or self.size <= 0:
+            return
+
+        self._idle = asyncio.Queue()
+        workers = []
+        try:
+            for _ in range(self.size):
+                workers.append(await self._spawn())
+        except RenderWorkerError as e:
+            logger.warning(f"レンダリングワーカープールを無効化します（CLIで生成）: {str(e)}")
+            for worker in workers:
+                await worker.stop()
+            self._idle = None
+            return
+
+        for worker in workers:
+            self._idle.put_nowait(worker)
+        self._running = True
+        logger.info(f"レンダリングワーカープール開始: size={self.size}")
+
+    async def stop(self) -> None:
+        """全ワーカーを停止"""
+        if not self._running:
+            return
+        self._running = False
+        while not self._idle.empty():
+            await self._idle.get_nowait().stop()
+        logger.info("レンダリングワーカープール停止")
+
+    async def _spawn(self) -> RenderWorker:
+        """新しいワーカーを起動"""
+        worker = RenderWorker(self._next_worker_id)
+        self._next_worker_id += 1
+        await worker.start()
+        return worker
+
+    async def _replace(self, worker: RenderWorker) -> RenderWorker:
+        """ワーカーを停止して新しいワーカーに差し替える"""
+        await worker.stop()
+        return await self._spawn()
+
+    async def _acquire(self) -> RenderWorker:
+        """空きワーカーを取得（必要に応じてヘルスチェック・再起動）"""
+        self._waiting += 1
+        try:
+            worker = await asyncio.wait_for(
+                self._idle.get(),
+                timeout=settings.RENDER_POOL_ACQUIRE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            raise RenderWorkerError("空きレンダリングワーカーの待機がタイムアウトしました")
+        finally:
+            self._waiting -= 1
+
+        idle_seconds = time.monotonic() - worker.last_used_at
+        healthy = worker.is_alive()
+        if healthy and idle_seconds >= settings.RENDER_WORKER_HEALTH_INTERVAL:
+            healthy = await worker.ping()
+
+        if not healthy:
+            logger.warning(f"レンダリングワーカー{worker.worker_id}が応答しないため再起動します")
+            try:
+                worker = await self._replace(worker)
+            except RenderWorkerError:
+                # 枠を失わないよう停止済みワーカーを戻し、次回取得時に再起動を試みる
+                self._idle.put_nowait(worker)
+                raise
+            self.stats["restarted"] += 1
+
+        return worker
+
+    def _release(self, worker: RenderWorker) -> None:
+        """ワーカーをプールに戻す（上限件数に達したものは入れ替え）"""
+        if not self._running:
+            asyncio.ensure_future(worker.stop())
+            return
+        if worker.is_alive() and worker.jobs_done >= self.max_jobs_per_worker:
+            asyncio.ensure_future(self._recycle(worker))
+            return
+        self._idle.put_nowait(worker)
+
+    async def _recycle(self, worker: RenderWorker) -> None:
+        """ワーカーをバックグラウンドで入れ替えてプールに戻す"""
+        try:
+            worker = await self._replace(worker)
+            self.stats["recycled"] += 1
+        except RenderWorkerError as e:
+            logger.warning(f"レンダリングワーカーの入れ替えに失敗しました: {str(e)}")
+        self._idle.put_nowait(worker)
+
+    async def render(self, html_file: Path, output_file: Path, options: Dict[str, Any] = None) -> None:
+        """プール内のワーカーでPDFを生成
+
+        Raises:
+            RenderWorkerError: ワーカーが利用できない場合（呼び出し側でCLIにフォールバック可能）
+            RuntimeError: PDF生成自体に失敗した場合
+        """
+        if not self._running:
+            raise RenderWorkerError("レンダリングワーカープールは停止しています")
+
+        options = options or {}
+        worker = await self._acquire()
+        try:
+            await worker.render(html_file, output_file, options)
+            self.stats["jobs"] += 1
+        except asyncio.TimeoutError:
+            self.stats["failures"] += 1
+            timeout = options.get("timeout", settings.VIVLIOSTYLE_TIMEOUT)
+            raise RuntimeError(f"Vivliostyle CLIがタイムアウトしました（{timeout}秒）")
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        finally:
+            self._release(worker)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """プールの状態を取得"""
+        return {
+            "running": self._running,
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle else 0,
+            "waiting": self._waiting,
+            "max_jobs_per_worker": self.max_jobs_per_worker,
+            **self.stats
+        }
+
+
+# プールインスタンス
+render_pool = RenderPool()
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerRejected(Exception):
+    """受付拒否（HTTPステータスとRetry-After秒数を保持）"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Waiter:
+    """待ち行列のエントリ"""
+    priority: int
+    template_id: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    def effective_priority(self, now: float) -> float:
+        """待ち時間に応じて優先度を引き上げる（見開きページの飢餓防止）"""
+        return self.priority - (now - self.enqueued_at) / settings.RENDER_PRIORITY_AGING_SECONDS
+
+
+class RenderScheduler:
+    """PDF生成の同時実行数制御とアドミッションコントロール
+
+    同時実行はmax_in_flight件まで。超過分は最大max_queue件まで待ち行列に入れ、
+    テンプレートカテゴリの優先度（settings.TEMPLATE_PRIORITIES）順に実行枠を渡す。
+    待ち行列が満杯なら429、推定待ち時間が上限を超える・停止中なら503で拒否する。
+    """
+
+    def __init__(self, max_in_flight: Optional[int] = None, max_queue: Optional[int] = None):
+        self.max_in_flight = settings.RENDER_MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+        self.max_queue = settings.RENDER_MAX_QUEUE if max_queue is None else max_queue
+        self.in_flight = 0
+        self.avg_duration = settings.RENDER_ESTIMATED_SECONDS
+        self._waiters: List[_Waiter] = []
+        self._closed = False
+        self.stats = {"completed": 0, "rejected_429": 0, "rejected_503": 0, "queue_timeouts": 0}
+
+    def estimate_wait(self, queue_depth: Optional[int] = None) -> float:
+        """待ち行列の深さから推定待ち時間（秒）を計算"""
+        if queue_depth is None:
+            queue_depth = len(self._waiters)
+        return (queue_depth + 1) * self.avg_duration / max(self.max_in_flight, 1)
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.estimate_wait()))
+
+    def _reject(self, message: str, status_code: int) -> SchedulerRejected:
+        self.stats[f"rejected_{status_code}"] += 1
+        logger.warning(f"PDF生成リクエストを拒否: {message}（in_flight={self.in_flight}, queued={len(self._waiters)}）")
+        return SchedulerRejected(message, status_code, self._retry_after())
+
+    async def acquire(self, template_id: str) -> None:
+        """実行枠を取得（必要に応じて待機）"""
+        if self._closed:
+            raise self._reject("サーバーが停止処理中です", 503)
+
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("PDF生成の待ち行列が満杯です", 429)
+
+        if self.estimate_wait() > settings.RENDER_QUEUE_MAX_WAIT:
+            raise self._reject("PDF生成の推定待ち時間が上限を超えています", 503)
+
+        waiter = _Waiter(
+            priority=settings.get_template_priority(template_id),
+            template_id=template_id,
+            future=asyncio.get_running_loop().create_future()
+        )
+        self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=settings.RENDER_QUEUE_MAX_WAIT)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # 枠が渡された直後にキャンセルされた場合は枠を返却
+                self.release()
+            else:
+                waiter.future.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["queue_timeouts"] += 1
+                raise self._reject("PDF生成の待機がタイムアウトしました", 503)
+            raise
+
+    def release(self, duration: Optional[float] = None) -> None:
+        """実行枠を返却し、最も優先度の高い待機者に渡す"""
+        self.in_flight -= 1
+        if duration is not None:
+            self.stats["completed"] += 1
+            self.avg_duration = self.avg_duration * 0.8 + duration * 0.2
+
+        while self._waiters and self.in_flight < self.max_in_flight:
+            now = time.monotonic()
+            waiter = min(self._waiters, key=lambda w: (w.effective_priority(now), w.enqueued_at))
+            self._waiters.remove(waiter)
+            if waiter.future.done():
+                continue
+            self.in_flight += 1
+            waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, template_id: str):
+        """実行枠を確保して処理するコンテキストマネージャ"""
+        await self.acquire(template_id)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def close(self) -> None:
+        """新規受付を停止し、待機中のリクエストを503で終了させる"""
+        self._closed = True
+        for waiter in self._waiters:
+            if not waiter.future.done():
+                waiter.future.set_exception(self._reject("サーバーが停止処理中です", 503))
+        self._waiters.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """スケジューラの状態を取得"""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "max_queue": self.max_queue,
+            "queued": len(self._waiters),
+            "avg_duration": round(self.avg_duration, 3),
+            "estimated_wait": round(self.estimate_wait(), 3),
+            **self.stats
+        }
+
+
+# スケジューラインスタンス
+render_scheduler = RenderScheduler()
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+from datetime import datetime
 
 class Payload(BaseModel):
     """PDF生成用のペイロード"""
@@ -17,12 +18,37 @@ class GenerateRequest(BaseModel):
     template_id: str = Field(..., description="テンプレートID")
     payload: Payload = Field(..., description="生成データ")
 
+class BatchPage(BaseModel):
+    """バッチ生成の1ページ分"""
+    template_id: str = Field(..., description="テンプレートID")
+    payload: Payload = Field(..., description="生成データ")
+
+class BatchGenerateRequest(BaseModel):
+    """複数ページを1つのPDFにまとめる生成リクエスト"""
+    pages: List[BatchPage] = Field(..., min_length=1, description="ページ順に並べたテンプレートIDと生成データのリスト")
+
 class GenerateResponse(BaseModel):
     """PDF生成レスポンス"""
     message: str = Field(..., description="レスポンスメッセージ")
     template_id: str = Field(..., description="使用したテンプレートID")
     file_size: Optional[int] = Field(None, description="生成されたPDFのファイルサイズ")
 
+class JobInfo(BaseModel):
+    """非同期PDF生成ジョブ情報"""
+    job_id: str = Field(..., description="ジョブID")
+    status: str = Field(..., description="ジョブ状態（queued/running/succeeded/failed）")
+    template_id: str = Field(..., description="テンプレートID")
+    created_at: datetime = Field(..., description="受付日時")
+    started_at: Optional[datetime] = Field(None, description="処理開始日時")
+    finished_at: Optional[datetime] = Field(None, description="処理終了日時")
+    attempts: int = Field(0, description="実行回数")
+    error: Optional[str] = Field(None, description="失敗時のエラーメッセージ")
+    file_size: Optional[int] = Field(None, description="生成されたPDFのファイルサイズ")
+
+class JobRecord(JobInfo):
+    """永続化用のジョブレコード（リクエスト内容を含む）"""
+    payload: Payload = Field(..., description="生成データ")
+
 class TemplateInfo(BaseModel):
     """テンプレート情報"""
     id: str = Field(..., description="テンプレートID")
@@ -36,4 +62,11 @@ class HealthResponse(BaseModel):
     status: str = Field(..., description="システム状態")
     vivliostyle_cli: str = Field(..., description="Vivliostyle CLIの状態")
     vivliostyle_version: Optional[str] = Field(None, description="Vivliostyle CLIのバージョン")
+    render_pool: Optional[Dict[str, Any]] = Field(None, description="常駐レンダリングワーカープールの状態")
+    render_scheduler: Optional[Dict[str, Any]] = Field(None, description="レンダリングスケジューラの状態")
+    pdf_cache: Optional[Dict[str, Any]] = Field(None, description="生成済みPDFキャッシュの状態")
+    templates: Optional[Dict[str, Any]] = Field(None, description="テンプレートレジストリの状態")
+    image_staging: Optional[Dict[str, Any]] = Field(None, description="画像ステージングの累計")
+    image_pipeline: Optional[Dict[str, Any]] = Field(None, description="画像縮小パイプラインの状態")
+    job_queue_depth: Optional[int] = Field(None, description="待機中の非同期ジョブ数")
     error: Optional[str] = Field(None, description="エラーメッセージ") 
\ No newline at end of file
@@ -43,6 +43,72 @@ class Settings:
     # Vivliostyle CLI設定
     VIVLIOSTYLE_TIMEOUT = int(os.getenv("VIVLIOSTYLE_TIMEOUT", "30"))
     VIVLIOSTYLE_OUTPUT_FORMAT = os.getenv("VIVLIOSTYLE_OUTPUT_FORMAT", "pdf")
+
+    # 常駐レンダリングワーカープール設定（0でプール無効・毎回CLI起動）
+    RENDER_WORKER_SCRIPT = PROJECT_ROOT / "render-worker.js"
+    RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", "2"))
+    RENDER_WORKER_MAX_JOBS = int(os.getenv("RENDER_WORKER_MAX_JOBS", "50"))
+    RENDER_WORKER_REUSE_BROWSER = os.getenv("RENDER_WORKER_REUSE_BROWSER", "true").lower() == "true"
+    RENDER_WORKER_STARTUP_TIMEOUT = int(os.getenv("RENDER_WORKER_STARTUP_TIMEOUT", "30"))
+    RENDER_WORKER_HEALTH_INTERVAL = int(os.getenv("RENDER_WORKER_HEALTH_INTERVAL", "30"))
+    RENDER_WORKER_HEALTH_TIMEOUT = int(os.getenv("RENDER_WORKER_HEALTH_TIMEOUT", "5"))
+    RENDER_POOL_ACQUIRE_TIMEOUT = int(os.getenv("RENDER_POOL_ACQUIRE_TIMEOUT", "60"))
+
+    # レンダリングスケジューラ設定（同時実行数・待ち行列・優先度）
+    RENDER_MAX_IN_FLIGHT = int(os.getenv("RENDER_MAX_IN_FLIGHT", "2"))
+    RENDER_MAX_QUEUE = int(os.getenv("RENDER_MAX_QUEUE", "20"))
+    RENDER_QUEUE_MAX_WAIT = int(os.getenv("RENDER_QUEUE_MAX_WAIT", "60"))
+    RENDER_ESTIMATED_SECONDS = float(os.getenv("RENDER_ESTIMATED_SECONDS", "5"))
+    RENDER_PRIORITY_AGING_SECONDS = float(os.getenv("RENDER_PRIORITY_AGING_SECONDS", "10"))
+    
+    # カテゴリごとの優先度（小さいほど先に処理。片面ページを見開きより優先）
+    TEMPLATE_PRIORITIES = {
+        "single": 0,
+        "title": 1,
+        "spread": 2
+    }
+
+    # テンプレートファイルの変更を確認する間隔（秒、0で監視しない）
+    TEMPLATE_WATCH_INTERVAL = float(os.getenv("TEMPLATE_WATCH_INTERVAL", "0"))
+
+    # バッチ生成の最大ページ数
+    BATCH_MAX_PAGES = int(os.getenv("BATCH_MAX_PAGES", "40"))
+    
+    # 生成済みPDFキャッシュ設定
+    PDF_CACHE_ENABLED = os.getenv("PDF_CACHE_ENABLED", "true").lower() == "true"
+    PDF_CACHE_DIR = Path(os.getenv("PDF_CACHE_DIR", str(PROJECT_ROOT / "cache" / "pdf")))
+    PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # 512MB
+    
+    # 非同期ジョブ設定
+    JOBS_DIR = Path(os.getenv("JOBS_DIR", str(PROJECT_ROOT / "jobs")))
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_MAX_SCHEDULER_RETRIES = int(os.getenv("JOB_MAX_SCHEDULER_RETRIES", "20"))  # 混雑で拒否された際の再試行回数
+    JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(24 * 60 * 60)))  # 24時間
+    
+    # 画像の縮小・再エンコード設定（print: 300dpiのプログレッシブJPEG / screen: 150dpiのWebP）
+    IMAGE_PIPELINE_ENABLED = os.getenv("IMAGE_PIPELINE_ENABLED", "true").lower() == "true"
+    IMAGE_PROFILE = os.getenv("IMAGE_PROFILE", "print")
+    IMAGE_PROFILES = {
+        "print": {"dpi": 300, "quality": 90, "format": "JPEG"},
+        "screen": {"dpi": 150, "quality": 80, "format": "WEBP"}
+    }
+    IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", str(PROJECT_ROOT / "cache" / "images")))
+    IMAGE_CACHE_RETENTION_SECONDS = int(os.getenv("IMAGE_CACHE_RETENTION_SECONDS", str(7 * 24 * 60 * 60)))  # 7日
+    
+    # テンプレートごとの画像枠（幅mm, 高さmm）。images[i] にはi番目（超える分は最後）の枠を使う
+    DEFAULT_IMAGE_SLOT = (210, 297)  # A4全面
+    TEMPLATE_IMAGE_SLOTS = {
+        "title/title-page": [(210, 297)],
+        "spread/quote-spread": [(170, 178)],
+        "single/image-text-single": [(170, 180)],
+        "single/text-wrap-image-single": [(140, 95)]
+    }
+    
+    # 画像を一時ディレクトリに配置する方法（先頭から順に試し、最後はコピー）
+    IMAGE_STAGING_METHODS = [
+        m.strip() for m in os.getenv("IMAGE_STAGING_METHODS", "hardlink,reflink,copy").split(",") if m.strip()
+    ]
     
     # セキュリティ設定
     MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_SIZE", "10485760"))  # 10MB
@@ -66,6 +132,20 @@ class Settings:
         """テンプレートIDが許可されているかチェック"""
         return template_id in cls.ALLOWED_TEMPLATE_IDS
     
+    @classmethod
+    def get_template_priority(cls, template_id: str) -> int:
+        """テンプレートIDのカテゴリから処理優先度を取得"""
+        category = template_id.split("/", 1)[0]
+        return cls.TEMPLATE_PRIORITIES.get(category, max(cls.TEMPLATE_PRIORITIES.values()))
+    
+    @classmethod
+    def get_image_slot(cls, template_id: str, index: int) -> tuple:
+        """テンプレートのindex番目の画像枠（幅mm, 高さmm）を取得"""
+        slots = cls.TEMPLATE_IMAGE_SLOTS.get(template_id)
+        if not slots:
+            return cls.DEFAULT_IMAGE_SLOT
+        return slots[min(index, len(slots) - 1)]
+    
     @classmethod
     def get_available_templates(cls) -> List[str]:
         """利用可能なテンプレート一覧を取得"""
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from jinja2 import Environment, FileSystemLoader, Template
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TemplateEntry:
+    """コンパイル済みテンプレートとCSS"""
+    template_id: str
+    template: Template
+    css_content: str
+    # テンプレートディレクトリ内のファイル（名前, 更新時刻）。変更検知とPDFキャッシュキーに使う
+    fingerprint: Tuple[Tuple[str, int], ...]
+
+
+class TemplateRegistry:
+    """コンパイル済みテンプレートのレジストリ
+
+    起動時に settings.ALLOWED_TEMPLATE_IDS の全テンプレートをコンパイルし、style.css と共にメモリに保持する。
+    リクエスト時にはファイルシステムを参照しない。ファイル変更はウォッチャー（TEMPLATE_WATCH_INTERVAL秒ごとの
+    更新時刻の確認）で検知して再読み込みする。
+    """
+
+    def __init__(self, templates_dir: Optional[Path] = None, watch_interval: Optional[float] = None):
+        self.templates_dir = Path(templates_dir or settings.TEMPLATES_DIR)
+        self.watch_interval = settings.TEMPLATE_WATCH_INTERVAL if watch_interval is None else watch_interval
+        self.jinja_env = Environment(
+            loader=FileSystemLoader(str(self.templates_dir)),
+            autoescape=True,
+            auto_reload=False
+        )
+        self._entries: Dict[str, TemplateEntry] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0}
+
+    def _fingerprint(self, template_id: str) -> Tuple[Tuple[str, int], ...]:
+        template_path = self.templates_dir / template_id
+        if not template_path.exists():
+            return ()
+        return tuple(sorted(
+            (p.name, p.stat().st_mtime_ns)
+            for p in template_path.iterdir()
+            if p.is_file()
+        ))
+
+    def _load(self, template_id: str) -> TemplateEntry:
+        """テンプレートとCSSを読み込んでコンパイル"""
+        template_path = self.templates_dir / template_id
+        html_file = template_path / "template.html"
+        css_file = template_path / "style.css"
+
+        if not html_file.exists():
+            raise ValueError(f"HTMLテンプレートが見つかりません: {html_file}")
+
+        fingerprint = self._fingerprint(template_id)
+        source = html_file.read_text(encoding="utf-8")
+        css_content = css_file.read_text(encoding="utf-8") if css_file.exists() else ""
+
+        entry = TemplateEntry(
+            template_id=template_id,
+            template=self.jinja_env.from_string(source),
+            css_content=css_content,
+            fingerprint=fingerprint
+        )
+        self._entries[template_id] = entry
+        return entry
+
+    def preload(self) -> int:
+        """許可されている全テンプレートを読み込む"""
+        loaded = 0
+        failed = []
+        for template_id in settings.ALLOWED_TEMPLATE_IDS:
+            try:
+                self._load(template_id)
+                loaded += 1
+            except Exception as e:
+                logger.debug(f"テンプレートを事前読み込みできません: {template_id}, {str(e)}")
+                failed.append(template_id)
+        logger.info(f"テンプレート事前読み込み: {loaded}/{len(settings.ALLOWED_TEMPLATE_IDS)}件")
+        if failed:
+            logger.warning(f"読み込めなかったテンプレート: {', '.join(failed)}")
+        return loaded
+
+    def get(self, template_id: str) -> TemplateEntry:
+        """コンパイル済みテンプレートを取得（未読み込みならその場で読み込む）"""
+        entry = self._entries.get(template_id)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry
+        self.stats["misses"] += 1
+        return self._load(template_id)
+
+    def get_fingerprint(self, template_id: str) -> Tuple[Tuple[str, int], ...]:
+        """テンプレートファイルの（名前, 更新時刻）一覧（読み込み済みならメモリから返す）"""
+        entry = self._entries.get(template_id)
+        if entry is not None:
+            return entry.fingerprint
+        return self._fingerprint(template_id)
+
+    def invalidate(self, template_id: Optional[str] = None) -> None:
+        """読み込み済みテンプレートを破棄（template_id省略時は全件）"""
+        if template_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(template_id, None)
+
+    def check_for_changes(self) -> List[str]:
+        """ファイルが更新されたテンプレートを再読み込みし、そのIDを返す"""
+        changed = []
+        for template_id, entry in list(self._entries.items()):
+            if self._fingerprint(template_id) == entry.fingerprint:
+                continue
+            try:
+                self._load(template_id)
+            except Exception as e:
+                # 読み込めない状態（編集途中など）なら破棄し、次の利用時に再読み込みする
+                logger.warning(f"テンプレートを再読み込みできません: {template_id}, {str(e)}")
+                self.invalidate(template_id)
+            self.stats["reloads"] += 1
+            changed.append(template_id)
+            logger.info(f"テンプレート更新を検知: {template_id}")
+        return changed
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            try:
+                await asyncio.to_thread(self.check_for_changes)
+            except Exception as e:
+                logger.error(f"テンプレート監視エラー: {str(e)}")
+
+    async def start(self) -> None:
+        """事前読み込みを行い、設定されていればウォッチャーを起動"""
+        await asyncio.to_thread(self.preload)
+        if self.watch_interval > 0:
+            self._watch_task = asyncio.create_task(self._watch())
+            logger.info(f"テンプレート監視開始: {self.watch_interval}秒間隔")
+
+    async def stop(self) -> None:
+        """ウォッチャーを停止"""
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """レジストリの状態を取得"""
+        return {
+            "loaded": len(self._entries),
+            "watching": self._watch_task is not None,
+            **self.stats
+        }
+
+
+# テンプレートレジストリインスタンス
+template_registry = TemplateRegistry()
@@ -0,0 +1,284 @@
+#!/usr/bin/env node
+
+/**
+ * Vivliostyle常駐レンダリングワーカー（Nodeプロセス）
+ * PDFService（app/render_pool.py）から起動され、標準入力で受け取ったジョブを処理します。
+ *
+ * 起動時にChromium（Puppeteer）を1回だけ起動し、ワーカーが終了するまで全ジョブで使い回します。
+ * ジョブごとに新しいタブで Vivliostyle Viewer にHTMLを読み込み、組版の完了を待って印刷します。
+ * ブラウザが落ちた場合はワーカーごと終了し、Python側のヘルスチェックで再起動されます。
+ * Puppeteer・Viewerが読み込めない場合や RENDER_WORKER_REUSE_BROWSER=false の場合は、
+ * 従来どおり @vivliostyle/cli の build API（ブラウザはジョブごとに起動）で生成します。
+ *
+ * プロトコル（1行1JSON）:
+ *   入力:  {"id": "...", "type": "ping"}
+ *          {"id": "...", "type": "build", "input": "...", "output": "...",
+ *           "format": "pdf", "size": "A4", "singleDoc": true, "timeout": 30000}
+ *   出力:  {"type": "ready", "renderer": "browser" | "cli"}  （起動完了時に1回）
+ *          {"id": "...", "ok": true} / {"id": "...", "ok": false, "error": "..."}
+ */
+
+const readline = require('readline');
+const path = require('path');
+const fs = require('fs');
+const http = require('http');
+const crypto = require('crypto');
+
+const REUSE_BROWSER = process.env.RENDER_WORKER_REUSE_BROWSER !== 'false';
+const PAGE_STYLE = '__page-size.css';
+const CONTENT_TYPES = {
+  '.html': 'text/html; charset=utf-8',
+  '.css': 'text/css; charset=utf-8',
+  '.js': 'application/javascript; charset=utf-8',
+  '.json': 'application/json; charset=utf-8',
+  '.svg': 'image/svg+xml',
+  '.png': 'image/png',
+  '.jpg': 'image/jpeg',
+  '.jpeg': 'image/jpeg',
+  '.gif': 'image/gif',
+  '.webp': 'image/webp',
+  '.woff': 'font/woff',
+  '.woff2': 'font/woff2',
+  '.ttf': 'font/ttf',
+  '.otf': 'font/otf',
+};
+
+let vivliostyle = null;  // @vivliostyle/cli（ブラウザを使い回せない場合に使用）
+let browser = null;      // 起動時に1回だけ起動し、全ジョブで使い回すChromium
+let baseUrl = null;      // Viewerと入力HTMLを配信するローカルサーバーのURL
+let viewerRoot = null;
+let closing = false;
+const mounts = new Map();  // ジョブごとのトークン -> { root, size }
+
+function send(message) {
+  process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+function resolveViewerRoot() {
+  let packageDir;
+  try {
+    packageDir = path.dirname(require.resolve('@vivliostyle/viewer/package.json', { paths: [__dirname] }));
+  } catch (error) {
+    packageDir = path.join(__dirname, 'node_modules', '@vivliostyle', 'viewer');
+  }
+  const root = path.join(packageDir, 'lib');
+  if (!fs.existsSync(path.join(root, 'index.html'))) {
+    throw new Error(`Vivliostyle Viewerが見つかりません: ${root}`);
+  }
+  return root;
+}
+
+function sendFile(res, root, segments) {
+  const filePath = path.resolve(root, ...segments);
+  if (filePath !== root && !filePath.startsWith(root + path.sep)) {
+    res.writeHead(403);
+    res.end();
+    return;
+  }
+  fs.readFile(filePath, (error, data) => {
+    if (error) {
+      res.writeHead(404);
+      res.end();
+      return;
+    }
+    const type = CONTENT_TYPES[path.extname(filePath).toLowerCase()] || 'application/octet-stream';
+    res.writeHead(200, { 'Content-Type': type, 'Cache-Control': 'no-store' });
+    res.end(data);
+  });
+}
+
+/**
+ * /viewer/... は Vivliostyle Viewer、/jobs/<トークン>/... は処理中のジョブの入力ディレクトリを返す
+ * （file:// から読み込むとViewerが同じディレクトリの画像・CSSを取得できないため）
+ */
+function handleRequest(req, res) {
+  let segments;
+  try {
+    segments = new URL(req.url, baseUrl).pathname.split('/').filter(Boolean).map(decodeURIComponent);
+  } catch (error) {
+    res.writeHead(400);
+    res.end();
+    return;
+  }
+
+  if (segments[0] === 'viewer') {
+    sendFile(res, viewerRoot, segments.slice(1));
+    return;
+  }
+  const mount = segments[0] === 'jobs' ? mounts.get(segments[1]) : undefined;
+  if (!mount) {
+    res.writeHead(404);
+    res.end();
+    return;
+  }
+  if (segments.length === 3 && segments[2] === PAGE_STYLE) {
+    // 文書側の @page の指定が優先されるよう、用紙サイズは作者スタイルの先頭に入れる
+    res.writeHead(200, { 'Content-Type': 'text/css; charset=utf-8', 'Cache-Control': 'no-store' });
+    res.end(`@page { size: ${mount.size}; }`);
+    return;
+  }
+  sendFile(res, mount.root, segments.slice(2));
+}
+
+async function startBrowser() {
+  const puppeteer = require('puppeteer');
+  viewerRoot = resolveViewerRoot();
+
+  const server = http.createServer(handleRequest);
+  await new Promise((resolve, reject) => {
+    server.once('error', reject);
+    server.listen(0, '127.0.0.1', resolve);
+  });
+  server.unref();
+  baseUrl = `http://127.0.0.1:${server.address().port}`;
+
+  // pipe接続にしておくと、ワーカーがkillされてもChromiumはパイプの切断で終了する
+  browser = await puppeteer.launch({
+    headless: true,
+    pipe: true,
+    args: ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage'],
+  });
+  browser.on('disconnected', () => {
+    if (!closing) {
+      console.error('❌ ブラウザとの接続が切れたためレンダリングワーカーを終了します');
+      process.exit(1);
+    }
+  });
+}
+
+async function renderWithBrowser(job) {
+  const timeout = job.timeout || 30000;
+  const token = crypto.randomUUID();
+  mounts.set(token, { root: path.dirname(path.resolve(job.input)), size: job.size || 'A4' });
+
+  const page = await browser.newPage();
+  const pageErrors = [];
+  page.on('pageerror', (error) => pageErrors.push(error.message));
+  try {
+    const jobUrl = `${baseUrl}/jobs/${token}`;
+    const params = [
+      `src=${encodeURIComponent(`${jobUrl}/${encodeURIComponent(path.basename(job.input))}`)}`,
+      `style=${encodeURIComponent(`${jobUrl}/${PAGE_STYLE}`)}`,
+      'bookMode=false',
+      'renderAllPages=true',
+    ];
+    await page.goto(`${baseUrl}/viewer/index.html#${params.join('&')}`, {
+      waitUntil: 'domcontentloaded',
+      timeout,
+    });
+    try {
+      await page.waitForFunction(
+        () => window.coreViewer && window.coreViewer.readyState === 'complete',
+        { timeout, polling: 100 }
+      );
+    } catch (error) {
+      const detail = pageErrors.length ? `: ${pageErrors.join(' / ')}` : '';
+      throw new Error(`組版が完了しませんでした（${error.message}）${detail}`);
+    }
+    await page.pdf({
+      path: job.output,
+      printBackground: true,
+      preferCSSPageSize: true,
+      timeout,
+    });
+  } finally {
+    mounts.delete(token);
+    await page.close().catch(() => {});
+  }
+}
+
+async function buildWithCli(job) {
+  if (!vivliostyle) {
+    vivliostyle = await import('@vivliostyle/cli');
+  }
+  await vivliostyle.build({
+    input: job.input,
+    targets: [{ path: job.output, format: job.format || 'pdf' }],
+    size: job.size || 'A4',
+    singleDoc: job.singleDoc !== false,
+    timeout: job.timeout || 30000,
+    logLevel: 'silent',
+  });
+}
+
+async function handleBuild(job) {
+  const started = Date.now();
+  if (browser && (job.format || 'pdf') === 'pdf') {
+    await renderWithBrowser(job);
+  } else {
+    await buildWithCli(job);
+  }
+  return { elapsedMs: Date.now() - started };
+}
+
+async function handleJob(job) {
+  try {
+    if (job.type === 'ping') {
+      // ブラウザを使っている場合は接続が生きているかも確認する
+      const healthy = !browser || browser.isConnected();
+      send({ id: job.id, ok: healthy, ...(healthy ? {} : { error: 'browser disconnected' }) });
+      return;
+    }
+    if (job.type === 'build') {
+      const result = await handleBuild(job);
+      send({ id: job.id, ok: true, ...result });
+      return;
+    }
+    send({ id: job.id, ok: false, error: `unknown job type: ${job.type}` });
+  } catch (error) {
+    send({ id: job.id, ok: false, error: error && error.message ? error.message : String(error) });
+  }
+}
+
+async function shutdown() {
+  closing = true;
+  if (browser) {
+    await browser.close().catch(() => {});
+  }
+  process.exit(0);
+}
+
+async function main() {
+  process.chdir(path.join(__dirname));
+
+  if (REUSE_BROWSER) {
+    try {
+      await startBrowser();
+    } catch (error) {
+      console.error('⚠️ ブラウザを常駐できないためCLIで生成します:', error && error.message ? error.message : error);
+      browser = null;
+    }
+  }
+  if (!browser) {
+    // CLIモジュールの読み込みは起動時の1回のみ（以降のジョブで再利用）
+    vivliostyle = await import('@vivliostyle/cli');
+  }
+
+  const rl = readline.createInterface({ input: process.stdin });
+
+  // ジョブは到着順に1件ずつ処理する（並列度はPython側のプールで制御）
+  let chain = Promise.resolve();
+  rl.on('line', (line) => {
+    if (!line.trim()) {
+      return;
+    }
+    let job;
+    try {
+      job = JSON.parse(line);
+    } catch (error) {
+      send({ id: null, ok: false, error: `invalid job: ${error.message}` });
+      return;
+    }
+    chain = chain.then(() => handleJob(job));
+  });
+  rl.on('close', () => {
+    chain.then(shutdown);
+  });
+
+  send({ type: 'ready', renderer: browser ? 'browser' : 'cli' });
+}
+
+main().catch((error) => {
+  console.error('❌ レンダリングワーカーの起動に失敗しました:', error);
+  process.exit(1);
+});
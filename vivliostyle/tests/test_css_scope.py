@@ -0,0 +1,183 @@
+"""
+バッチ生成用のCSSスコープの簡易テスト（ページごとの @page・@keyframes・属性の引き継ぎ）
+"""
+
+import asyncio
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.css_scope import scope_css, split_html_document, wrap_section
+from app.pdf_cache import pdf_cache
+from app.pdf_service import PDFService
+from app.schemas import BatchPage, Payload
+from app.settings import settings
+from app.template_registry import TemplateRegistry
+
+
+def test_scope_css():
+    """セレクタのスコープと、@page・@keyframes の名前の付け替えのテスト"""
+    print("=" * 50)
+    print("CSSスコープテスト")
+    print("=" * 50)
+
+    css = """
+    /* コメントは除去 */
+    body.dark h1, html body > p, :root { color: red; animation: fade 1s ease; }
+    .card:not(.a, .b) { page: cover; page-break-after: always; }
+    @media print {
+        @page { size: A4; margin: 1cm; }
+        .card { margin: 0; }
+    }
+    @page :first { margin: 0; }
+    @page cover { size: A5; }
+    @keyframes fade { from { opacity: 0; } to { opacity: 1; } }
+    @font-face { font-family: Example; src: url(example.woff); }
+    """
+    scoped = scope_css(css, ".p0", namespace="p0")
+    assert "コメント" not in scoped
+    assert ".p0 { page: p0; }" in scoped
+    assert ".p0.dark h1, .p0 > p, .p0 {" in scoped
+    assert "animation: p0-fade 1s ease" in scoped
+    assert ".p0 .card:not(.a, .b) { page: p0-cover; page-break-after: always; }" in scoped
+    assert ".p0 .card { margin: 0; }" in scoped
+    print("✅ セレクタのスコープ（body.dark → .p0.dark）")
+
+    assert "@page p0 { size: A4; margin: 1cm; }" in scoped
+    assert "@page p0:first { margin: 0; }" in scoped
+    assert "@page p0-cover { size: A5; }" in scoped
+    assert "@keyframes p0-fade {" in scoped
+    assert "@font-face { font-family: Example;" in scoped
+    assert not re.search(r"@page\s*[{:]", scoped)
+    print("✅ @page・@keyframes はページごとの名前に付け替え")
+
+    # namespace を省略した場合は従来どおり @page はそのまま
+    assert "@page { size: A4; margin: 1cm; }" in scope_css(css, ".p0")
+    print("✅ namespace なしでは @page を残す")
+
+    print("\n" + "=" * 50)
+    print("✨ CSSスコープテスト完了！")
+    print("=" * 50)
+
+
+def test_split_html_document():
+    """<link> のスタイルシートの埋め込みと <html>/<body> の属性の引き継ぎのテスト"""
+    print("\n" + "=" * 50)
+    print("HTML分割テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_dir = Path(tmp)
+        (base_dir / "print.css").write_text("h1 { font-size: 20pt; }", encoding="utf-8")
+        html = (
+            '<!DOCTYPE html><html lang="en" class="theme" xmlns="http://www.w3.org/1999/xhtml"><head>'
+            '<link rel="stylesheet" href="print.css?v=1" media="print">'
+            '<style>p { margin: 0; }</style>'
+            '<link rel="stylesheet" href="https://example.com/remote.css">'
+            '<link rel="stylesheet" href="missing.css">'
+            '</head><body class="dark" style="background: #000" data-page="1"><p>本文</p></body></html>'
+        )
+        css, body, attributes = split_html_document(html, base_dir=base_dir)
+
+    assert css == "@media print {\nh1 { font-size: 20pt; }\n}\np { margin: 0; }"
+    assert body == "<p>本文</p>"
+    print("✅ ローカルのスタイルシートを文書順に埋め込み（外部・存在しないものは除外）")
+
+    assert attributes == {"lang": "en", "class": "theme dark", "style": "background: #000", "data-page": "1"}
+    section = wrap_section(body, attributes, "batch-page batch-page-0")
+    assert section == (
+        '<section lang="en" class="batch-page batch-page-0 theme dark" style="background: #000" '
+        'data-page="1"><p>本文</p></section>'
+    )
+    print(f"✅ 属性をsectionに引き継ぐ: {section[:60]}...")
+
+    print("\n" + "=" * 50)
+    print("✨ HTML分割テスト完了！")
+    print("=" * 50)
+
+
+def test_batch_page_sizes():
+    """用紙サイズの異なるテンプレートをまとめても、各ページが自分の @page を使うかのテスト"""
+    print("\n" + "=" * 50)
+    print("バッチの用紙サイズテスト")
+    print("=" * 50)
+
+    templates = {
+        "single/image-text-single": ("<body><h1>{{ title }}</h1></body>", "@page { size: A4; }\nh1 { color: red; }"),
+        "spread/quote-spread": (
+            '<body class="spread"><h1>{{ title }}</h1></body>',
+            "@page { size: A3 landscape; }\nbody.spread h1 { color: blue; }"
+        ),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        templates_dir = Path(tmp) / "templates"
+        for template_id, (body, css) in templates.items():
+            template_dir = templates_dir / template_id
+            template_dir.mkdir(parents=True)
+            (template_dir / "template.html").write_text(
+                f"<html><head><style>{{{{ css_content }}}}</style></head>{body}</html>",
+                encoding="utf-8"
+            )
+            (template_dir / "style.css").write_text(css, encoding="utf-8")
+
+        service = PDFService()
+        service.templates = TemplateRegistry(templates_dir=templates_dir)
+        captured = {}
+
+        async def fake_vivliostyle(html_file, output_dir):
+            captured["html"] = html_file.read_text(encoding="utf-8")
+            output = output_dir / "output.pdf"
+            output.write_bytes(b"%PDF-1.4")
+            return output
+
+        service._generate_pdf_with_vivliostyle = fake_vivliostyle
+        original = (settings.TEMPLATES_DIR, pdf_cache.enabled)
+        settings.TEMPLATES_DIR = templates_dir
+        pdf_cache.enabled = False
+        try:
+            pages = [
+                BatchPage(template_id=template_id, payload=Payload(title=f"ページ{i}", author="著者"))
+                for i, template_id in enumerate(templates)
+            ]
+            pdf_path = asyncio.run(service.generate_batch_pdf(pages))
+            Path(pdf_path).unlink()
+        finally:
+            settings.TEMPLATES_DIR, pdf_cache.enabled = original
+
+    html = captured["html"]
+    assert "@page batch-page-0 { size: A4; }" in html
+    assert "@page batch-page-1 { size: A3 landscape; }" in html
+    assert ".batch-page-0 { page: batch-page-0; }" in html
+    assert ".batch-page-1 { page: batch-page-1; }" in html
+    assert not re.search(r"@page\s*[{:]", html)
+    assert ".batch-page-1.spread h1 { color: blue; }" in html
+    assert '<section class="batch-page batch-page-1 spread">' in html
+    print("✅ 各ページが自分の名前付きページ（A4 / A3横）を使う")
+
+    print("\n" + "=" * 50)
+    print("✨ バッチの用紙サイズテスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # CSSスコープテスト
+        test_scope_css()
+
+        # HTML分割テスト
+        test_split_html_document()
+
+        # バッチの用紙サイズテスト
+        test_batch_page_sizes()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
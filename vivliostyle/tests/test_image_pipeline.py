@@ -0,0 +1,114 @@
+"""
+画像パイプラインの簡易テスト（画像枠への縮小・キャッシュ・メモの上限・並行呼び出し。Pillowが必要）
+"""
+
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from PIL import Image
+
+from app.image_pipeline import ImagePipeline
+
+
+def _noisy_image(size):
+    return Image.merge("RGB", [Image.effect_noise(size, 80) for _ in range(3)])
+
+
+def _pipeline(tmp: Path) -> ImagePipeline:
+    pipeline = ImagePipeline(cache_dir=tmp / "cache", profile="print")
+    pipeline.enabled = True
+    pipeline.cache_dir.mkdir(parents=True, exist_ok=True)
+    return pipeline
+
+
+def test_downscale_and_cache():
+    """画像枠より大きい画像だけを縮小し、2回目はキャッシュを使うかのテスト"""
+    print("=" * 50)
+    print("画像縮小テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        pipeline = _pipeline(tmp)
+        photo = tmp / "large.jpg"
+        _noisy_image((800, 600)).save(photo, quality=95)
+
+        # 20mm x 20mm は 300dpi で 236px 四方
+        assert pipeline.target_pixels((20, 20)) == (236, 236)
+        result = pipeline.process(photo, (20, 20))
+        assert result.parent == pipeline.cache_dir and result.suffix == ".jpg"
+        with Image.open(result) as processed:
+            assert processed.size == (236, 177)
+        assert result.stat().st_size < photo.stat().st_size
+        print("✅ 画像枠に合わせて縮小: 800x600 -> 236x177")
+
+        assert pipeline.process(photo, (20, 20)) == result
+        stats = pipeline.get_stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["bytes_in"] == photo.stat().st_size and stats["bytes_out"] == result.stat().st_size
+        print(f"✅ 同じ画像・枠はキャッシュを使う: {stats}")
+
+    print("\n" + "=" * 50)
+    print("✨ 画像縮小テスト完了！")
+    print("=" * 50)
+
+
+def test_memo_bounds_and_threads():
+    """画像ハッシュ・素通し判定のメモが上限件数で止まり、並行呼び出しでも統計がずれないかのテスト"""
+    print("\n" + "=" * 50)
+    print("メモ上限・並行呼び出しテスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        pipeline = _pipeline(tmp)
+        # 再エンコード後が必ず元より大きくなるよう最高品質にする（すべて素通しになる）
+        pipeline.profile = dict(pipeline.profile, quality=100)
+        pipeline.SOURCE_HASH_MEMO_SIZE = 3
+        pipeline.PASSTHROUGH_MEMO_SIZE = 3
+
+        photos = []
+        for i in range(6):
+            photo = tmp / f"small{i}.jpg"
+            _noisy_image((64, 48)).save(photo, quality=5)
+            photos.append(photo)
+
+        for photo in photos:
+            assert pipeline.process(photo, (100, 100)) == photo
+        assert len(pipeline._source_hashes) == 3 and len(pipeline._passthrough) == 3
+        print("✅ メモは上限件数まで（古いものから捨てる）")
+
+        # メモに残っている画像を複数スレッドから同時に処理する
+        calls = [photo for photo in photos[3:] for _ in range(50)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda p: pipeline.process(p, (100, 100)), calls))
+        assert results == calls
+        stats = pipeline.get_stats()
+        assert stats["hits"] == len(calls) and stats["misses"] == 6 and stats["passthrough"] == 6
+        assert stats["bytes_in"] == stats["bytes_out"] == sum(p.stat().st_size for p in photos)
+        print(f"✅ 並行呼び出しでも統計が一致: {stats}")
+
+    print("\n" + "=" * 50)
+    print("✨ メモ上限・並行呼び出しテスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # 画像縮小テスト
+        test_downscale_and_cache()
+
+        # メモ上限・並行呼び出しテスト
+        test_memo_bounds_and_threads()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
@@ -0,0 +1,82 @@
+"""
+画像ステージングの簡易テスト（ハードリンク・シンボリックリンク・コピーへのフォールバック）
+"""
+
+import errno
+import sys
+import tempfile
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.image_staging import ImageStager, StagingReport
+
+
+class CrossDeviceStager(ImageStager):
+    """ハードリンクが別ファイルシステム扱いで失敗する環境を模擬"""
+
+    def __init__(self, methods):
+        super().__init__(methods)
+        self.attempts = 0
+
+    def _try_method(self, method, source, dest):
+        if method == "hardlink":
+            self.attempts += 1
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return super()._try_method(method, source, dest)
+
+
+def test_stage_methods():
+    """コピーを避けて配置し、使えない方法は以降試さないかのテスト"""
+    print("=" * 50)
+    print("画像ステージングテスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source = tmp / "photo.jpg"
+        source.write_bytes(b"x" * 100)
+        staged = tmp / "staged"
+        staged.mkdir()
+
+        stager = ImageStager(["hardlink", "copy"])
+        report = StagingReport()
+        assert stager.stage(source, staged / "a.jpg", report) == "hardlink"
+        assert (staged / "a.jpg").stat().st_ino == source.stat().st_ino
+        assert report.as_dict() == {"methods": {"hardlink": 1}, "bytes_avoided": 100, "bytes_copied": 0}
+        print("✅ 同じファイルシステムならハードリンク")
+
+        stager = ImageStager(["symlink"])
+        assert stager.stage(source, staged / "b.jpg") == "symlink"
+        assert (staged / "b.jpg").is_symlink() and (staged / "b.jpg").read_bytes() == source.read_bytes()
+        print("✅ 明示した場合はシンボリックリンク")
+
+        # リンクできなければコピーし、同じデバイスの組み合わせでは以降試さない
+        stager = CrossDeviceStager(["hardlink", "copy"])
+        report = StagingReport()
+        assert stager.stage(source, staged / "c.jpg", report) == "copy"
+        assert stager.stage(source, staged / "d.jpg", report) == "copy"
+        assert stager.attempts == 1
+        assert (staged / "d.jpg").read_bytes() == source.read_bytes()
+        assert not (staged / "c.jpg").is_symlink() and (staged / "c.jpg").stat().st_ino != source.stat().st_ino
+        assert report.as_dict() == {"methods": {"copy": 2}, "bytes_avoided": 0, "bytes_copied": 200}
+        assert stager.get_stats()["bytes_copied"] == 200
+        print(f"✅ リンク不可ならコピーにフォールバック: {report}")
+
+    print("\n" + "=" * 50)
+    print("✨ 画像ステージングテスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # 画像ステージングテスト
+        test_stage_methods()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
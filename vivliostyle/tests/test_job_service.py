@@ -0,0 +1,116 @@
+"""
+非同期PDF生成ジョブの簡易テスト（永続化と、再起動時の未完了ジョブの再投入）
+"""
+
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.job_service import JobService
+from app.schemas import Payload
+from app.settings import settings
+
+TEMPLATE_ID = settings.ALLOWED_TEMPLATE_IDS[0]
+
+
+class FakePDFService:
+    """キャッシュなしで、呼ばれるたびに一時ファイルへPDFを書き出す"""
+
+    def __init__(self, tmp: Path):
+        self.tmp = tmp
+        self.calls = []
+
+    async def find_cached_pdf(self, template_id, payload):
+        return None, None
+
+    async def generate_pdf(self, template_id, payload, cache_key=None):
+        self.calls.append(payload.title)
+        path = self.tmp / f"generated{len(self.calls)}.pdf"
+        path.write_bytes(f"%PDF {payload.title}".encode("utf-8"))
+        return str(path)
+
+
+async def wait_finished(service: JobService, job_id: str):
+    for _ in range(200):
+        job = service.get(job_id)
+        if job.status in ("succeeded", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"ジョブが終わりません: {service.get(job_id)}")
+
+
+def test_persistence_and_requeue():
+    """受け付けたジョブがファイルに残り、再起動後に再実行されるかのテスト"""
+    print("=" * 50)
+    print("ジョブ永続化テスト")
+    print("=" * 50)
+
+    async def scenario(tmp):
+        jobs_dir = tmp / "jobs"
+        fake = FakePDFService(tmp)
+
+        # ワーカーなしで受け付けて停止（処理前に落ちた状態）
+        service = JobService(fake, jobs_dir=jobs_dir, workers=0)
+        await service.start()
+        queued = service.submit(TEMPLATE_ID, Payload(title="受付済み", author="著者"))
+        await service.stop()
+        assert (jobs_dir / f"{queued.job_id}.json").exists()
+        print("✅ 受け付けたジョブはファイルに保存")
+
+        # 実行中に落ちたジョブと、再実行の上限に達したジョブを用意する
+        running = service.submit(TEMPLATE_ID, Payload(title="実行中", author="著者"))
+        running.status, running.attempts = "running", 1
+        service._persist(running)
+        exhausted = service.submit(TEMPLATE_ID, Payload(title="上限", author="著者"))
+        exhausted.status, exhausted.attempts = "running", settings.JOB_MAX_ATTEMPTS
+        service._persist(exhausted)
+        (jobs_dir / "broken.json").write_text("{", encoding="utf-8")
+
+        # 再起動すると未完了ジョブを受付順に再投入する（壊れたレコードは読み飛ばす）
+        restarted = JobService(fake, jobs_dir=jobs_dir, workers=1)
+        await restarted.start()
+        try:
+            done = await wait_finished(restarted, queued.job_id)
+            assert done.status == "succeeded" and done.attempts == 1
+            done = await wait_finished(restarted, running.job_id)
+            assert done.status == "succeeded" and done.attempts == 2
+            assert restarted.get_result_path(running.job_id).read_bytes() == "%PDF 実行中".encode("utf-8")
+            failed = await wait_finished(restarted, exhausted.job_id)
+            assert failed.status == "failed" and "上限" in failed.error
+            assert fake.calls == ["受付済み", "実行中"]
+            print(f"✅ 再起動後に未完了ジョブを再実行: {fake.calls}")
+        finally:
+            await restarted.stop()
+
+        # 終了状態もファイルから読み戻せる
+        reloaded = JobService(fake, jobs_dir=jobs_dir, workers=0)
+        await reloaded.start()
+        await reloaded.stop()
+        assert reloaded.get(running.job_id).status == "succeeded"
+        assert reloaded.get(exhausted.job_id).status == "failed"
+        assert reloaded.get_result_path(running.job_id) is not None
+        print("✅ 完了・失敗の状態も再起動後に参照できる")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(Path(tmp)))
+
+    print("\n" + "=" * 50)
+    print("✨ ジョブ永続化テスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # ジョブ永続化テスト
+        test_persistence_and_requeue()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
@@ -0,0 +1,133 @@
+"""
+PDFキャッシュの簡易テスト（キャッシュキーと容量超過時の削除）
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.pdf_cache import PDFCache
+from app.schemas import Payload
+from app.template_registry import template_registry
+
+TEMPLATE_ID = "single/image-text-single"
+
+
+def test_cache_key():
+    """内容・画像・テンプレートが同じときだけ同じキーになるかのテスト"""
+    print("=" * 50)
+    print("キャッシュキーテスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cache = PDFCache(cache_dir=tmp / "cache", max_bytes=1024 * 1024)
+        image = tmp / "photo.jpg"
+        image.write_bytes(b"image-v1")
+        payload = Payload(title="タイトル", author="著者", paragraphs=["本文"])
+
+        key = cache.compute_key(TEMPLATE_ID, payload, [image])
+        assert key == cache.compute_key(TEMPLATE_ID, Payload(**payload.model_dump()), [image])
+        print(f"✅ 同じ内容なら同じキー: {key[:12]}")
+
+        assert key != cache.compute_key(TEMPLATE_ID, payload.model_copy(update={"title": "別"}), [image])
+        assert key != cache.compute_key("single/minimal-single", payload, [image])
+        assert key != cache.compute_key(TEMPLATE_ID, payload, [None])
+        print("✅ ペイロード・テンプレートID・画像の有無でキーが変わる")
+
+        # 画像の中身が変わればキーも変わる（更新時刻・サイズでメモを引き直す）
+        image.write_bytes(b"image-v2-longer")
+        assert key != cache.compute_key(TEMPLATE_ID, payload, [image])
+        print("✅ 画像の更新でキーが変わる")
+
+        # テンプレートファイルの更新でキーが変わる
+        original_dir = template_registry.templates_dir
+        template_registry.templates_dir = tmp / "templates"
+        try:
+            template_dir = template_registry.templates_dir / TEMPLATE_ID
+            template_dir.mkdir(parents=True)
+            style = template_dir / "style.css"
+            style.write_text("p { color: red; }", encoding="utf-8")
+            before = cache.compute_key(TEMPLATE_ID, payload, [image])
+            os.utime(style, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+            assert before != cache.compute_key(TEMPLATE_ID, payload, [image])
+        finally:
+            template_registry.templates_dir = original_dir
+        print("✅ テンプレートの更新でキーが変わる")
+
+        # 画像ハッシュのメモは上限件数まで
+        cache.IMAGE_HASH_MEMO_SIZE = 2
+        for i in range(4):
+            other = tmp / f"other{i}.jpg"
+            other.write_bytes(bytes([i]) * 8)
+            cache.compute_key(TEMPLATE_ID, payload, [other])
+        assert len(cache._image_hashes) == 2
+        print("✅ 画像ハッシュのメモは上限件数まで")
+
+    print("\n" + "=" * 50)
+    print("✨ キャッシュキーテスト完了！")
+    print("=" * 50)
+
+
+def test_eviction():
+    """合計サイズが上限を超えたら最も長く使われていないPDFから削除されるかのテスト"""
+    print("\n" + "=" * 50)
+    print("キャッシュ削除テスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cache = PDFCache(cache_dir=tmp / "cache", max_bytes=250)
+        pdf = tmp / "output.pdf"
+        pdf.write_bytes(b"x" * 100)
+
+        cache.put("a", pdf)
+        cache.put("b", pdf)
+        assert cache.get("a") is not None  # a を最近使ったことにする
+        cache.put("c", pdf)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+        assert not (tmp / "cache" / "b.pdf").exists()
+        stats = cache.get_stats()
+        assert stats["entries"] == 2 and stats["total_bytes"] == 200 and stats["evictions"] == 1
+        print(f"✅ 最も長く使われていないものから削除: {stats}")
+
+        # 上限より大きいPDFも直近の1件は残す
+        pdf.write_bytes(b"x" * 300)
+        cache.put("d", pdf)
+        assert cache.get("d") is not None
+        assert cache.get_stats()["entries"] == 1
+        print("✅ 上限を超える1件は残す")
+
+        # 再起動しても既存のキャッシュを読み込む
+        reloaded = PDFCache(cache_dir=tmp / "cache", max_bytes=250)
+        assert reloaded.get("d") is not None
+        assert reloaded.get_stats()["total_bytes"] == 300
+        assert reloaded.is_cached_path(reloaded.get("d"))
+        assert not reloaded.is_cached_path(pdf)
+        print("✅ 再起動後も読み込む")
+
+    print("\n" + "=" * 50)
+    print("✨ キャッシュ削除テスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # キャッシュキーテスト
+        test_cache_key()
+
+        # キャッシュ削除テスト
+        test_eviction()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
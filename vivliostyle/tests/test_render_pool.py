@@ -0,0 +1,110 @@
+"""
+レンダリングワーカープールの簡易テスト（件数による入れ替えと、タイムアウト時の再起動）
+
+render-worker.js の代わりに、同じプロトコルを話す最小のNodeスクリプトを起動する
+"""
+
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.render_pool import RenderPool
+from app.settings import settings
+
+# "hang" を含む入力には応答しない偽ワーカー（ready に pid を載せて入れ替えを確認する）
+FAKE_WORKER = """
+const fs = require('fs');
+const readline = require('readline');
+const send = (message) => process.stdout.write(JSON.stringify(message) + '\\n');
+readline.createInterface({ input: process.stdin }).on('line', (line) => {
+  const job = JSON.parse(line);
+  if (job.type === 'ping') {
+    send({ id: job.id, ok: true });
+  } else if (!job.input.includes('hang')) {
+    fs.writeFileSync(job.output, `%PDF ${process.pid}`);
+    send({ id: job.id, ok: true });
+  }
+});
+send({ type: 'ready', renderer: 'browser' });
+"""
+
+
+def test_recycle_and_timeout():
+    """上限件数で入れ替わり、タイムアウトしたワーカーは破棄・再起動されるかのテスト"""
+    print("=" * 50)
+    print("ワーカープールテスト")
+    print("=" * 50)
+
+    async def scenario(tmp):
+        pool = RenderPool(size=1, max_jobs_per_worker=2)
+        await pool.start()
+        assert pool.is_running
+        html = tmp / "page.html"
+        html.write_text("<p>本文</p>", encoding="utf-8")
+
+        try:
+            pids = []
+            for i in range(3):
+                output = tmp / f"out{i}.pdf"
+                await pool.render(html, output, {"timeout": 5})
+                pids.append(output.read_text())
+                # 入れ替えはバックグラウンドで行われるので、プールに戻るまで待つ
+                for _ in range(100):
+                    if pool.get_stats()["idle"] == 1:
+                        break
+                    await asyncio.sleep(0.05)
+            assert pids[0] == pids[1] != pids[2]
+            assert pool.get_stats()["recycled"] == 1
+            print(f"✅ 2件処理したワーカーを入れ替え: {pids}")
+
+            # 応答しないジョブはタイムアウトし、プロセスを破棄する
+            hang = tmp / "hang.html"
+            hang.write_text("<p>応答なし</p>", encoding="utf-8")
+            try:
+                await pool.render(hang, tmp / "hang.pdf", {"timeout": 0.5})
+                assert False, "タイムアウトするはず"
+            except RuntimeError as e:
+                assert "タイムアウト" in str(e)
+            assert pool.get_stats()["failures"] == 1
+
+            # 次の取得時に停止したワーカーを再起動して処理を続ける
+            output = tmp / "after.pdf"
+            await pool.render(html, output, {"timeout": 5})
+            assert output.read_text() != pids[2]
+            stats = pool.get_stats()
+            assert stats["restarted"] == 1 and stats["jobs"] == 4
+            print(f"✅ タイムアウトしたワーカーを再起動: {stats}")
+        finally:
+            await pool.stop()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        script = tmp / "fake-worker.js"
+        script.write_text(FAKE_WORKER, encoding="utf-8")
+        original = settings.RENDER_WORKER_SCRIPT
+        settings.RENDER_WORKER_SCRIPT = script
+        try:
+            asyncio.run(scenario(tmp))
+        finally:
+            settings.RENDER_WORKER_SCRIPT = original
+
+    print("\n" + "=" * 50)
+    print("✨ ワーカープールテスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # ワーカープールテスト
+        test_recycle_and_timeout()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
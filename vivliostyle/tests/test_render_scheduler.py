@@ -0,0 +1,148 @@
+"""
+レンダリングスケジューラの簡易テスト（受付・拒否・優先度と、APIの429/503応答）
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi.testclient import TestClient
+
+from app.render_scheduler import RenderScheduler, SchedulerRejected
+from app.settings import settings
+
+
+def test_admission():
+    """実行枠・待ち行列の上限と、拒否時のステータス・Retry-Afterのテスト"""
+    print("=" * 50)
+    print("受付制御テスト")
+    print("=" * 50)
+
+    async def scenario():
+        scheduler = RenderScheduler(max_in_flight=1, max_queue=2)
+        scheduler.avg_duration = 2.0
+        await scheduler.acquire("single/image-text-single")
+        assert scheduler.in_flight == 1
+
+        # 空きがなければ優先度順に待つ（見開きより片面ページが先）
+        order = []
+
+        async def wait(template_id):
+            await scheduler.acquire(template_id)
+            order.append(template_id)
+
+        spread = asyncio.ensure_future(wait("spread/quote-spread"))
+        await asyncio.sleep(0)
+        single = asyncio.ensure_future(wait("single/text-only-single"))
+        await asyncio.sleep(0)
+        assert scheduler.get_stats()["queued"] == 2
+
+        # 待ち行列が満杯なら429（Retry-Afterは推定待ち時間の切り上げ）
+        try:
+            await scheduler.acquire("title/title-page")
+            assert False, "429になるはず"
+        except SchedulerRejected as e:
+            assert e.status_code == 429
+            assert e.retry_after == 6  # (待ち2件 + 1) * 2秒 / 同時実行1
+        print("✅ 待ち行列が満杯なら429")
+
+        scheduler.release(1.0)
+        await asyncio.wait_for(single, timeout=1)
+        assert order == ["single/text-only-single"] and not spread.done()
+        scheduler.release(1.0)
+        await asyncio.gather(spread, single)
+        assert order == ["single/text-only-single", "spread/quote-spread"]
+        scheduler.release(1.0)
+        assert scheduler.in_flight == 0
+        print(f"✅ 優先度順に実行枠を渡す: {order}")
+
+        # 推定待ち時間が上限を超える場合は503
+        await scheduler.acquire("single/image-text-single")
+        original_max_wait = settings.RENDER_QUEUE_MAX_WAIT
+        settings.RENDER_QUEUE_MAX_WAIT = 1
+        try:
+            await scheduler.acquire("single/image-text-single")
+            assert False, "503になるはず"
+        except SchedulerRejected as e:
+            assert e.status_code == 503 and e.retry_after >= 1
+        finally:
+            settings.RENDER_QUEUE_MAX_WAIT = original_max_wait
+        print("✅ 推定待ち時間が上限を超えたら503")
+
+        # 停止時は待機中のリクエストも新規のリクエストも503
+        waiting = asyncio.ensure_future(scheduler.acquire("single/image-text-single"))
+        await asyncio.sleep(0)
+        scheduler.close()
+        for pending in (waiting, scheduler.acquire("single/image-text-single")):
+            try:
+                await pending
+                assert False, "503になるはず"
+            except SchedulerRejected as e:
+                assert e.status_code == 503
+        stats = scheduler.get_stats()
+        assert stats["rejected_429"] == 1 and stats["rejected_503"] == 3
+        print(f"✅ 停止時は503: {stats}")
+
+    asyncio.run(scenario())
+
+    print("\n" + "=" * 50)
+    print("✨ 受付制御テスト完了！")
+    print("=" * 50)
+
+
+def test_http_rejection():
+    """スケジューラの拒否が /generate の429・503とRetry-Afterヘッダーになるかのテスト"""
+    print("\n" + "=" * 50)
+    print("APIの拒否応答テスト")
+    print("=" * 50)
+
+    from app import main
+    from app.pdf_cache import pdf_cache
+
+    scheduler = main.render_scheduler
+    original = (scheduler.max_queue, scheduler.in_flight, scheduler._closed, pdf_cache.enabled)
+    pdf_cache.enabled = False
+    client = TestClient(main.app)
+    body = {
+        "template_id": "single/image-text-single",
+        "payload": {"title": "テスト", "author": "著者"}
+    }
+    try:
+        # 実行枠が埋まっていて待ち行列も持たない状態
+        scheduler.in_flight = scheduler.max_in_flight
+        scheduler.max_queue = 0
+        response = client.post("/generate", json=body)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        print(f"✅ 429: Retry-After={response.headers['Retry-After']}")
+
+        scheduler._closed = True
+        response = client.post("/generate", json=body)
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+        print(f"✅ 503: Retry-After={response.headers['Retry-After']}")
+    finally:
+        scheduler.max_queue, scheduler.in_flight, scheduler._closed, pdf_cache.enabled = original
+
+    print("\n" + "=" * 50)
+    print("✨ APIの拒否応答テスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # 受付制御テスト
+        test_admission()
+
+        # APIの拒否応答テスト
+        test_http_rejection()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")
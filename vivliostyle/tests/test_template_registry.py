@@ -0,0 +1,94 @@
+"""
+テンプレートレジストリの簡易テスト（事前読み込み・キャッシュヒット・更新検知）
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.settings import settings
+from app.template_registry import TemplateRegistry
+
+
+def touch_later(path: Path) -> None:
+    """更新時刻を確実に進める（ファイルシステムの時刻の粒度に依存しないように）"""
+    later = time.time_ns() + 10 ** 9
+    os.utime(path, ns=(later, later))
+
+
+def test_preload_and_reload():
+    """許可テンプレートを事前に読み込み、ファイル変更時だけ再読み込みするかのテスト"""
+    print("=" * 50)
+    print("テンプレートレジストリテスト")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        templates_dir = Path(tmp)
+        template_id, missing_id = settings.ALLOWED_TEMPLATE_IDS[:2]
+        template_dir = templates_dir / template_id
+        template_dir.mkdir(parents=True)
+        (template_dir / "template.html").write_text(
+            "<style>{{ css_content }}</style><h1>{{ title }}</h1>",
+            encoding="utf-8"
+        )
+        style = template_dir / "style.css"
+        style.write_text("h1 { color: red; }", encoding="utf-8")
+
+        registry = TemplateRegistry(templates_dir=templates_dir, watch_interval=0)
+        assert registry.preload() == 1
+        assert registry.get_stats()["loaded"] == 1
+        print(f"✅ 存在するテンプレートだけ事前読み込み（{missing_id} は読み込めず）")
+
+        entry = registry.get(template_id)
+        assert registry.get(template_id) is entry
+        assert registry.stats == {"hits": 2, "misses": 0, "reloads": 0}
+        html = entry.template.render(title="<見出し>", css_content=entry.css_content)
+        assert html == "<style>h1 { color: red; }</style><h1>&lt;見出し&gt;</h1>"
+        print("✅ コンパイル済みテンプレートを再利用（自動エスケープあり）")
+
+        # 変更がなければ何もしない
+        assert registry.check_for_changes() == []
+
+        # CSSの更新を検知して読み込み直し、フィンガープリントも変わる
+        before = registry.get_fingerprint(template_id)
+        style.write_text("h1 { color: blue; }", encoding="utf-8")
+        touch_later(style)
+        assert registry.check_for_changes() == [template_id]
+        assert registry.get(template_id).css_content == "h1 { color: blue; }"
+        assert registry.get_fingerprint(template_id) != before
+        print("✅ 更新されたテンプレートを再読み込み")
+
+        # 読み込めない状態になったら破棄し、次の取得でエラーになる
+        (template_dir / "template.html").unlink()
+        touch_later(style)
+        assert registry.check_for_changes() == [template_id]
+        assert registry.get_stats()["loaded"] == 0
+        try:
+            registry.get(template_id)
+            assert False, "ValueErrorになるはず"
+        except ValueError:
+            pass
+        assert registry.stats["reloads"] == 2
+        print(f"✅ 読み込めないテンプレートは破棄: {registry.get_stats()}")
+
+    print("\n" + "=" * 50)
+    print("✨ テンプレートレジストリテスト完了！")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    try:
+        # テンプレートレジストリテスト
+        test_preload_and_reload()
+
+        print("\n" + "=" * 50)
+        print("🎉 すべてのテスト完了！")
+        print("=" * 50)
+
+    except Exception as e:
+        print(f"\n❌ テストエラー: {e}")